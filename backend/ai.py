@@ -1,24 +1,39 @@
 import os
 import json
+import asyncio
+import logging
 import re
 import random
-from typing import Dict, Any, Optional, List, Tuple
-from threading import Semaphore
+import time
+from threading import Lock
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from dotenv import load_dotenv
-import requests
-from time import sleep
+from sqlalchemy.orm import selectinload
+
+from fanout import fan_out
+import llm_cache
+import llm_providers
+import llm_scheduler
+import metrics
+import numeric_variants
+import task_stream
+import zai_http
+
+logger = logging.getLogger(__name__)
 
 try:
     from database import SessionLocal
     from models import Question, Option, Test
+    import repository
     DB_AVAILABLE = True
 except Exception as e:
-    print(f"Warning: Database not available ({e}). Using fallback sample data.")
+    logger.warning("Database not available (%s). Using fallback sample data.", e)
     DB_AVAILABLE = False
     SessionLocal = None
     Question = None
     Option = None
     Test = None
+    repository = None
 
 try:
     from zai import ZaiClient
@@ -29,21 +44,53 @@ load_dotenv()
 ZAI_API_KEY = os.getenv("ZAI_API_KEY")
 ZAI_MODEL = os.getenv("ZAI_MODEL", "glm-4.5-flash")
 _zai_client = ZaiClient(api_key=ZAI_API_KEY) if (ZaiClient and ZAI_API_KEY) else None
-_zai_semaphore = Semaphore(2)
+LLM_PROMPT_SEED = os.getenv("LLM_PROMPT_SEED") or None
+
+def _zai_complete(messages: List[Dict[str, str]], temperature: float, max_tokens: int, thinking_enabled: bool, call_type: str) -> Optional[str]:
+    if _zai_client:
+        return _zai_sdk_chat(messages, temperature=temperature, max_tokens=max_tokens, thinking_enabled=thinking_enabled, call_type=call_type)
+    return _zai_http_request(messages, temperature=temperature, max_tokens=max_tokens, thinking_enabled=thinking_enabled, call_type=call_type)
+
+async def _zai_complete_async(messages: List[Dict[str, str]], temperature: float, max_tokens: int, thinking_enabled: bool, call_type: str) -> Optional[str]:
+    if _zai_client:
+        return await asyncio.to_thread(_zai_sdk_chat, messages, temperature, max_tokens, thinking_enabled, call_type)
+    return await _zai_http_request_async(messages, temperature=temperature, max_tokens=max_tokens, thinking_enabled=thinking_enabled, call_type=call_type)
 
-def _zai_chat(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True) -> Optional[str]:
+def _zai_request(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
+    return llm_cache.cached_call(
+        call_type, ZAI_MODEL, messages, temperature,
+        lambda: _provider.complete(messages, temperature, max_tokens, thinking_enabled, call_type)
+    )
+
+def _zai_chat(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
+    return _zai_request(messages, temperature=temperature, max_tokens=max_tokens, thinking_enabled=thinking_enabled, call_type=call_type)
+
+async def _zai_request_stream(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> AsyncIterator[str]:
+    async for chunk in llm_cache.cached_stream_async(
+        call_type, ZAI_MODEL, messages, temperature,
+        lambda: _provider.stream_async(messages, temperature, max_tokens, thinking_enabled, call_type)
+    ):
+        yield chunk
+
+async def _zai_request_async(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
+    return await llm_cache.cached_call_async(
+        call_type, ZAI_MODEL, messages, temperature,
+        lambda: _provider.complete_async(messages, temperature, max_tokens, thinking_enabled, call_type)
+    )
+
+def _zai_sdk_chat(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
     if not _zai_client:
-        print("DEBUG: ZAI client not configured")
+        logger.debug("ZAI client not configured")
         return None
+    started = time.perf_counter()
     try:
-        _zai_semaphore.acquire()
-        response = _zai_client.chat.completions.create(
+        response = llm_scheduler.run(lambda: _zai_client.chat.completions.create(
             model=ZAI_MODEL,
             messages=messages,
             thinking={"type": "enabled"} if thinking_enabled else {"type": "disabled"},
             max_tokens=max_tokens,
             temperature=temperature,
-        )
+        ), call_type)
         choices = getattr(response, "choices", None)
         if isinstance(choices, list) and choices:
             first = choices[0]
@@ -57,29 +104,17 @@ def _zai_chat(messages: List[Dict[str, str]], temperature: float = 0.1, max_toke
                 content = getattr(message, "content", None) if message is not None else None
             if isinstance(content, str):
                 return content
+        metrics.llm_failed(call_type)
         return None
     except Exception as e:
-        print(f"DEBUG: ZAI request error: {e}")
+        logger.warning("ZAI request error: %s", e)
+        metrics.llm_failed(call_type, e)
         return None
     finally:
-        try:
-            _zai_semaphore.release()
-        except Exception:
-            pass
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, call_type=call_type)
 
-def _zai_request(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True) -> Optional[str]:
-    if _zai_client:
-        return _zai_chat(messages, temperature=temperature, max_tokens=max_tokens, thinking_enabled=thinking_enabled)
-    api_key = ZAI_API_KEY
-    if not api_key:
-        print("DEBUG: No ZAI API key available for HTTP fallback")
-        return None
-    url = "https://api.z.ai/api/paas/v4/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
+def _zai_http_payload(messages: List[Dict[str, str]], temperature: float, max_tokens: int, thinking_enabled: bool) -> Dict[str, Any]:
+    return {
         "model": ZAI_MODEL,
         "thinking": {"type": "enabled"} if thinking_enabled else {"type": "disabled"},
         "messages": messages,
@@ -87,24 +122,101 @@ def _zai_request(messages: List[Dict[str, str]], temperature: float = 0.1, max_t
         "max_tokens": max_tokens,
         "stream": False
     }
+
+def _zai_http_content(data: Dict[str, Any]) -> Optional[str]:
+    choices = data.get("choices") or []
+    if isinstance(choices, list) and choices:
+        first = choices[0]
+        message = first.get("message") if isinstance(first, dict) else None
+        if isinstance(message, dict):
+            content = message.get("content")
+        else:
+            content = first.get("text") or data.get("text")
+        if isinstance(content, str):
+            return content
+    return None
+
+def _zai_http_request(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
+    api_key = ZAI_API_KEY
+    if not api_key:
+        logger.debug("No ZAI API key available for HTTP fallback")
+        return None
+    payload = _zai_http_payload(messages, temperature, max_tokens, thinking_enabled)
+    started = time.perf_counter()
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        choices = data.get("choices") or []
-        if isinstance(choices, list) and choices:
-            first = choices[0]
-            message = first.get("message") if isinstance(first, dict) else None
-            if isinstance(message, dict):
-                content = message.get("content")
-            else:
-                content = first.get("text") or data.get("text")
-            if isinstance(content, str):
-                return content
+        data = llm_scheduler.run(lambda: zai_http.post_chat_sync(payload, api_key), call_type)
+        content = _zai_http_content(data)
+        if content is None:
+            metrics.llm_failed(call_type)
+        return content
+    except Exception as e:
+        logger.warning("HTTP ZAI request error: %s", e)
+        metrics.llm_failed(call_type, e)
+        return None
+    finally:
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, call_type=call_type)
+
+async def _zai_http_request_async(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> Optional[str]:
+    api_key = ZAI_API_KEY
+    if not api_key:
+        logger.debug("No ZAI API key available for HTTP fallback")
         return None
+    payload = _zai_http_payload(messages, temperature, max_tokens, thinking_enabled)
+    started = time.perf_counter()
+    try:
+        data = await llm_scheduler.run_async(lambda: zai_http.post_chat(payload, api_key), call_type)
+        content = _zai_http_content(data)
+        if content is None:
+            metrics.llm_failed(call_type)
+        return content
     except Exception as e:
-        print(f"DEBUG: HTTP ZAI request error: {e}")
+        logger.warning("HTTP ZAI request error: %s", e)
+        metrics.llm_failed(call_type, e)
         return None
+    finally:
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, call_type=call_type)
+
+def _zai_http_delta(data: Dict[str, Any]) -> Optional[str]:
+    choices = data.get("choices") or []
+    if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+        delta = choices[0].get("delta")
+        if isinstance(delta, dict) and isinstance(delta.get("content"), str):
+            return delta["content"]
+    return None
+
+async def _zai_http_stream_async(messages: List[Dict[str, str]], temperature: float = 0.1, max_tokens: int = 512, thinking_enabled: bool = True, call_type: str = "default") -> AsyncIterator[str]:
+    api_key = ZAI_API_KEY
+    if not api_key:
+        logger.debug("No ZAI API key available for HTTP streaming")
+        return
+    payload = _zai_http_payload(messages, temperature, max_tokens, thinking_enabled)
+    started = time.perf_counter()
+    first_token = True
+    try:
+        async for data in llm_scheduler.stream_async(lambda: zai_http.stream_chat(payload, api_key), call_type):
+            content = _zai_http_delta(data)
+            if not content:
+                continue
+            if first_token:
+                metrics.LLM_FIRST_TOKEN.observe(time.perf_counter() - started, call_type=call_type)
+                first_token = False
+            yield content
+        if first_token:
+            metrics.llm_failed(call_type)
+    except Exception as e:
+        # Re-raised so callers that keep the text (recording, the LLM cache)
+        # never persist a truncated completion.
+        logger.warning("HTTP ZAI stream error: %s", e)
+        metrics.llm_failed(call_type, e)
+        raise
+    finally:
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, call_type=call_type)
+
+_provider = llm_providers.build_provider(
+    llm_providers.LLM_PROVIDER,
+    llm_providers.ZaiProvider(_zai_complete, _zai_complete_async, _zai_http_stream_async),
+    model=ZAI_MODEL,
+)
 
 def _format_options_for_prompt(options: List) -> str:
     lines = []
@@ -114,26 +226,113 @@ def _format_options_for_prompt(options: List) -> str:
 
 def save_generated_question(session, test_id: int, question_text: str, options: List[Dict[str, str]], topic: str) -> Optional[int]:
     try:
-        new_question = Question(text=question_text, test_id=test_id, topic=topic)
-        session.add(new_question)
-        session.flush()
-        
-        for option_data in options:
-            new_option = Option(text=option_data['text'], is_correct=option_data.get('is_correct', False), question_id=new_question.id)
-            session.add(new_option)
-        
+        question_ids = repository.append_questions(session, test_id, [{"text": question_text, "topic": topic, "options": options}])
         session.commit()
-        return new_question.id
+        return question_ids[0] if question_ids else None
     except Exception as e:
         session.rollback()
-        print(f"Error saving generated question: {e}")
+        logger.error("Error saving generated question: %s", e)
         return None
 
-def create_test_variation(source_test_id: int, new_test_title: Optional[str] = None, user_id: Optional[int] = None, session=None) -> Optional[int]:
+def _topic_messages(question_text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "Ти експерт по математиці. Відповідай лише назвою теми."},
+        {"role": "user", "content": f"Визнач **МАКСИМАЛЬНО КОНКРЕТНУ** тему з математики для наступного питання. Поверни **ЛИШЕ ОДНЕ СЛОВО** – назву цієї теми, без лапок, пояснень чи інших символів і відповідь на Українскій мові.\n\n\n\nПитання: {question_text}"}
+    ]
+
+class _PromptNonces:
+    """The task prompt carries a number for variety. With a seed (record and
+    replay runs) it is derived from the seed, the question and how many times
+    that question was asked before, so a replay run builds byte-identical
+    prompts to the run it recorded, however fan_out orders the calls. Without
+    one it is plain random and nothing is remembered."""
+
+    def __init__(self, seed: Optional[str]):
+        self.seed = seed
+        self._asked: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def next(self, question_text: str) -> int:
+        if self.seed is None:
+            return random.randint(1000, 9999)
+        with self._lock:
+            asked = self._asked.get(question_text, 0)
+            self._asked[question_text] = asked + 1
+        return random.Random(f"{self.seed}:{asked}:{question_text}").randint(1000, 9999)
+
+
+def _prompt_seed() -> Optional[str]:
+    if LLM_PROMPT_SEED:
+        return LLM_PROMPT_SEED
+    if llm_providers.LLM_PROVIDER in ("record", "replay"):
+        return "0"
+    return None
+
+_prompt_nonces = _PromptNonces(_prompt_seed())
+
+def _task_messages(topic_text: str, question_text: str, options_for_prompt: str, correct_text: Optional[str]) -> List[Dict[str, str]]:
+    prompt = f"""
+Ти — експерт зі створення навчальних матеріалів з математики.
+Твоє завдання: створити нове тестове завдання, яке є математично аналогічним (ізоморфним) до наданого зразка.
+Випадкове число для різноманітності: {_prompt_nonces.next(question_text)}
+Вхідні дані:
+- Тема: "{topic_text}"
+- Зразок питання: {question_text}
+- Зразок варіантів:
+{options_for_prompt if options_for_prompt else 'Варіанти відсутні'}
+- Зразок правильної відповіді: {correct_text if correct_text else 'Правильна відповідь відсутня'}
+Інструкції:
+1. Тема та Концепція: Нове питання має СТРОГО відповідати темі "{topic_text}" та перевіряти ТУ ЖЕ математичну навичку.
+2. Складність: СТРОГО ДОТРИМУЙ рівень складності оригіналу. Якщо оригіналь простий - генеруй простий. Не роби складнішим!
+3. Числовий діапазон: Використовуй числа ПОДІБНОГО розміру до оригіналу. Якщо там однозначні числа - генеруй однозначні.
+4. Зміни: Змінюй тільки конкретні числа та wording, але ЗБЕРІГАЙ структуру та складність.
+5. Варіанти відповідей:
+    - Згенеруй 4 варіанти відповіді (марковані як a, b, c, d).
+    - Тільки один варіант правильний.
+    - Позиція правильної відповіді ВИПАДКОВА (a, b, c або d).
+    - Неправильні варіанти мають бути реалістичними помилками.
+Формат виводу:
+ПИТАННЯ: [Текст нового питання]
+a) [Варіант A]
+b) [Варіант B]
+c) [Варіант C]
+d) [Варіант D]
+ПРАВИЛЬНА: [Тільки буква]
+"""
+    return [
+        {"role": "system", "content": "Ти експерт зі створення навчальних матеріалів з математики."},
+        {"role": "user", "content": prompt}
+    ]
+
+def variation_item(source_question) -> Dict[str, Any]:
+    options_list = source_question.options
+    correct_option = next((o for o in options_list if o.is_correct), None)
+    return {
+        "text": source_question.text,
+        "topic": source_question.topic,
+        "options_for_prompt": _format_options_for_prompt(options_list),
+        "correct_text": correct_option.text if correct_option else None,
+        "options": [{"text": o.text, "is_correct": o.is_correct} for o in options_list],
+    }
+
+def generate_variation_item(item: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    local = numeric_variants.make_variant(item["text"], item.get("options", []))
+    if local:
+        return item.get("topic") or identify_math_topic(item["text"]), {"question": local[0], "options": local[1]}
+    topic = _zai_request(_topic_messages(item["text"]), temperature=0.1, max_tokens=200, thinking_enabled=False, call_type="topic")
+    topic_text = topic.strip() if isinstance(topic, str) else (item.get("topic") or "Математика")
+    task_output = _zai_request(
+        _task_messages(topic_text, item["text"], item["options_for_prompt"], item.get("correct_text")),
+        temperature=0.7, max_tokens=800, thinking_enabled=False, call_type="task"
+    )
+    parsed = _parse_task_output(task_output) if task_output else None
+    return topic_text, parsed
+
+def create_test_variation(source_test_id: int, new_test_title: Optional[str] = None, user_id: Optional[int] = None, session=None, width: Optional[int] = None) -> Optional[int]:
     close_session = False
     try:
         if not DB_AVAILABLE:
-            print("Database not available")
+            logger.error("Database not available")
             return None
         
         if session is None:
@@ -144,7 +343,7 @@ def create_test_variation(source_test_id: int, new_test_title: Optional[str] = N
         source_test = session.get(Test, source_test_id)
         
         if not source_test:
-            print(f"Test with ID {source_test_id} not found")
+            logger.warning("Test with ID %s not found", source_test_id)
             return None
         
         new_test = Test(
@@ -158,73 +357,36 @@ def create_test_variation(source_test_id: int, new_test_title: Optional[str] = N
         session.add(new_test)
         session.flush()
         
-        source_questions = session.query(Question).filter(Question.test_id == source_test_id).all()
+        source_questions = (
+            session.query(Question)
+            .options(selectinload(Question.options))
+            .filter(Question.test_id == source_test_id)
+            .order_by(Question.id)
+            .all()
+        )
         
-        for source_question in source_questions:
-            options_list = session.query(Option).filter(Option.question_id == source_question.id).order_by(Option.id).all()
-            
-            payload_messages_topic = [
-                {"role": "system", "content": "Ти експерт по математиці. Відповідай лише назвою теми."},
-                {"role": "user", "content": f"Визнач **МАКСИМАЛЬНО КОНКРЕТНУ** тему з математики для наступного питання. Поверни **ЛИШЕ ОДНЕ СЛОВО** – назву цієї теми, без лапок, пояснень чи інших символів і відповідь на Українскій мові.\n\n\n\nПитання: {source_question.text}"}
-            ]
-            
-            topic = _zai_request(payload_messages_topic, temperature=0.1, max_tokens=200, thinking_enabled=False)
-            topic_text = topic.strip() if isinstance(topic, str) else (source_question.topic or "Математика")
-            
-            options_for_prompt = _format_options_for_prompt(options_list)
-            correct_option = next(({"text": o.text, "is_correct": o.is_correct} for o in options_list if o.is_correct), None)
-            
-            prompt = f"""
-Ти — експерт зі створення навчальних матеріалів з математики.
-Твоє завдання: створити нове тестове завдання, яке є математично аналогічним (ізоморфним) до наданого зразка.
-Випадкове число для різноманітності: {random.randint(1000, 9999)}
-Вхідні дані:
-- Тема: "{topic_text}"
-- Зразок питання: {source_question.text}
-- Зразок варіантів:
-{options_for_prompt}
-- Зразок правильної відповіді: {correct_option['text'] if correct_option else 'Правильна відповідь відсутня'}
-Інструкції:
-1. Тема та Концепція: Нове питання має СТРОГО відповідати темі "{topic_text}" та перевіряти ТУ ЖЕ математичну навичку.
-2. Складність: СТРОГО ДОТРИМУЙ рівень складності оригіналу. Якщо оригіналь простий - генеруй простий. Не роби складнішим!
-3. Числовий діапазон: Використовуй числа ПОДІБНОГО розміру до оригіналу. Якщо там однозначні числа - генеруй однозначні.
-4. Зміни: Змінюй тільки конкретні числа та wording, але ЗБЕРІГАЙ структуру та складність.
-5. Варіанти відповідей:
-    - Згенеруй 4 варіанти відповіді (марковані як a, b, c, d).
-    - Тільки один варіант правильний.
-    - Позиція правильної відповіді ВИПАДКОВА (a, b, c або d).
-    - Неправильні варіанти мають бути реалістичними помилками.
-Формат виводу:
-ПИТАННЯ: [Текст нового питання]
-a) [Варіант A]
-b) [Варіант B]
-c) [Варіант C]
-d) [Варіант D]
-ПРАВИЛЬНА: [Тільки буква]
-"""
-            
-            payload_messages_task = [
-                {"role": "system", "content": "Ти експерт зі створення навчальних матеріалів з математики."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            task_output = _zai_request(payload_messages_task, temperature=0.7, max_tokens=800, thinking_enabled=False)
-            
-            if task_output:
-                parsed = _parse_task_output(task_output)
-                if parsed:
-                    save_generated_question(session, new_test.id, parsed['question'], parsed['options'], topic_text)
-                    print(f"Generated question: {parsed['question'][:50]}...")
-            
-            sleep(1)
+        items = [variation_item(source_question) for source_question in source_questions]
+        
+        results = fan_out(generate_variation_item, items, width=width, label=f"variation-{source_test_id}")
+        
+        generated = []
+        for result in results:
+            if not result.ok:
+                logger.warning("Failed to generate variation for question #%s: %s", result.index + 1, result.error)
+                continue
+            topic_text, parsed = result.value
+            if parsed:
+                generated.append({"text": parsed['question'], "topic": topic_text, "options": parsed['options']})
+                logger.debug("Generated question: %s...", parsed['question'][:50], extra={"sample": "generated_question"})
         
+        repository.append_questions(session, new_test.id, generated)
         session.commit()
-        print(f"\nNew test created with ID: {new_test.id}")
+        logger.info("New test created with ID: %s", new_test.id)
         return new_test.id
         
     except Exception as e:
         session.rollback()
-        print(f"Error creating test variation: {e}")
+        logger.error("Error creating test variation: %s", e)
         return None
     finally:
         if close_session and session:
@@ -258,47 +420,11 @@ def generate_for_question(question_id: Optional[int] = None, test_id: Optional[i
             options_list = session.query(Option).filter(Option.question_id == question.id).order_by(Option.id).all()
             options_for_prompt = _format_options_for_prompt(options_list)
             correct_option = next(({"text": o.text, "is_correct": o.is_correct} for o in options_list if o.is_correct), None)
-        payload_messages_topic = [
-            {"role": "system", "content": "Ти експерт по математиці. Відповідай лише назвою теми."},
-            {"role": "user", "content": f"Визнач **МАКСИМАЛЬНО КОНКРЕТНУ** тему з математики для наступного питання. Поверни **ЛИШЕ ОДНЕ СЛОВО** – назву цієї теми, без лапок, пояснень чи інших символів і відповідь на Українскій мові.\n\n\n\nПитання: {question_text}"}
-        ]
-        topic = _zai_request(payload_messages_topic, temperature=0.1, max_tokens=200, thinking_enabled=False)
+        topic = _zai_request(_topic_messages(question_text), temperature=0.1, max_tokens=200, thinking_enabled=False, call_type="topic")
         topic_text = topic.strip() if isinstance(topic, str) else (question.topic if question else "Математика")
-        print(f"Detected topic: {topic_text}\n")
-        sleep(1)
-        prompt = f"""
-Ти — експерт зі створення навчальних матеріалів з математики.
-Твоє завдання: створити нове тестове завдання, яке є математично аналогічним (ізоморфним) до наданого зразка.
-Випадкове число для різноманітності: {random.randint(1000, 9999)}
-Вхідні дані:
-- Тема: "{topic_text}"
-- Зразок питання: {question_text}
-- Зразок варіантів:
-{options_for_prompt if options_for_prompt else 'Варіанти відсутні'}
-- Зразок правильної відповіді: {correct_option['text'] if correct_option else 'Правильна відповідь відсутня'}
-Інструкції:
-1. Тема та Концепція: Нове питання має СТРОГО відповідати темі "{topic_text}" та перевіряти ТУ ЖЕ математичну навичку.
-2. Складність: СТРОГО ДОТРИМУЙ рівень складності оригіналу. Якщо оригіналь простий - генеруй простий. Не роби складнішим!
-3. Числовий діапазон: Використовуй числа ПОДІБНОГО розміру до оригіналу. Якщо там однозначні числа - генеруй однозначні.
-4. Зміни: Змінюй тільки конкретні числа та wording, але ЗБЕРІГАЙ структуру та складність.
-5. Варіанти відповідей:
-    - Згенеруй 4 варіанти відповіді (марковані як a, b, c, d).
-    - Тільки один варіант правильний.
-    - Позиція правильної відповіді ВИПАДКОВА (a, b, c або d).
-    - Неправильні варіанти мають бути реалістичними помилками.
-Формат виводу:
-ПИТАННЯ: [Текст нового питання]
-a) [Варіант A]
-b) [Варіант B]
-c) [Варіант C]
-d) [Варіант D]
-ПРАВИЛЬНА: [Тільки буква]
-"""
-        payload_messages_task = [
-            {"role": "system", "content": "Ти експерт зі створення навчальних матеріалів з математики."},
-            {"role": "user", "content": prompt}
-        ]
-        task_output = _zai_request(payload_messages_task, temperature=0.7, max_tokens=800, thinking_enabled=False)
+        logger.info("Detected topic: %s", topic_text)
+        payload_messages_task = _task_messages(topic_text, question_text, options_for_prompt, correct_option['text'] if correct_option else None)
+        task_output = _zai_request(payload_messages_task, temperature=0.7, max_tokens=800, thinking_enabled=False, call_type="task")
         if task_output:
             print(task_output)
             if save_to_db and test_id is not None and DB_AVAILABLE and session:
@@ -306,11 +432,11 @@ d) [Варіант D]
                 if parsed_question:
                     saved_id = save_generated_question(session, test_id, parsed_question['question'], parsed_question['options'], topic_text)
                     if saved_id:
-                        print(f"\nQuestion saved to database with ID: {saved_id}")
+                        logger.info("Question saved to database with ID: %s", saved_id)
             return task_output
         return None
     except Exception as e:
-        print(f"Error in generate_for_question: {e}")
+        logger.error("Error in generate_for_question: %s", e)
         return None
     finally:
         try:
@@ -343,7 +469,7 @@ def _parse_task_output(output: str) -> Optional[Dict[str, Any]]:
         
         return {"question": question_text, "options": options}
     except Exception as e:
-        print(f"Error parsing task output: {e}")
+        logger.warning("Error parsing task output: %s", e)
         return None
 
 def _sanitize_category(raw: str) -> Optional[str]:
@@ -395,12 +521,15 @@ def classify_test_category(test_data: Dict[str, Any]) -> Optional[str]:
         raw = _zai_chat([
             {"role": "system", "content": "Ти експерт по математиці. Відповідай лише назвою теми."},
             {"role": "user", "content": prompt}
-        ], temperature=0.1, max_tokens=50)
+        ], temperature=0.1, max_tokens=50, call_type="classify")
         return _sanitize_category(raw or "")
     except Exception as e:
-        print(f"Ошибка классификации теста: {e}")
+        logger.warning("Ошибка классификации теста: %s", e)
         return None
 
+async def classify_test_category_async(test_data: Dict[str, Any]) -> Optional[str]:
+    return await asyncio.to_thread(classify_test_category, test_data)
+
 def identify_math_topic(text: str) -> str:
     if not text:
         return "Математика"
@@ -423,47 +552,92 @@ def identify_math_topic(text: str) -> str:
             return v
     return "Математика"
 
+def _similar_messages(question_text: str, topic: str, options: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    options_text = "\n".join([f"{chr(97+i)}) {opt.get('text','')}" for i, opt in enumerate(options)])
+    prompt = f"Пожалуйста, сгенерируй похожий вопрос по теме '{topic}'.\nВопрос: {question_text}\nВарианты:\n{options_text}\nФормат вывода:\nПИТАННЯ: ...\na) ...\nb) ...\nc) ...\nd) ...\nПРАВИЛЬНА: [буква]"
+    return [
+        {"role": "system", "content": "Ты помощник по генерации учебных вопросов. Следуй формату."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _original_options(options: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"text": o.get('text',''), "is_correct": o.get('is_correct', False)} for o in options]
+
+def _similar_result(resp: str, question_text: str, options: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    q_match = re.search(r"ПИТАННЯ:\s*(.*?)(?:\n[a-d]\)|\n\n|$)", resp, flags=re.S | re.I)
+    question_part = q_match.group(1).strip() if q_match else question_text
+    option_tuples = re.findall(r"^[ \t]*([a-dA-D])\)\s*(.+)$", resp, flags=re.M)
+    parsed_options: List[Dict[str, Any]] = []
+    for letter, text in option_tuples:
+        parsed_options.append({"text": text.strip(), "is_correct": False})
+    corr = re.search(r"ПРАВИЛЬНА:\s*([a-dA-D])", resp, flags=re.I)
+    if corr and parsed_options:
+        correct_letter = corr.group(1).lower()
+        for idx, opt in enumerate(parsed_options):
+            if chr(97 + idx) == correct_letter:
+                opt['is_correct'] = True
+    if not parsed_options:
+        parsed_options = _original_options(options)
+    return question_part, parsed_options
+
 def generate_similar_question(question_text: str, topic: str, options: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    local = numeric_variants.make_variant(question_text, options)
+    if local:
+        return local
     try:
-        correct_option = next((opt.get('text') for opt in options if opt.get('is_correct')), None)
-        options_text = "\n".join([f"{chr(97+i)}) {opt.get('text','')}" for i, opt in enumerate(options)])
-        prompt = f"Пожалуйста, сгенерируй похожий вопрос по теме '{topic}'.\nВопрос: {question_text}\nВарианты:\n{options_text}\nФормат вывода:\nПИТАННЯ: ...\na) ...\nb) ...\nc) ...\nd) ...\nПРАВИЛЬНА: [буква]"
-        raw = _zai_chat([
-            {"role": "system", "content": "Ты помощник по генерации учебных вопросов. Следуй формату."},
-            {"role": "user", "content": prompt}
-        ], temperature=0.7, max_tokens=500)
-        resp = raw or ""
-        q_match = re.search(r"ПИТАННЯ:\s*(.*?)(?:\n[a-d]\)|\n\n|$)", resp, flags=re.S | re.I)
-        question_part = q_match.group(1).strip() if q_match else question_text
-        option_tuples = re.findall(r"^[ \t]*([a-dA-D])\)\s*(.+)$", resp, flags=re.M)
-        parsed_options: List[Dict[str, Any]] = []
-        for letter, text in option_tuples:
-            parsed_options.append({"text": text.strip(), "is_correct": False})
-        corr = re.search(r"ПРАВИЛЬНА:\s*([a-dA-D])", resp, flags=re.I)
-        if corr and parsed_options:
-            correct_letter = corr.group(1).lower()
-            for idx, opt in enumerate(parsed_options):
-                if chr(97 + idx) == correct_letter:
-                    opt['is_correct'] = True
-        if not parsed_options:
-            parsed_options = [{"text": o.get('text',''), "is_correct": o.get('is_correct', False)} for o in options]
-        return question_part, parsed_options
+        raw = _zai_chat(_similar_messages(question_text, topic, options), temperature=0.7, max_tokens=500, call_type="similar")
+        return _similar_result(raw or "", question_text, options)
+    except Exception as e:
+        logger.warning("Ошибка генерации похожего вопроса: %s", e)
+        return question_text, _original_options(options)
+
+async def stream_similar_question(question_text: str, topic: str, options: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Yields task_stream parser events while the completion arrives, then a
+    final "done" event carrying the same result generate_similar_question gives."""
+    local = numeric_variants.make_variant(question_text, options)
+    if local:
+        yield {"type": "done", "text": local[0], "options": local[1]}
+        return
+    parser = task_stream.TaskStreamParser()
+    chunks: List[str] = []
+    try:
+        async for chunk in _zai_request_stream(_similar_messages(question_text, topic, options), temperature=0.7, max_tokens=500, call_type="similar"):
+            chunks.append(chunk)
+            for event in parser.feed(chunk):
+                yield event
+        for event in parser.close():
+            yield event
+        text, new_options = _similar_result("".join(chunks), question_text, options)
     except Exception as e:
-        print(f"Ошибка генерации похожего вопроса: {e}")
-        return question_text, [{"text": o.get('text',''), "is_correct": o.get('is_correct', False)} for o in options]
+        logger.warning("Ошибка генерации похожего вопроса: %s", e)
+        text, new_options = question_text, _original_options(options)
+    yield {"type": "done", "text": text, "options": new_options}
 
-def generate_test_variation(test_data: Dict[str, Any]) -> Dict[str, Any]:
+def variant_header(test_data: Dict[str, Any]) -> Dict[str, Any]:
     description = test_data.get('description', '') or ''
-    new_test = {
+    return {
         "title": f"{test_data.get('title','(без назви)')} (Вариант)",
         "description": description + "\n(Автоматически сгенерированный вариант)",
         "category": test_data.get('category', ''),
         "questions": []
     }
-    for q in test_data.get('questions', []):
-        text = q.get('text', '')
-        topic = q.get('topic') or identify_math_topic(text)
-        new_q_text, new_options = generate_similar_question(text, topic, q.get('options', []))
+
+def generate_test_variation(test_data: Dict[str, Any], width: Optional[int] = None) -> Dict[str, Any]:
+    new_test = variant_header(test_data)
+    questions = test_data.get('questions', [])
+    topics = [q.get('topic') or identify_math_topic(q.get('text', '')) for q in questions]
+
+    def _vary(index: int) -> Tuple[str, List[Dict[str, Any]]]:
+        q = questions[index]
+        return generate_similar_question(q.get('text', ''), topics[index], q.get('options', []))
+
+    results = fan_out(_vary, range(len(questions)), width=width, label="similar-questions")
+    for q, topic, result in zip(questions, topics, results):
+        if result.ok:
+            new_q_text, new_options = result.value
+        else:
+            new_q_text = q.get('text', '')
+            new_options = [{"text": o.get('text',''), "is_correct": o.get('is_correct', False)} for o in q.get('options', [])]
         new_test['questions'].append({
             'text': new_q_text,
             'topic': topic,
@@ -473,6 +647,9 @@ def generate_test_variation(test_data: Dict[str, Any]) -> Dict[str, Any]:
 
 if __name__ == '__main__':
     import sys
+    from app_logging import setup_logging
+
+    setup_logging()
     
     if len(sys.argv) < 2:
         print("Usage:")
@@ -0,0 +1,252 @@
+import sys
+import logging
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+import repository
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = [5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600]
+HISTOGRAM_SIZE = len(TIME_BUCKETS) + 1
+
+Row = Tuple[bool, bool, Optional[int], Optional[float]]
+
+
+def _empty_stat(test_id: int, position: int) -> Dict[str, Any]:
+    return {
+        "test_id": test_id,
+        "position": position,
+        "attempts": 0,
+        "answered": 0,
+        "correct": 0,
+        "option_counts": [],
+        "time_histogram": [0] * HISTOGRAM_SIZE,
+        "time_count": 0,
+        "time_total": 0,
+    }
+
+
+def _is_correct(question: Dict[str, Any], answer: Dict[str, Any]) -> bool:
+    option_id = answer.get("option_id")
+    if option_id is not None:
+        for option in question.get("options", []):
+            if option.get("id") == option_id:
+                return bool(option.get("is_correct"))
+    return bool(answer.get("is_correct"))
+
+
+def result_rows(questions: Sequence[Dict[str, Any]], answers: Optional[Dict[str, Any]], question_times: Optional[Dict[str, Any]]) -> List[Row]:
+    answers = answers or {}
+    question_times = question_times or {}
+    rows = []
+    for q in questions:
+        key = str(q["id"])
+        answer = answers.get(key)
+        seconds = question_times.get(key)
+        seconds = float(seconds) if isinstance(seconds, (int, float)) else None
+        if isinstance(answer, dict):
+            selected = answer.get("selected_index")
+            rows.append((True, _is_correct(q, answer), selected if isinstance(selected, int) else None, seconds))
+        else:
+            rows.append((False, False, None, seconds))
+    return rows
+
+
+def _accumulate(stat: models.QuestionStat, row: Row):
+    answered, correct, selected, seconds = row
+    stat.attempts = (stat.attempts or 0) + 1
+    if answered:
+        stat.answered = (stat.answered or 0) + 1
+    if correct:
+        stat.correct = (stat.correct or 0) + 1
+    if selected is not None and selected >= 0:
+        counts = list(stat.option_counts or [])
+        counts.extend([0] * (selected + 1 - len(counts)))
+        counts[selected] += 1
+        stat.option_counts = counts
+    if seconds is not None:
+        histogram = list(stat.time_histogram or [0] * HISTOGRAM_SIZE)
+        histogram[bisect_left(TIME_BUCKETS, seconds)] += 1
+        stat.time_histogram = histogram
+        stat.time_count = (stat.time_count or 0) + 1
+        stat.time_total = (stat.time_total or 0) + int(seconds)
+
+
+async def apply_result_async(db: AsyncSession, test_id: int, questions: Sequence[Dict[str, Any]], answers: Optional[Dict[str, Any]], question_times: Optional[Dict[str, Any]]):
+    rows = result_rows(questions, answers, question_times)
+    if not rows:
+        return
+    await db.execute(
+        insert(models.QuestionStat.__table__)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .values([_empty_stat(test_id, position) for position in range(len(rows))])
+    )
+    result = await db.execute(
+        select(models.QuestionStat)
+        .where(models.QuestionStat.test_id == test_id, models.QuestionStat.position < len(rows))
+        .with_for_update()
+    )
+    stats = {stat.position: stat for stat in result.scalars().all()}
+    for position, row in enumerate(rows):
+        _accumulate(stats[position], row)
+
+
+def recompute_test(db: Session, test_id: int) -> int:
+    results = db.execute(
+        select(models.TestResult.answers, models.TestResult.question_times, models.TestResult.questions_snapshot, models.TestResult.snapshot_hash, models.TestResult.snapshot_ids)
+        .where(models.TestResult.test_id == test_id)
+    ).all()
+    hashes = list({r.snapshot_hash for r in results if r.snapshot_hash})
+    shared = dict(db.execute(
+        select(models.QuestionSnapshot.hash, models.QuestionSnapshot.snapshot)
+        .where(models.QuestionSnapshot.hash.in_(hashes))
+    ).all()) if hashes else {}
+    fallback = None
+
+    per_result = []
+    for r in results:
+        questions = r.questions_snapshot or snapshots.attach_ids(shared.get(r.snapshot_hash), r.snapshot_ids)
+        if not questions:
+            if fallback is None:
+                fallback = repository.questions_snapshot(repository.get_questions_tree(db, test_id))
+            questions = fallback
+        per_result.append(result_rows(questions, r.answers, r.question_times))
+
+    n = len(per_result)
+    q = max((len(rows) for rows in per_result), default=0)
+    present = np.zeros((n, q), dtype=bool)
+    answered = np.zeros((n, q), dtype=bool)
+    correct = np.zeros((n, q), dtype=bool)
+    selected = np.full((n, q), -1, dtype=np.int64)
+    times = np.full((n, q), np.nan)
+    for i, rows in enumerate(per_result):
+        for j, (is_answered, is_correct, sel, seconds) in enumerate(rows):
+            present[i, j] = True
+            answered[i, j] = is_answered
+            correct[i, j] = is_correct
+            if sel is not None and sel >= 0:
+                selected[i, j] = sel
+            if seconds is not None:
+                times[i, j] = seconds
+
+    columns = np.broadcast_to(np.arange(q), (n, q))
+    width = int(selected.max()) + 1 if selected.size and selected.max() >= 0 else 0
+    chosen = selected >= 0
+    option_counts = np.bincount(
+        (columns[chosen] * width + selected[chosen]), minlength=q * width
+    ).reshape(q, width) if width else np.zeros((q, 0), dtype=np.int64)
+
+    timed = ~np.isnan(times)
+    buckets = np.searchsorted(TIME_BUCKETS, times[timed], side="left")
+    histograms = np.bincount(
+        columns[timed] * HISTOGRAM_SIZE + buckets, minlength=q * HISTOGRAM_SIZE
+    ).reshape(q, HISTOGRAM_SIZE)
+
+    attempts = present.sum(axis=0)
+    answered_counts = answered.sum(axis=0)
+    correct_counts = correct.sum(axis=0)
+    time_counts = timed.sum(axis=0)
+    # Whole seconds per answer, the way _accumulate adds them, so a recompute
+    # reproduces the incremental totals exactly.
+    time_totals = np.nansum(np.trunc(times), axis=0) if n else np.zeros(q)
+
+    stats = []
+    for j in range(q):
+        counts = option_counts[j].tolist()
+        while counts and counts[-1] == 0:
+            counts.pop()
+        stats.append({
+            "test_id": test_id,
+            "position": j,
+            "attempts": int(attempts[j]),
+            "answered": int(answered_counts[j]),
+            "correct": int(correct_counts[j]),
+            "option_counts": counts,
+            "time_histogram": histograms[j].tolist(),
+            "time_count": int(time_counts[j]),
+            "time_total": int(time_totals[j]),
+        })
+
+    try:
+        db.execute(delete(models.QuestionStat.__table__).where(models.QuestionStat.test_id == test_id))
+        if stats:
+            db.execute(insert(models.QuestionStat.__table__).values(stats))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info("Статистика теста %s пересчитана: %s результатов, %s вопросов", test_id, n, q)
+    return n
+
+
+def _percentile(histogram: Sequence[int], fraction: float) -> Optional[float]:
+    total = sum(histogram)
+    if not total:
+        return None
+    target = total * fraction
+    seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= target:
+            lower = TIME_BUCKETS[i - 1] if i > 0 else 0
+            if i >= len(TIME_BUCKETS):
+                return float(lower)
+            return lower + (TIME_BUCKETS[i] - lower) * (target - seen) / count
+        seen += count
+    return float(TIME_BUCKETS[-1])
+
+
+def dashboard(test_id: int, stats: Sequence[models.QuestionStat], texts: Sequence[str]) -> Dict[str, Any]:
+    questions = []
+    for stat in stats:
+        histogram = stat.time_histogram or [0] * HISTOGRAM_SIZE
+        questions.append({
+            "position": stat.position,
+            "text": texts[stat.position] if stat.position < len(texts) else None,
+            "attempts": stat.attempts or 0,
+            "answered": stat.answered or 0,
+            "correct": stat.correct or 0,
+            "correct_rate": (stat.correct / stat.attempts) if stat.attempts else None,
+            "option_distribution": stat.option_counts or [],
+            "time": {
+                "count": stat.time_count or 0,
+                "mean": (stat.time_total / stat.time_count) if stat.time_count else None,
+                "p50": _percentile(histogram, 0.5),
+                "p90": _percentile(histogram, 0.9),
+            },
+        })
+    return {
+        "test_id": test_id,
+        "submissions": max((q["attempts"] for q in questions), default=0),
+        "questions": questions,
+    }
+
+
+if __name__ == "__main__":
+    from app_logging import setup_logging
+    from database import SessionLocal
+
+    setup_logging()
+
+    if len(sys.argv) < 2:
+        print("Usage: python analytics.py <test_id>|all")
+        sys.exit(1)
+
+    session = SessionLocal()
+    try:
+        if sys.argv[1] == "all":
+            test_ids = session.execute(select(models.TestResult.test_id).distinct()).scalars().all()
+        else:
+            test_ids = [int(sys.argv[1])]
+        for tid in test_ids:
+            recompute_test(session, tid)
+    finally:
+        session.close()
@@ -0,0 +1,122 @@
+"""Batch question import throughput for the JSON, NDJSON and CSV paths.
+
+Builds the same seeded batch of questions in each format, then times the two
+phases the endpoint runs: read_questions over the body in network-sized
+chunks, and import_questions into a fresh test. Each format runs twice: once
+with a topic on every question, and once with topics left unset on a
+"Математика" test so the insert phase includes detect_topics. Topic detection
+is identify_math_topic, a keyword lookup with no network calls. The default
+database is a throwaway SQLite file; pass a SQLAlchemy URL to measure against
+MySQL instead.
+
+    python benchmarks/import_bench.py [questions] [repeats] [database url]
+"""
+import os
+import sys
+import csv
+import io
+import json
+import time
+import random
+import asyncio
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import question_import
+
+CHUNK = 64 * 1024
+CONTENT_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def make_questions(count: int, seed: int = 1, topics: bool = True):
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        a, b = rng.randint(2, 99), rng.randint(2, 99)
+        answers = [a + b + shift for shift in (0, -1, 1, 2)]
+        rng.shuffle(answers)
+        questions.append({
+            "text": f"Питання {i + 1}: обчисліть {a} + {b}, \"з поясненням\"",
+            "topic": "Арифметика" if topics else None,
+            "options": [{"text": str(value), "is_correct": value == a + b} for value in answers],
+        })
+    return questions
+
+
+def encode(questions, fmt: str) -> bytes:
+    if fmt == "json":
+        return json.dumps(questions, ensure_ascii=False).encode("utf-8")
+    if fmt == "ndjson":
+        return "".join(json.dumps(q, ensure_ascii=False) + "\n" for q in questions).encode("utf-8")
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["text", "topic", "option_a", "option_b", "option_c", "option_d", "correct"])
+    for q in questions:
+        correct = next(i for i, o in enumerate(q["options"]) if o["is_correct"])
+        writer.writerow([q["text"], q["topic"] or "", *[o["text"] for o in q["options"]], "abcd"[correct]])
+    return out.getvalue().encode("utf-8")
+
+
+async def _chunks(body: bytes):
+    for start in range(0, len(body), CHUNK):
+        yield body[start:start + CHUNK]
+
+
+def run_format(session_local, user_id: int, fmt: str, body: bytes, repeats: int, category=None):
+    parse_times, insert_times = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        questions = asyncio.run(question_import.read_questions(CONTENT_TYPES[fmt], _chunks(body)))
+        parse_times.append(time.perf_counter() - started)
+
+        db = session_local()
+        try:
+            test = models.Test(title=f"import {fmt}", user_id=user_id, category=category)
+            db.add(test)
+            db.commit()
+            started = time.perf_counter()
+            question_import.import_questions(db, test.id, questions, fmt)
+            insert_times.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return len(questions), statistics.median(parse_times), statistics.median(insert_times)
+
+
+def main(count: int = 1000, repeats: int = 5, url: str = ""):
+    directory = tempfile.TemporaryDirectory()
+    engine = create_engine(url or f"sqlite:///{os.path.join(directory.name, 'import.sqlite3')}", future=True)
+    models.Base.metadata.create_all(engine)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_local()
+    try:
+        user = models.User(username=f"import-bench-{time.time_ns()}", hashed_password="-")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+
+    print(f"{count} questions, median of {repeats} runs, {engine.dialect.name}")
+    print(f"{'format':<8}{'topics':<9}{'body KiB':>10}{'parse ms':>10}{'insert ms':>11}{'questions/s':>13}")
+    try:
+        for topics, category, label in ((True, None, "given"), (False, "Математика", "detected")):
+            questions = make_questions(count, topics=topics)
+            for fmt in ("json", "ndjson", "csv"):
+                body = encode(questions, fmt)
+                imported, parse, insert = run_format(session_local, user_id, fmt, body, repeats, category)
+                assert imported == count, f"{fmt}: parsed {imported} of {count}"
+                print(f"{fmt:<8}{label:<9}{len(body) / 1024:>10.0f}{parse * 1000:>10.1f}{insert * 1000:>11.1f}{count / (parse + insert):>13.0f}")
+    finally:
+        engine.dispose()
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*(int(a) for a in args[:2]), *args[2:3])
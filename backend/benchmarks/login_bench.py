@@ -0,0 +1,73 @@
+"""Concurrent login throughput and event loop stalls, bcrypt inline vs the
+password process pool.
+
+Each simulated login is one bcrypt check, which is what dominates
+POST /login. A ticker coroutine measures how late the event loop wakes it;
+that lag is what every other request on the worker waits behind.
+
+    python benchmarks/login_bench.py [logins] [rounds]
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords
+
+TICK = 0.01
+
+
+async def _ticker(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def _inline_check(password: str, hashed: str) -> bool:
+    return passwords.check_password(password, hashed)
+
+
+async def run_mode(check, logins: int, hashed: str):
+    stop = asyncio.Event()
+    lags: list = []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    latencies = []
+
+    async def _login():
+        started = time.perf_counter()
+        assert await check("correct horse", hashed)
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.sleep(TICK)
+    started = time.perf_counter()
+    await asyncio.gather(*[_login() for _ in range(logins)])
+    wall = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return latencies, wall, lags
+
+
+async def main(logins: int = 64, rounds: int = passwords.BCRYPT_ROUNDS):
+    hashed = passwords.hash_password("correct horse", rounds)
+    passwords.start()
+    await passwords.check_password_async("correct horse", hashed)
+    print(f"{logins} concurrent logins, bcrypt cost {rounds}, {passwords.PASSWORD_WORKERS} workers ({passwords.PASSWORD_START_METHOD})")
+    print(f"{'mode':<8}{'logins/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max loop lag ms':>18}")
+    try:
+        for name, check in (("inline", _inline_check), ("pool", passwords.check_password_async)):
+            latencies, wall, lags = await run_mode(check, logins, hashed)
+            latencies.sort()
+            print(
+                f"{name:<8}{logins / wall:>10.1f}{statistics.median(latencies) * 1000:>10.0f}"
+                f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.0f}{max(lags or [0]) * 1000:>18.0f}"
+            )
+    finally:
+        passwords.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(a) for a in sys.argv[1:3])))
@@ -0,0 +1,114 @@
+"""Per-call overhead of the Z.AI HTTP fallback against a local stub server.
+
+Compares a fresh client per call (what the old requests.post path did) with
+the long-lived pooled client from zai_http. The stub answers instantly, so
+the difference is connection setup and client construction. There is no TLS
+here, so a real endpoint saves more per call.
+
+    python benchmarks/zai_http_bench.py [calls] [concurrency]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zai_http
+
+RESPONSE = json.dumps({"choices": [{"message": {"role": "assistant", "content": "Арифметика"}}]}).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """Chat completions stub that counts accepted TCP connections."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.connections = 0
+        self._thread = threading.Thread(target=self.serve_forever, name="zai-stub", daemon=True)
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/chat/completions"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "2 + 2"}], "stream": False}
+
+
+async def timed_calls(calls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _call():
+        async with semaphore:
+            started = time.perf_counter()
+            await zai_http.post_chat(PAYLOAD, "stub-key")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[_call() for _ in range(calls)])
+    return latencies, time.perf_counter() - started
+
+
+async def run_mode(server: StubServer, pooled: bool, calls: int, concurrency: int):
+    before = server.connections
+    if pooled:
+        await zai_http.start()
+    try:
+        latencies, wall = await timed_calls(calls, concurrency)
+    finally:
+        await zai_http.stop()
+    return latencies, wall, server.connections - before
+
+
+def main(calls: int = 500, concurrency: int = 8):
+    with StubServer() as server:
+        zai_http.ZAI_API_URL = server.url
+        print(f"{calls} calls, concurrency {concurrency}, stub {server.url}")
+        print(f"{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'calls/s':>12}{'connections':>14}")
+        for name, pooled in (("oneshot", False), ("pooled", True)):
+            latencies, wall, connections = asyncio.run(run_mode(server, pooled, calls, concurrency))
+            latencies.sort()
+            print(
+                f"{name:<10}{statistics.median(latencies) * 1000:>10.2f}"
+                f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.2f}"
+                f"{calls / wall:>12.0f}{connections:>14}"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
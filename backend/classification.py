@@ -0,0 +1,150 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+
+from database import SessionLocal
+import models
+import repository
+import response_cache
+from ai import classify_test_category
+import llm_scheduler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CLASSIFY_DEBOUNCE = float(os.getenv("CLASSIFY_DEBOUNCE", "30"))
+CLASSIFY_SCAN_INTERVAL = float(os.getenv("CLASSIFY_SCAN_INTERVAL", "10"))
+CLASSIFY_BATCH = int(os.getenv("CLASSIFY_BATCH", "20"))
+CLASSIFY_RETRY_DELAY = float(os.getenv("CLASSIFY_RETRY_DELAY", "600"))
+
+
+def mark_dirty(test: models.Test):
+    """Flags the test for re-classification; the caller commits. The worker
+    picks it up once no further edit has arrived for CLASSIFY_DEBOUNCE seconds."""
+    test.classify_requested_at = datetime.utcnow()
+
+
+def _classify_payload(test_id: int) -> Optional[Tuple[Optional[datetime], int, Optional[int], Dict[str, Any]]]:
+    db = SessionLocal()
+    try:
+        test = repository.get_test_tree(db, test_id)
+        if test is None:
+            return None
+        return test.classify_requested_at, test.content_revision, test.user_id, {
+            "title": test.title,
+            "description": test.description,
+            "questions": [
+                {
+                    "text": q.text,
+                    "options": [{"text": o.text} for o in q.options]
+                }
+                for q in test.questions
+            ]
+        }
+    finally:
+        db.close()
+
+
+def classify_test(test_id: int) -> Optional[str]:
+    # The read session is closed before the LLM call so no pooled connection
+    # or transaction is held for its duration; the UPDATE gets a fresh one.
+    try:
+        payload = _classify_payload(test_id)
+    except Exception as e:
+        logger.error("Error loading test %s for classification: %s", test_id, e)
+        return None
+    if payload is None:
+        return None
+    requested_at, revision, user_id, test_data = payload
+    category = classify_test_category(test_data)
+
+    db = SessionLocal()
+    try:
+        # An edit made while the LLM call was running leaves the test dirty,
+        # so that edit gets its own classification after the next quiet period.
+        condition = models.Test.classify_requested_at.is_(None) if requested_at is None else models.Test.classify_requested_at == requested_at
+        if not category:
+            # The revision stays unclassified; the worker retries it once
+            # CLASSIFY_RETRY_DELAY has passed on top of the usual debounce.
+            retry_at = datetime.utcnow() + timedelta(seconds=CLASSIFY_RETRY_DELAY)
+            db.execute(update(models.Test).where(models.Test.id == test_id, condition).values(classify_requested_at=retry_at))
+            db.commit()
+            logger.warning("test classification failed", extra={"test_id": test_id})
+            return None
+        values = {"classify_requested_at": None, "classified_revision": revision, "category": category[:100]}
+        cleared = db.execute(update(models.Test).where(models.Test.id == test_id, condition).values(**values)).rowcount
+        if not cleared:
+            db.execute(update(models.Test).where(models.Test.id == test_id).values(category=category[:100], classified_revision=revision))
+        db.commit()
+        response_cache.invalidate_tests(user_id=user_id, test_id=test_id)
+        logger.info("test classified", extra={"test_id": test_id, "category": category})
+        return category
+    except Exception as e:
+        db.rollback()
+        logger.error("Error classifying test %s: %s", test_id, e)
+        return None
+    finally:
+        db.close()
+
+
+def due_tests(debounce: float = CLASSIFY_DEBOUNCE, limit: int = CLASSIFY_BATCH) -> List[int]:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=debounce)
+        return db.execute(
+            select(models.Test.id)
+            .where(models.Test.classify_requested_at.isnot(None), models.Test.classify_requested_at <= cutoff)
+            .order_by(models.Test.classify_requested_at)
+            .limit(limit)
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+class ClassifyWorker:
+    def __init__(self, scan_interval: float = CLASSIFY_SCAN_INTERVAL):
+        self.scan_interval = scan_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="test-classifier", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.scan_interval):
+            try:
+                test_ids = due_tests()
+            except Exception as e:
+                logger.error("Error scanning tests to classify: %s", e)
+                continue
+            for test_id in test_ids:
+                if self._stop.is_set():
+                    return
+                with llm_scheduler.priority(llm_scheduler.BACKGROUND):
+                    classify_test(test_id)
+
+
+_worker = ClassifyWorker()
+
+
+def start_worker():
+    _worker.start()
+
+
+def stop_worker():
+    _worker.stop()
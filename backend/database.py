@@ -1,16 +1,24 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
 import os
 from dotenv import load_dotenv
 import urllib.parse
 
+from metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
+
 load_dotenv()
 
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_NAME = os.getenv("DB_NAME")
+DB_WORKER_THREADS = int(os.getenv("DB_WORKER_THREADS", "16"))
 
 connect_args = {
     "charset": "utf8mb4",
@@ -20,19 +28,37 @@ connect_args = {
 encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
 
 SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{encoded_password}@{DB_HOST}/{DB_NAME}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"mysql+asyncmy://{DB_USER}:{encoded_password}@{DB_HOST}/{DB_NAME}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args=connect_args,
+    poolclass=TimedQueuePool,
     pool_recycle=3600,
     pool_pre_ping=True,
+    future=True,
     echo=False
 )
 
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+    echo=False
+)
+
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+_worker_pool = ThreadPoolExecutor(max_workers=DB_WORKER_THREADS, thread_name_prefix="db-worker")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -40,3 +66,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def run_in_worker(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_worker_pool, functools.partial(ctx.run, fn, *args, **kwargs))
@@ -0,0 +1,57 @@
+import os
+import logging
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FANOUT_WIDTH = int(os.getenv("AI_FANOUT_WIDTH", "4"))
+
+
+@dataclass
+class FanoutResult:
+    index: int
+    value: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _timed_call(fn: Callable[[Any], Any], index: int, item: Any) -> FanoutResult:
+    started = time.perf_counter()
+    try:
+        value = fn(item)
+        return FanoutResult(index=index, value=value, elapsed=time.perf_counter() - started)
+    except Exception as e:
+        return FanoutResult(index=index, error=e, elapsed=time.perf_counter() - started)
+
+
+def fan_out(fn: Callable[[Any], Any], items: Sequence[Any], width: Optional[int] = None, label: str = "fanout") -> List[FanoutResult]:
+    items = list(items)
+    if not items:
+        return []
+    width = max(1, min(width or FANOUT_WIDTH, len(items)))
+    started = time.perf_counter()
+    if width == 1:
+        results = [_timed_call(fn, i, item) for i, item in enumerate(items)]
+    else:
+        with ThreadPoolExecutor(max_workers=width, thread_name_prefix=label) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, _timed_call, fn, i, item) for i, item in enumerate(items)]
+            results = [f.result() for f in futures]
+    total = time.perf_counter() - started
+    failed = sum(1 for r in results if not r.ok)
+    logger.debug("%s: %s items, width=%s, failed=%s, total=%.2fs", label, len(results), width, failed, total)
+    for r in results:
+        status = "ok" if r.ok else f"error: {r.error}"
+        logger.debug("%s[%s] %.2fs %s", label, r.index, r.elapsed, status, extra={"sample": "fanout_item"})
+    return results
@@ -0,0 +1,268 @@
+import os
+import asyncio
+import json
+import logging
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "1024"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+DETERMINISTIC_TEMPERATURE = 0.2
+
+
+@dataclass
+class CachePolicy:
+    enabled: bool
+    ttl: int = LLM_CACHE_TTL
+
+
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "topic": CachePolicy(True, 7 * 24 * 3600),
+    "classify": CachePolicy(True, LLM_CACHE_TTL),
+    "task": CachePolicy(False),
+    "similar": CachePolicy(False),
+}
+
+
+def policy_for(call_type: str, temperature: float) -> CachePolicy:
+    policy = CACHE_POLICIES.get(call_type)
+    if policy is not None:
+        return policy
+    return CachePolicy(temperature <= DETERMINISTIC_TEMPERATURE)
+
+
+def make_key(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    raw = json.dumps({"model": model, "messages": messages, "temperature": temperature}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                logger.warning("LLM disk cache unavailable (%s)", e)
+                return None
+        return self._conn
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if row[1] < time.time():
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                return row[0], row[1]
+            except Exception as e:
+                logger.warning("LLM disk cache read error: %s", e)
+                return None
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+                conn.commit()
+            except Exception as e:
+                logger.warning("LLM disk cache write error: %s", e)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            cur = conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+            conn.commit()
+            return cur.rowcount
+
+
+_memory = MemoryCache(LLM_CACHE_MEMORY_SIZE)
+_disk = DiskCache(LLM_CACHE_PATH)
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _count(call_type: str, event: str):
+    with _stats_lock:
+        bucket = _stats.setdefault(call_type, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+        bucket[event] += 1
+
+
+def _memory_lookup(call_type: str, key: str) -> Optional[str]:
+    value = _memory.get(key)
+    if value is not None:
+        _count(call_type, "memory_hits")
+    return value
+
+
+def _disk_lookup(call_type: str, key: str) -> Optional[str]:
+    stored = _disk.get(key)
+    if stored is not None:
+        value, expires_at = stored
+        _memory.set(key, value, expires_at)
+        _count(call_type, "disk_hits")
+        return value
+    _count(call_type, "misses")
+    return None
+
+
+def _lookup(call_type: str, key: str) -> Optional[str]:
+    value = _memory_lookup(call_type, key)
+    if value is not None:
+        return value
+    return _disk_lookup(call_type, key)
+
+
+async def _lookup_async(call_type: str, key: str) -> Optional[str]:
+    # The memory tier is a dict lookup; only SQLite goes off the event loop.
+    value = _memory_lookup(call_type, key)
+    if value is not None:
+        return value
+    return await asyncio.to_thread(_disk_lookup, call_type, key)
+
+
+def _store(key: str, value: Optional[str], policy: CachePolicy):
+    if isinstance(value, str):
+        expires_at = time.time() + policy.ttl
+        _memory.set(key, value, expires_at)
+        _disk.set(key, value, expires_at)
+
+
+async def _store_async(key: str, value: Optional[str], policy: CachePolicy):
+    if isinstance(value, str):
+        expires_at = time.time() + policy.ttl
+        _memory.set(key, value, expires_at)
+        await asyncio.to_thread(_disk.set, key, value, expires_at)
+
+
+def cached_call(call_type: str, model: str, messages: List[Dict[str, str]], temperature: float, fn: Callable[[], Optional[str]]) -> Optional[str]:
+    policy = policy_for(call_type, temperature)
+    if not LLM_CACHE_ENABLED or not policy.enabled:
+        _count(call_type, "bypassed")
+        return fn()
+    key = make_key(model, messages, temperature)
+    value = _lookup(call_type, key)
+    if value is None:
+        value = fn()
+        _store(key, value, policy)
+    return value
+
+
+async def cached_call_async(call_type: str, model: str, messages: List[Dict[str, str]], temperature: float, fn: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+    policy = policy_for(call_type, temperature)
+    if not LLM_CACHE_ENABLED or not policy.enabled:
+        _count(call_type, "bypassed")
+        return await fn()
+    key = make_key(model, messages, temperature)
+    value = await _lookup_async(call_type, key)
+    if value is None:
+        value = await fn()
+        await _store_async(key, value, policy)
+    return value
+
+
+async def cached_stream_async(call_type: str, model: str, messages: List[Dict[str, str]], temperature: float, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    policy = policy_for(call_type, temperature)
+    if not LLM_CACHE_ENABLED or not policy.enabled:
+        _count(call_type, "bypassed")
+        async for chunk in fn():
+            yield chunk
+        return
+    key = make_key(model, messages, temperature)
+    value = await _lookup_async(call_type, key)
+    if value is not None:
+        yield value
+        return
+    chunks = []
+    async for chunk in fn():
+        chunks.append(chunk)
+        yield chunk
+    await _store_async(key, "".join(chunks) if chunks else None, policy)
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        per_type = {k: dict(v) for k, v in _stats.items()}
+    totals = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+    for bucket in per_type.values():
+        for k, v in bucket.items():
+            totals[k] += v
+    lookups = totals["memory_hits"] + totals["disk_hits"] + totals["misses"]
+    hits = totals["memory_hits"] + totals["disk_hits"]
+    return {
+        "enabled": LLM_CACHE_ENABLED,
+        "memory_entries": len(_memory),
+        "hit_rate": (hits / lookups) if lookups else 0.0,
+        "totals": totals,
+        "by_call_type": per_type,
+    }
+
+
+def clear_memory():
+    _memory.clear()
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from threading import Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import llm_cache
+import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "zai")
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_fixtures")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0") not in ("0", "false", "False")
+LLM_SYNTHETIC_LATENCY = os.getenv("LLM_SYNTHETIC_LATENCY", "lognormal:1.5,0.5")
+LLM_SYNTHETIC_FAILURE_RATE = float(os.getenv("LLM_SYNTHETIC_FAILURE_RATE", "0"))
+LLM_SYNTHETIC_TIMEOUT_RATE = float(os.getenv("LLM_SYNTHETIC_TIMEOUT_RATE", "0"))
+LLM_SYNTHETIC_SEED = os.getenv("LLM_SYNTHETIC_SEED") or None
+LLM_SYNTHETIC_FIRST_TOKEN = float(os.getenv("LLM_SYNTHETIC_FIRST_TOKEN", "0.2"))
+
+Messages = List[Dict[str, str]]
+
+
+class LLMProvider:
+    name = "base"
+
+    def complete(self, messages: Messages, temperature: float, max_tokens: int, thinking_enabled: bool, call_type: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def complete_async(self, messages: Messages, temperature: float, max_tokens: int, thinking_enabled: bool, call_type: str) -> Optional[str]:
+        return await asyncio.to_thread(self.complete, messages, temperature, max_tokens, thinking_enabled, call_type)
+
+    async def stream_async(self, messages: Messages, temperature: float, max_tokens: int, thinking_enabled: bool, call_type: str) -> AsyncIterator[str]:
+        response = await self.complete_async(messages, temperature, max_tokens, thinking_enabled, call_type)
+        if response is not None:
+            yield response
+
+
+class ZaiProvider(LLMProvider):
+    name = "zai"
+
+    def __init__(self, complete: Callable[..., Optional[str]], complete_async: Callable[..., Awaitable[Optional[str]]],
+                 stream_async: Optional[Callable[..., AsyncIterator[str]]] = None):
+        self._complete = complete
+        self._complete_async = complete_async
+        self._stream_async = stream_async
+
+    def complete(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        return self._complete(messages, temperature, max_tokens, thinking_enabled, call_type)
+
+    async def complete_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        return await self._complete_async(messages, temperature, max_tokens, thinking_enabled, call_type)
+
+    async def stream_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        if self._stream_async is None:
+            async for chunk in super().stream_async(messages, temperature, max_tokens, thinking_enabled, call_type):
+                yield chunk
+            return
+        async for chunk in self._stream_async(messages, temperature, max_tokens, thinking_enabled, call_type):
+            yield chunk
+
+
+def _fixture_path(directory: str, call_type: str) -> str:
+    return os.path.join(directory, f"{call_type}.jsonl")
+
+
+class RecordingProvider(LLMProvider):
+    name = "record"
+
+    def __init__(self, inner: LLMProvider, directory: str = LLM_FIXTURES_DIR, model: str = ""):
+        self.inner = inner
+        self.directory = directory
+        self.model = model
+        self._lock = Lock()
+
+    def _record(self, messages, temperature, call_type, response, elapsed):
+        if response is None:
+            return
+        entry = {
+            "key": llm_cache.make_key(self.model, messages, temperature),
+            "call_type": call_type,
+            "temperature": temperature,
+            "messages": messages,
+            "response": response,
+            "elapsed": round(elapsed, 4),
+        }
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(_fixture_path(self.directory, call_type), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def complete(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        started = time.perf_counter()
+        response = self.inner.complete(messages, temperature, max_tokens, thinking_enabled, call_type)
+        self._record(messages, temperature, call_type, response, time.perf_counter() - started)
+        return response
+
+    async def complete_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        started = time.perf_counter()
+        response = await self.inner.complete_async(messages, temperature, max_tokens, thinking_enabled, call_type)
+        self._record(messages, temperature, call_type, response, time.perf_counter() - started)
+        return response
+
+    async def stream_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        started = time.perf_counter()
+        chunks = []
+        async for chunk in self.inner.stream_async(messages, temperature, max_tokens, thinking_enabled, call_type):
+            chunks.append(chunk)
+            yield chunk
+        self._record(messages, temperature, call_type, "".join(chunks) if chunks else None, time.perf_counter() - started)
+
+
+class ReplayProvider(LLMProvider):
+    """Serves recorded responses by prompt key. Repeated prompts cycle through
+    their recordings in order, so a replay run is deterministic."""
+
+    name = "replay"
+
+    def __init__(self, directory: str = LLM_FIXTURES_DIR, model: str = "", replay_latency: bool = LLM_REPLAY_LATENCY):
+        self.model = model
+        self.replay_latency = replay_latency
+        self._fixtures: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+        self._lock = Lock()
+        self._load(directory)
+
+    def _load(self, directory: str):
+        if not os.path.isdir(directory):
+            logger.warning("LLM fixtures directory %s not found, replay will miss", directory)
+            return
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".jsonl"):
+                continue
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._fixtures.setdefault(entry["key"], []).append(entry)
+        logger.info("Loaded %s LLM fixture prompts from %s", len(self._fixtures), directory)
+
+    def _next(self, messages, temperature, call_type) -> Optional[Dict[str, Any]]:
+        key = llm_cache.make_key(self.model, messages, temperature)
+        with self._lock:
+            entries = self._fixtures.get(key)
+            if not entries:
+                metrics.llm_failed(call_type)
+                logger.warning("No LLM fixture for %s prompt %s", call_type, key[:12])
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return entries[position % len(entries)]
+
+    def complete(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        entry = self._next(messages, temperature, call_type)
+        if entry is None:
+            return None
+        if self.replay_latency:
+            time.sleep(entry.get("elapsed", 0))
+        metrics.LLM_LATENCY.observe(entry.get("elapsed", 0) if self.replay_latency else 0, call_type=call_type)
+        return entry["response"]
+
+    async def complete_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        entry = self._next(messages, temperature, call_type)
+        if entry is None:
+            return None
+        if self.replay_latency:
+            await asyncio.sleep(entry.get("elapsed", 0))
+        metrics.LLM_LATENCY.observe(entry.get("elapsed", 0) if self.replay_latency else 0, call_type=call_type)
+        return entry["response"]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    kind, _, raw = spec.partition(":")
+    args = [float(a) for a in raw.split(",") if a.strip()]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda rng: rng.lognormvariate(0, sigma) * median
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class SyntheticProvider(LLMProvider):
+    name = "synthetic"
+
+    def __init__(self, latency: str = LLM_SYNTHETIC_LATENCY, failure_rate: float = LLM_SYNTHETIC_FAILURE_RATE,
+                 timeout_rate: float = LLM_SYNTHETIC_TIMEOUT_RATE, seed: Optional[str] = LLM_SYNTHETIC_SEED,
+                 first_token: float = LLM_SYNTHETIC_FIRST_TOKEN):
+        self._latency = parse_latency(latency)
+        self.first_token = first_token
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+
+    def _plan(self):
+        with self._lock:
+            delay = max(0.0, self._latency(self._rng))
+            roll = self._rng.random()
+            a, b = self._rng.randint(2, 20), self._rng.randint(2, 20)
+            correct = self._rng.randrange(4)
+        if roll < self.timeout_rate:
+            return delay, "timeout", None
+        if roll < self.timeout_rate + self.failure_rate:
+            return delay, "error", None
+        return delay, None, (a, b, correct)
+
+    @staticmethod
+    def _response(call_type: str, numbers) -> str:
+        if call_type == "topic":
+            return "Арифметика"
+        if call_type == "classify":
+            return "Математика"
+        a, b, correct = numbers
+        answers = [a + b + shift for shift in (-2, -1, 1, 2)]
+        answers.insert(correct, a + b)
+        answers = answers[:4]
+        lines = [f"ПИТАННЯ: Обчисліть {a} + {b}"]
+        lines += [f"{chr(97 + i)}) {value}" for i, value in enumerate(answers)]
+        lines.append(f"ПРАВИЛЬНА: {chr(97 + correct)}")
+        return "\n".join(lines)
+
+    def _finish(self, call_type, delay, failure, numbers) -> Optional[str]:
+        metrics.LLM_LATENCY.observe(delay, call_type=call_type)
+        if failure is not None:
+            metrics.LLM_ERRORS.inc(call_type=call_type, kind=failure)
+            return None
+        return self._response(call_type, numbers)
+
+    def complete(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        delay, failure, numbers = self._plan()
+        time.sleep(delay)
+        return self._finish(call_type, delay, failure, numbers)
+
+    async def complete_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        delay, failure, numbers = self._plan()
+        await asyncio.sleep(delay)
+        return self._finish(call_type, delay, failure, numbers)
+
+    async def stream_async(self, messages, temperature, max_tokens, thinking_enabled, call_type):
+        delay, failure, numbers = self._plan()
+        first = delay * self.first_token
+        await asyncio.sleep(first)
+        response = self._finish(call_type, delay, failure, numbers)
+        if response is None:
+            return
+        lines = response.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            if i:
+                await asyncio.sleep((delay - first) / (len(lines) - 1))
+            yield line
+
+
+def build_provider(name: str, real: LLMProvider, model: str = "") -> LLMProvider:
+    if name == "zai":
+        return real
+    if name == "record":
+        return RecordingProvider(real, model=model)
+    if name == "replay":
+        return ReplayProvider(model=model)
+    if name == "synthetic":
+        return SyntheticProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
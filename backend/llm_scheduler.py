@@ -0,0 +1,285 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DEFAULT: "default", BACKGROUND: "background"}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("ZAI_MAX_CONCURRENCY", "4"))
+LLM_RATE_LIMIT = float(os.getenv("AI_RATE_LIMIT_ZAI") or 0)
+LLM_RATE_BURST = float(os.getenv("AI_RATE_BURST_ZAI") or max(1.0, LLM_RATE_LIMIT))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=DEFAULT)
+
+
+@contextmanager
+def priority(level: int):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class _Ticket:
+    __slots__ = ("priority", "enqueued", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """Grants LLM call slots in priority order, bounded by a concurrency limit
+    and a token bucket. Both threads and coroutines can wait for a slot."""
+
+    def __init__(self, concurrency: int, rate: float, burst: float):
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._timer: Optional[threading.Timer] = None
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _schedule(self, delay: float):
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = threading.Timer(delay, self._dispatch)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _grant(self, ticket: _Ticket):
+        ticket.granted = True
+        self._active += 1
+        metrics.LLM_QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued, priority=PRIORITY_NAMES.get(ticket.priority, ticket.priority))
+        if ticket.event is not None:
+            ticket.event.set()
+        else:
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+
+    def _dispatch(self):
+        with self._lock:
+            while self._heap and self._active < self.concurrency:
+                ticket = self._heap[0][2]
+                if ticket.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._schedule(self._paused_until - now)
+                    return
+                if self.rate > 0:
+                    self._refill(now)
+                    if self._tokens < 1:
+                        self._schedule((1 - self._tokens) / self.rate)
+                        return
+                    self._tokens -= 1
+                heapq.heappop(self._heap)
+                self._grant(ticket)
+
+    def _enqueue(self, ticket: _Ticket):
+        with self._lock:
+            heapq.heappush(self._heap, (ticket.priority, next(self._seq), ticket))
+        self._dispatch()
+
+    def acquire(self, level: Optional[int] = None):
+        ticket = _Ticket(current_priority() if level is None else level)
+        ticket.event = threading.Event()
+        self._enqueue(ticket)
+        ticket.event.wait()
+
+    async def acquire_async(self, level: Optional[int] = None):
+        ticket = _Ticket(current_priority() if level is None else level)
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                ticket.cancelled = True
+                granted = ticket.granted
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            depth: Dict[str, int] = {}
+            for prio, _, ticket in self._heap:
+                if not ticket.cancelled:
+                    name = PRIORITY_NAMES.get(prio, str(prio))
+                    depth[name] = depth.get(name, 0) + 1
+            return {
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "queued": depth,
+                "rate": self.rate,
+                "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    code = _status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    return metrics.is_timeout(error) or isinstance(error, (ConnectionError, OSError)) or "connect" in type(error).__name__.lower()
+
+
+def backoff_delay(attempt: int, error: BaseException) -> float:
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+    hint = retry_after(error)
+    if hint is not None:
+        delay = max(delay, min(hint, LLM_BACKOFF_MAX))
+    return delay
+
+
+_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT, LLM_RATE_BURST)
+metrics.LLM_QUEUE_DEPTH.set_function(lambda: {(name,): count for name, count in _scheduler.stats()["queued"].items()})
+
+
+def _retry_delay(error: BaseException, attempt: int, call_type: str) -> Optional[float]:
+    if attempt >= LLM_MAX_RETRIES or not is_retryable(error):
+        return None
+    delay = backoff_delay(attempt, error)
+    if _status_code(error) == 429:
+        _scheduler.pause(delay)
+    metrics.LLM_RETRIES.inc(call_type=call_type)
+    logger.info("Retrying %s LLM call in %.2fs after %s", call_type, delay, error)
+    return delay
+
+
+def run(fn: Callable[[], Any], call_type: str = "default") -> Any:
+    attempt = 0
+    while True:
+        _scheduler.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, call_type)
+            if delay is None:
+                raise
+        finally:
+            _scheduler.release()
+        time.sleep(delay)
+        attempt += 1
+
+
+async def run_async(fn: Callable[[], Awaitable[Any]], call_type: str = "default") -> Any:
+    attempt = 0
+    while True:
+        await _scheduler.acquire_async()
+        try:
+            return await fn()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, call_type)
+            if delay is None:
+                raise
+        finally:
+            _scheduler.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def stream_async(open_stream: Callable[[], AsyncIterator[Any]], call_type: str = "default") -> AsyncIterator[Any]:
+    """Holds a slot for the whole stream. Only failures before the first chunk
+    are retried, since chunks already forwarded cannot be taken back."""
+    attempt = 0
+    while True:
+        await _scheduler.acquire_async()
+        started = False
+        try:
+            async for chunk in open_stream():
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            delay = None if started else _retry_delay(e, attempt, call_type)
+            if delay is None:
+                raise
+        finally:
+            _scheduler.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    return _scheduler.stats()
@@ -1,30 +1,87 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.background import BackgroundTask
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 import jwt
-import bcrypt
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
 import sqlalchemy
 
-from database import get_db, engine
+from app_logging import setup_logging
+from database import get_db, get_async_db, engine, run_in_worker, AsyncSessionLocal, SessionLocal
 import models
 import schemas
-from ai import classify_test_category, identify_math_topic, generate_test_variation
-
-try:
+from ai import identify_math_topic, generate_test_variation, variant_header
+import analytics
+import classification
+import llm_cache
+import llm_scheduler
+import metrics
+import migrate
+import passwords
+import principal_cache
+import question_bank
+import question_import
+import repository
+import response_cache
+import snapshots
+import variant_gc
+import variation_jobs
+import zai_http
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+def init_db():
     inspector = sqlalchemy.inspect(engine)
     if not inspector.has_table("users"):
         models.Base.metadata.create_all(bind=engine)
-        print("Tables created successfully")
+        logger.info("Tables created successfully")
     else:
-        print("Tables already exist, skipping creation")
-except Exception as e:
-    print(f"Error checking/creating tables: {str(e)}")
+        missing_tables = [t for name, t in models.Base.metadata.tables.items() if not inspector.has_table(name)]
+        if missing_tables:
+            models.Base.metadata.create_all(bind=engine, tables=missing_tables)
+            logger.info("Created missing tables: %s", ", ".join(t.name for t in missing_tables))
+        else:
+            logger.info("Tables already exist, skipping creation")
+    migrate.run_migrations()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs before the background workers start; a failed migration aborts startup
+    # instead of serving queries against a schema the models do not match.
+    try:
+        init_db()
+    except Exception as e:
+        logger.error("Error checking/creating tables: %s", e)
+        raise
+    passwords.start()
+    await zai_http.start()
+    question_bank.start_worker()
+    variation_jobs.start_workers()
+    classification.start_worker()
+    variant_gc.start_collector()
+    yield
+    passwords.shutdown()
+    variant_gc.stop_collector()
+    classification.stop_worker()
+    variation_jobs.stop_workers()
+    question_bank.stop_worker()
+    await zai_http.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 app.add_middleware(
@@ -33,6 +90,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 SECRET_KEY = "your-secret-key"
@@ -42,11 +100,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await passwords.check_password_async(plain_password, hashed_password)
+    except passwords.PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Authentication is busy, try again", headers={"Retry-After": "1"})
 
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def get_password_hash(password):
+    try:
+        return await passwords.hash_password_async(password)
+    except passwords.PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Authentication is busy, try again", headers={"Retry-After": "1"})
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -58,7 +122,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -71,20 +135,34 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = principal_cache.lookup(username)
+    if user is not None:
+        return user
+    generation = principal_cache.generation(username)
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    principal_cache.remember(username, user, payload.get("exp"), generation)
     return user
 
 @app.post("/login", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+    user = result.scalars().first()
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if passwords.needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await passwords.hash_password_async(form_data.password)
+            await db.commit()
+            principal_cache.invalidate(user.username)
+        except passwords.PasswordPoolBusy:
+            pass
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -92,277 +170,440 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/register", response_model=schemas.UserResponse)
-async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    principal_cache.invalidate(db_user.username)
     return db_user
 
 @app.get("/protected", response_model=schemas.UserResponse)
 async def protected_route(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/auth/cache/stats")
+async def get_principal_cache_stats(current_user: models.User = Depends(get_current_user)):
+    return principal_cache.cache_stats()
+
+@app.get("/auth/passwords/stats")
+async def get_password_pool_stats(current_user: models.User = Depends(get_current_user)):
+    return passwords.pool_stats()
+
+@app.get("/ai/scheduler/stats")
+async def get_llm_scheduler_stats(current_user: models.User = Depends(get_current_user)):
+    return llm_scheduler.scheduler_stats()
+
+@app.get("/ai/cache/stats")
+async def get_llm_cache_stats(current_user: models.User = Depends(get_current_user)):
+    return llm_cache.cache_stats()
+
+@app.get("/responses/cache/stats")
+async def get_response_cache_stats(current_user: models.User = Depends(get_current_user)):
+    return response_cache.cache_stats()
+
 @app.get("/tests", response_model=List[schemas.Test])
-async def get_tests(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    tests = db.query(models.Test).filter(
+async def get_tests(request: Request, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    key = response_cache.tests_key(current_user.id)
+    entry = response_cache.lookup(key)
+    if entry is not None:
+        return response_cache.respond(request, entry, "tests", hit=True)
+    generation = response_cache.generation(key)
+    result = await db.execute(select(models.Test).where(
         models.Test.user_id == current_user.id, 
         models.Test.is_student_only == False,
         models.Test.template_id == None
-    ).all()
-    return tests
+    ))
+    tests = [schemas.Test.from_orm(t) for t in result.scalars().all()]
+    entry = response_cache.remember(key, tests, generation)
+    return response_cache.respond(request, entry, "tests", hit=False)
 
 @app.post("/tests", response_model=schemas.Test)
-async def create_test(test: schemas.TestCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_test(test: schemas.TestCreate, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     db_test = models.Test(**test.dict(), user_id=current_user.id)
+    classification.mark_dirty(db_test)
     db.add(db_test)
-    db.commit()
-    db.refresh(db_test)
+    await db.commit()
+    await db.refresh(db_test)
+    response_cache.invalidate_tests(user_id=current_user.id)
     
-    test_data = {
-        "title": db_test.title,
-        "description": db_test.description,
-    }
+    return db_test
+
+@app.post("/tests/{test_id}/publish", response_model=schemas.Test)
+async def publish_test(test_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.Test).where(models.Test.id == test_id, models.Test.user_id == current_user.id))
+    test = result.scalars().first()
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found or not authorized to publish this test")
     
-    category = classify_test_category(test_data)
+    if test.classify_requested_at is not None or test.classified_revision != test.content_revision:
+        with llm_scheduler.priority(llm_scheduler.INTERACTIVE):
+            await run_in_worker(classification.classify_test, test.id)
+        await db.refresh(test)
     
-    if category:
-        db_test.category = category[:100]
-        db.commit()
-        db.refresh(db_test)
+    return test
+
+@app.get("/tests/{test_id}/definition", response_model=schemas.TestWithQuestions)
+async def get_test_definition(test_id: int, request: Request, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.Test.user_id, models.Test.content_revision).where(models.Test.id == test_id))
+    row = result.first()
+    if not row or row.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Test not found or not authorized to access this test")
     
-    return db_test
+    key = response_cache.test_key(test_id)
+    entry = response_cache.lookup(key, row.content_revision)
+    if entry is not None:
+        return response_cache.respond(request, entry, "test_definition", hit=True)
+    generation = response_cache.generation(key)
+    test = await repository.get_test_tree_async(db, test_id)
+    if test is None:
+        raise HTTPException(status_code=404, detail="Test not found")
+    entry = response_cache.remember(key, schemas.TestWithQuestions.from_orm(test), generation, revision=test.content_revision)
+    return response_cache.respond(request, entry, "test_definition", hit=False)
 
 @app.get("/tests/{test_id}", response_model=schemas.TestWithQuestions)
 async def get_test(test_id: int, generate_new: bool = False, db: Session = Depends(get_db)):
-    print(f"DEBUG:get_test called with test_id={test_id}, generate_new={generate_new}")
-    test = db.query(models.Test).filter(models.Test.id == test_id).first()
+    with llm_scheduler.priority(llm_scheduler.INTERACTIVE):
+        return await run_in_worker(_get_test, test_id, generate_new, db)
+
+def _get_test(test_id: int, generate_new: bool, db: Session):
+    logger.debug("get_test called", extra={"test_id": test_id, "generate_new": generate_new})
+    test = repository.get_test_tree(db, test_id)
     if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     
+    # Classification belongs to the debounced worker and to publish; a
+    # student load never waits on the LLM for it.
+    test_data = repository.test_payload(test)
+    logger.debug("assembling variant", extra={"template_id": test.id, "category": test.category})
+    new_test_data = question_bank.assemble_variant(db, test, test_data)
+    return _save_variant(db, test, new_test_data)
+
+def _save_variant(db: Session, test: models.Test, new_test_data: Dict):
+    new_test = repository.save_test_tree(db, {
+        "title": new_test_data.get("title", f"{test.title} (Вариант)"),
+        "description": new_test_data.get("description", (test.description or "") + "\n(Автоматически сгенерированный вариант)"),
+        "category": new_test_data.get("category", test.category),
+        "user_id": test.user_id if hasattr(test, "user_id") else None,
+        "is_template": False,
+        "template_id": test.id,
+        "is_student_only": True
+    }, new_test_data.get("questions", []))
+    logger.info("variant created", extra={"test_id": new_test.id, "template_id": test.id})
+    return schemas.TestWithQuestions.from_orm(new_test)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+def _draw_variant(test_id: int, db: Session):
+    test = repository.get_test_tree(db, test_id)
+    if test is None:
+        raise HTTPException(status_code=404, detail="Test not found")
+    test_data = repository.test_payload(test)
+    question_ids = [q.id for q in test.questions]
+    drawn = question_bank.take_questions(db, question_ids)
+    return test_data, drawn, question_ids
+
+def _finish_variant(test_id: int, test_data: Dict, drawn: List[Dict]):
+    db = SessionLocal()
     try:
-        if not test.category or test.category != "Математика":
-            test_data_for_cls = {
-                "title": test.title,
-                "description": test.description,
-                "questions": [
-                    {
-                        "text": q.text,
-                        "topic": q.topic,
-                        "options": [
-                            {"text": o.text, "is_correct": o.is_correct}
-                            for o in q.options
-                        ],
-                    }
-                    for q in test.questions
-                ],
-            }
-            new_category = classify_test_category(test_data_for_cls)
-            if new_category and new_category == "Математика":
-                test.category = new_category[:100]
-                db.commit()
-                db.refresh(test)
-    except Exception as _e:
-        pass
-
-    test_data = {
-        "title": test.title,
-        "description": test.description,
-        "category": test.category,
-        "questions": [
-            {
-                "text": q.text,
-                "topic": q.topic,
-                "options": [
-                    {"text": o.text, "is_correct": o.is_correct}
-                    for o in q.options
-                ]
-            }
-            for q in test.questions
-        ]
-    }
-
-    print(f"DEBUG:generating variant for template test_id={test.id}, category={test.category}")
-    new_test_data = generate_test_variation(test_data)
-    print("DEBUG:variant data prepared, creating DB rows")
-
-    new_test = models.Test(
-        title=new_test_data.get("title", f"{test.title} (Вариант)"),
-        description=new_test_data.get("description", (test.description or "") + "\n(Автоматически сгенерированный вариант)"),
-        category=new_test_data.get("category", test.category),
-        user_id=test.user_id if hasattr(test, "user_id") else None,
-        is_template=False,
-        template_id=test.id,
-        is_student_only=True
+        test = db.get(models.Test, test_id)
+        new_test_data = variant_header(test_data)
+        new_test_data["questions"] = drawn
+        variant = _save_variant(db, test, new_test_data)
+    finally:
+        db.close()
+    question_bank.request_refill(test_id)
+    return variant
+
+class _VariantDraw:
+    """Bank items taken for one streamed variant. They are deleted from the
+    bank when drawn, so unless the variant holding them gets saved they have
+    to be put back: after a disconnect, a failed save, or a stream that never
+    started."""
+
+    def __init__(self, test_id: int, test_data: Dict, drawn: List, question_ids: List[int]):
+        self.test_id = test_id
+        self.test_data = test_data
+        self.drawn = drawn
+        self.banked = [(qid, item) for qid, item in zip(question_ids, drawn) if item is not None]
+        self.saving: Optional[asyncio.Future] = None
+        self._releasing: Optional[asyncio.Future] = None
+
+    def save(self) -> asyncio.Future:
+        self.saving = asyncio.ensure_future(run_in_worker(_finish_variant, self.test_id, self.test_data, self.drawn))
+        return self.saving
+
+    async def _release(self):
+        if self.saving is not None:
+            await asyncio.wait([self.saving])
+            if not self.saving.cancelled() and self.saving.exception() is None:
+                return
+        if self.banked:
+            await run_in_worker(question_bank.return_questions, self.banked)
+
+    async def release(self):
+        # Called from both the generator and the response's background task;
+        # whichever comes first does the work, and a cancelled caller does not
+        # cut it short.
+        if self._releasing is None:
+            self._releasing = asyncio.ensure_future(self._release())
+        await asyncio.shield(self._releasing)
+
+async def _stream_variant(draw: _VariantDraw):
+    try:
+        with llm_scheduler.priority(llm_scheduler.INTERACTIVE):
+            yield _sse("variant", {"title": draw.test_data["title"], "count": len(draw.drawn)})
+            async for event in question_bank.stream_variant(draw.test_data, draw.drawn):
+                yield _sse(event.pop("type"), event)
+        variant = await asyncio.shield(draw.save())
+    finally:
+        await draw.release()
+    yield _sse("done", variant)
+
+@app.get("/tests/{test_id}/variant/stream")
+async def stream_test_variant(test_id: int, db: Session = Depends(get_db)):
+    draw = _VariantDraw(test_id, *await run_in_worker(_draw_variant, test_id, db))
+    return StreamingResponse(
+        _stream_variant(draw),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(draw.release),
     )
-    db.add(new_test)
-    db.commit()
-    db.refresh(new_test)
-
-    for q_data in new_test_data.get("questions", []):
-        question = models.Question(
-            text=q_data.get("text", ""),
-            topic=q_data.get("topic"),
-            test_id=new_test.id
-        )
-        db.add(question)
-        db.commit()
-        db.refresh(question)
-
-        for o_data in q_data.get("options", []):
-            option = models.Option(
-                text=o_data.get("text", ""),
-                is_correct=o_data.get("is_correct", False),
-                question_id=question.id
-            )
-            db.add(option)
-
-    db.commit()
-    db.refresh(new_test)
-    print(f"DEBUG:variant created new_test_id={new_test.id} from template_id={test.id}")
-    return new_test
 
 @app.delete("/tests/{test_id}")
-async def delete_test(test_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    test = db.query(models.Test).filter(models.Test.id == test_id, models.Test.user_id == current_user.id).first()
+async def delete_test(test_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.Test).where(models.Test.id == test_id, models.Test.user_id == current_user.id))
+    test = result.scalars().first()
     if not test:
         raise HTTPException(status_code=404, detail="Test not found or not authorized to delete this test")
     
-    db.delete(test)
-    db.commit()
+    await db.delete(test)
+    await db.commit()
+    response_cache.invalidate_tests(user_id=current_user.id, test_id=test_id)
     
     return {"message": "Test deleted successfully"}
 
 @app.post("/test-results", response_model=schemas.TestResult)
-async def create_test_result(test_result: schemas.TestResultCreate, db: Session = Depends(get_db)):
+async def create_test_result(test_result: schemas.TestResultCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        test = db.query(models.Test).filter(models.Test.id == test_result.test_id).first()
+        test = await repository.get_test_tree_async(db, test_result.test_id)
         
         test_result_dict = test_result.dict()
+        test_result_dict.pop("questions_snapshot", None)
         
         if test:
-            questions = db.query(models.Question).filter(models.Question.test_id == test.id).all()
-            questions_snapshot = []
-            for q in questions:
-                options = db.query(models.Option).filter(models.Option.question_id == q.id).all()
-                questions_snapshot.append({
-                    "id": q.id,
-                    "text": q.text,
-                    "topic": q.topic,
-                    "options": [{"id": o.id, "text": o.text, "is_correct": o.is_correct} for o in options]
-                })
-            test_result_dict["questions_snapshot"] = questions_snapshot
+            questions_snapshot = repository.questions_snapshot(test.questions)
+            content, snapshot_ids = snapshots.split_ids(questions_snapshot)
+            test_result_dict["snapshot_hash"] = await snapshots.store_snapshot_async(db, content)
+            test_result_dict["snapshot_ids"] = snapshot_ids
         
         if test and test.template_id:
             test_result_dict["test_id"] = test.template_id
             test_result_dict["original_test_id"] = test.template_id
-            print(f"Это вариация теста {test.id}, сохраняем с оригинальным ID: {test.template_id}")
+            logger.debug("Это вариация теста %s, сохраняем с оригинальным ID: %s", test.id, test.template_id)
         else:
             test_result_dict["original_test_id"] = test_result.test_id
-            print(f"Это обычный тест {test_result.test_id}")
+            logger.debug("Это обычный тест %s", test_result.test_id)
         
         db_test_result = models.TestResult(**test_result_dict)
         db.add(db_test_result)
-        db.commit()
-        db.refresh(db_test_result)
+        if test:
+            await analytics.apply_result_async(
+                db, test_result_dict["test_id"], questions_snapshot,
+                test_result.answers, test_result.question_times
+            )
+        await db.commit()
+        await db.refresh(db_test_result)
+        if db_test_result.snapshot_hash:
+            snapshots.mark_stored(db_test_result.snapshot_hash)
         
-        print(f"Результат сохранён: ID={db_test_result.id}, test_id={db_test_result.test_id}, ученик={db_test_result.user_name}, баллы={db_test_result.score}/{db_test_result.max_score}")
+        logger.info("Результат сохранён", extra={"result_id": db_test_result.id, "test_id": db_test_result.test_id, "user_name": db_test_result.user_name, "score": db_test_result.score, "max_score": db_test_result.max_score})
         
         if test and test.template_id:
-            db.delete(test)
-            db.commit()
-            print(f"Вариация теста {test.id} удалена")
+            await db.delete(test)
+            await db.commit()
+            logger.debug("Вариация теста %s удалена", test.id)
         
         return db_test_result
     except Exception as e:
-        print(f"Ошибка при сохранении результата: {str(e)}")
+        logger.exception("Ошибка при сохранении результата: %s", e)
         raise HTTPException(status_code=500, detail=f"Error saving test result: {str(e)}")
 
+RESULT_FIELDS = (
+    "id", "test_id", "original_test_id", "test_title", "user_name", "score", "max_score",
+    "created_at", "total_time", "question_times", "questions_with_answers",
+)
+RESULTS_PAGE_SIZE = 200
+
+def _parse_result_fields(fields: Optional[str]) -> set:
+    if not fields:
+        return set(RESULT_FIELDS)
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - set(RESULT_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+def _result_payload(result: models.TestResult, test_title: str, selected: set, questions_data: Optional[List[Dict]]) -> Dict:
+    payload = {}
+    for field in RESULT_FIELDS:
+        if field not in selected:
+            continue
+        if field == "test_title":
+            payload[field] = test_title
+        elif field == "questions_with_answers":
+            student_answers = result.answers if result.answers else {}
+            logger.debug("Результат %s: %s ответов", result.id, len(student_answers), extra={"sample": "result_answers"})
+            questions_with_answers = []
+            for question_data in questions_data or []:
+                question_id_str = str(question_data["id"])
+                student_answer = student_answers.get(question_id_str)
+                questions_with_answers.append({
+                    "id": question_data["id"],
+                    "text": question_data["text"],
+                    "options": question_data["options"],
+                    "student_answer": student_answer
+                })
+            payload[field] = questions_with_answers
+        else:
+            payload[field] = getattr(result, field)
+    return payload
+
+async def _iter_result_payloads(db: AsyncSession, test_id: int, test_title: str, selected: set, after, limit: Optional[int], state: Dict):
+    with_answers = "questions_with_answers" in selected
+    with_times = "question_times" in selected
+    fallback_questions = None
+    shared_snapshots: Dict[str, List[Dict]] = {}
+    remaining = limit
+    while True:
+        page_size = RESULTS_PAGE_SIZE if remaining is None else min(RESULTS_PAGE_SIZE, remaining)
+        rows = await repository.get_results_page_async(db, test_id, after, page_size + 1, with_answers, with_times)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if with_answers:
+            missing = {row.snapshot_hash for row in rows if row.snapshot_hash and row.snapshot_hash not in shared_snapshots}
+            shared_snapshots.update(await snapshots.load_snapshots_async(db, missing))
+        for row in rows:
+            questions_data = None
+            if with_answers:
+                questions_data = row.questions_snapshot or snapshots.attach_ids(shared_snapshots.get(row.snapshot_hash), row.snapshot_ids)
+                if not questions_data:
+                    if fallback_questions is None:
+                        logger.debug("Результат %s: загружаем вопросы из БД", row.id)
+                        fallback_questions = repository.questions_snapshot(await repository.get_questions_tree_async(db, test_id))
+                    questions_data = fallback_questions
+            yield _result_payload(row, test_title, selected, questions_data)
+            state["count"] = state.get("count", 0) + 1
+        if rows:
+            after = (rows[-1].created_at, rows[-1].id)
+        db.expunge_all()
+        if remaining is not None:
+            remaining -= len(rows)
+        if not has_more:
+            return
+        if remaining == 0:
+            state["next_cursor"] = repository.encode_cursor(*after)
+            return
+
+async def _stream_test_results(test_id: int, test_title: str, selected: set, after, limit: Optional[int]):
+    state: Dict = {}
+    async with AsyncSessionLocal() as db:
+        async for payload in _iter_result_payloads(db, test_id, test_title, selected, after, limit, state):
+            row = schemas.TestResultProjection(**payload).dict(include=selected)
+            yield json.dumps(jsonable_encoder(row), ensure_ascii=False) + "\n"
+    if state.get("next_cursor"):
+        yield json.dumps({"next_cursor": state["next_cursor"]}) + "\n"
+    logger.info("Отправлено %s результатов для теста %s (ndjson)", state.get("count", 0), test_id)
+
 @app.get("/test-results/test/{test_id}", response_model=List[schemas.TestResultWithQuestions])
-async def get_test_results(test_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    print(f"\n=== Получение результатов для теста {test_id} ===")
-    
-    test = db.query(models.Test).filter(models.Test.id == test_id).first()
+async def get_test_results(
+    test_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    test = await db.get(models.Test, test_id)
     if not test:
-        print(f"Тест {test_id} не найден")
         raise HTTPException(status_code=404, detail="Test not found")
+    test_title = test.title
+
+    selected = _parse_result_fields(fields)
+    try:
+        after = repository.decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    results = db.query(models.TestResult).filter(
-        models.TestResult.test_id == test_id
-    ).all()
-    
-    print(f"Найдено {len(results)} результатов для теста {test_id}")
-    for r in results:
-        print(f"  - Результат {r.id}: ученик={r.user_name}, баллы={r.score}/{r.max_score}, has_snapshot={bool(r.questions_snapshot)}")
-    
-    questions = db.query(models.Question).filter(models.Question.test_id == test_id).all()
-    print(f"Найдено {len(questions)} вопросов для теста {test_id}")
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_test_results(test_id, test_title, selected, after, limit),
+            media_type="application/x-ndjson"
+        )
     
-    results_with_questions = []
-    for result in results:
-        student_answers = result.answers if result.answers else {}
-        print(f"  Результат {result.id}: raw answers = {student_answers}")
-        
-        if result.questions_snapshot:
-            print(f"  Результат {result.id}: используем snapshot вопросов")
-            questions_data = result.questions_snapshot
-        else:
-            print(f"  Результат {result.id}: загружаем вопросы из БД")
-            questions_data = [
-                {
-                    "id": q.id,
-                    "text": q.text,
-                    "topic": q.topic,
-                    "options": [{"id": o.id, "text": o.text, "is_correct": o.is_correct} for o in db.query(models.Option).filter(models.Option.question_id == q.id).all()]
-                }
-                for q in questions
-            ]
-        
-        questions_with_answers = []
-        
-        for question_data in questions_data:
-            question_id_str = str(question_data["id"])
-            student_answer = student_answers.get(question_id_str)
-            print(f"    Вопрос {question_id_str}: student_answer = {student_answer}")
-            question_obj = {
-                "id": question_data["id"],
-                "text": question_data["text"],
-                "options": question_data["options"],
-                "student_answer": student_answer
-            }
-            
-            questions_with_answers.append(question_obj)
-        
-        test_title = test.title if test else "Unknown Test"
-        
-        result_with_questions = {
-            "id": result.id,
-            "test_id": result.test_id,
-            "original_test_id": result.original_test_id,
-            "test_title": test_title,
-            "user_name": result.user_name,
-            "score": result.score,
-            "max_score": result.max_score,
-            "created_at": result.created_at,
-            "total_time": result.total_time,
-            "question_times": result.question_times,
-            "questions_with_answers": questions_with_answers
-        }
-        
-        results_with_questions.append(result_with_questions)
+    state: Dict = {}
+    results_with_questions = [
+        payload async for payload in _iter_result_payloads(db, test_id, test_title, selected, after, limit, state)
+    ]
+    logger.info("Возвращаем %s результатов для теста %s", len(results_with_questions), test_id)
     
-    print(f"Возвращаем {len(results_with_questions)} результатов\n")
+    headers = {"X-Next-Cursor": state["next_cursor"]} if state.get("next_cursor") else {}
+    if fields:
+        projected = [schemas.TestResultProjection(**payload).dict(include=selected) for payload in results_with_questions]
+        return JSONResponse(content=jsonable_encoder(projected), headers=headers)
+    response.headers.update(headers)
     return results_with_questions
 
+@app.get("/tests/{test_id}/statistics", response_model=schemas.TestStatistics)
+async def get_test_statistics(test_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    test = await db.get(models.Test, test_id)
+    if not test or test.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Test not found or not authorized to access this test")
+    result = await db.execute(
+        select(models.QuestionStat)
+        .where(models.QuestionStat.test_id == test_id)
+        .order_by(models.QuestionStat.position)
+    )
+    stats = result.scalars().all()
+    result = await db.execute(
+        select(models.Question.text)
+        .where(models.Question.test_id == test_id)
+        .order_by(models.Question.id)
+    )
+    texts = result.scalars().all()
+    return analytics.dashboard(test_id, stats, texts)
+
+@app.post("/tests/{test_id}/statistics/recompute", response_model=schemas.TestStatistics)
+async def recompute_test_statistics(test_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return await run_in_worker(_recompute_test_statistics, test_id, current_user.id, db)
+
+def _recompute_test_statistics(test_id: int, user_id: int, db: Session):
+    test = db.query(models.Test).filter(models.Test.id == test_id, models.Test.user_id == user_id).first()
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found or not authorized to access this test")
+    analytics.recompute_test(db, test_id)
+    stats = db.query(models.QuestionStat).filter(models.QuestionStat.test_id == test_id).order_by(models.QuestionStat.position).all()
+    texts = [text for (text,) in db.query(models.Question.text).filter(models.Question.test_id == test_id).order_by(models.Question.id).all()]
+    return analytics.dashboard(test_id, stats, texts)
+
 @app.post("/questions", response_model=schemas.Question)
 async def create_question(question: schemas.QuestionCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    test = db.query(models.Test).filter(models.Test.id == question.test_id).first()
-    if not test or test.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to add questions to this test")
+    return await run_in_worker(_create_question, question, current_user.id, db)
+
+def _create_question(question: schemas.QuestionCreate, user_id: int, db: Session):
+    test = _get_owned_test(question.test_id, user_id, db)
     
     topic = None
     if test.category == "Математика" or (not test.category and "математик" in question.text.lower()):
@@ -385,105 +626,95 @@ async def create_question(question: schemas.QuestionCreate, current_user: models
         )
         db.add(db_option)
     
+    repository.bump_revision(db, test.id, [{
+        "text": question.text,
+        "options": [{"text": o.text, "is_correct": o.is_correct} for o in question.options]
+    }])
+    classification.mark_dirty(test)
     db.commit()
     db.refresh(db_question)
+    response_cache.invalidate_tests(user_id=user_id, test_id=test.id)
     
-    questions = db.query(models.Question).filter(models.Question.test_id == test.id).all()
-    
-    if questions:
-        test_data = {
-            "title": test.title,
-            "description": test.description,
-            "questions": [
-                {
-                    "text": q.text,
-                    "options": [{"text": o.text} for o in q.options]
-                }
-                for q in questions
-            ]
-        }
-        
-        category = classify_test_category(test_data)
-        
-        if category and (not test.category or test.category != category):
-            test.category = category
-            db.commit()
-    
-    return db_question
+    return schemas.Question.from_orm(db_question)
+
+def _get_owned_test(test_id: int, user_id: int, db: Session) -> models.Test:
+    test = db.query(models.Test).filter(models.Test.id == test_id).first()
+    if not test or test.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to add questions to this test")
+    return test
+
+@app.post("/tests/{test_id}/questions/import", response_model=schemas.QuestionImportResult)
+async def import_questions(test_id: int, request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    await run_in_worker(_get_owned_test, test_id, current_user.id, db)
+    # Hand the connection back to the pool while the body streams in; the
+    # import re-fetches the test in a fresh transaction.
+    await run_in_worker(db.close)
+    content_type = request.headers.get("content-type")
+    try:
+        questions = await question_import.read_questions(content_type, request.stream())
+    except question_import.InvalidImport as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+
+    try:
+        question_ids = await run_in_worker(
+            question_import.import_questions, db, test_id, questions, question_import.detect_format(content_type)
+        ) if questions else []
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Test not found")
+    response_cache.invalidate_tests(user_id=current_user.id, test_id=test_id)
+    return {"imported": len(question_ids), "question_ids": question_ids}
 
-@app.post("/tests/{test_id}/generate-variation", response_model=schemas.TestWithQuestions)
+@app.post("/tests/{test_id}/generate-variation", response_model=schemas.VariationJob, status_code=status.HTTP_202_ACCEPTED)
 async def generate_test_variation_endpoint(
     test_id: int, 
     current_user: models.User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    from ai import create_test_variation
-    
-    test = db.query(models.Test).filter(models.Test.id == test_id, models.Test.user_id == current_user.id).first()
+    result = await db.execute(select(models.Test).where(models.Test.id == test_id, models.Test.user_id == current_user.id))
+    test = result.scalars().first()
     if not test:
         raise HTTPException(status_code=404, detail="Test not found or not authorized to access this test")
     
-    test.is_template = True
-    db.commit()
-    
-    new_test_id = create_test_variation(
-        source_test_id=test.id,
-        new_test_title=f"{test.title} (Варіація)",
-        user_id=current_user.id,
-        session=db
+    job = await variation_jobs.create_job(db, test, current_user.id)
+    response_cache.invalidate_tests(user_id=current_user.id, test_id=test_id)
+    logger.info("variation job queued", extra={"job_id": job.id, "test_id": test.id})
+    return await variation_jobs.job_payload(db, job)
+
+async def _get_variation_job(job_id: int, user_id: int, db: AsyncSession) -> models.VariationJob:
+    result = await db.execute(select(models.VariationJob).where(models.VariationJob.id == job_id, models.VariationJob.user_id == user_id))
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Variation job not found")
+    return job
+
+@app.get("/variation-jobs/{job_id}", response_model=schemas.VariationJob)
+async def get_variation_job(job_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    job = await _get_variation_job(job_id, current_user.id, db)
+    return await variation_jobs.job_payload(db, job)
+
+async def _stream_variation_job(job_id: int):
+    async for event in variation_jobs.stream_events(job_id):
+        yield _sse(event["type"], event)
+
+@app.get("/variation-jobs/{job_id}/events")
+async def stream_variation_job(job_id: int, current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await _get_variation_job(job_id, current_user.id, db)
+    return StreamingResponse(
+        _stream_variation_job(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    
-    if not new_test_id:
-        raise HTTPException(status_code=500, detail="Failed to generate test variation")
-    
-    new_test = db.query(models.Test).filter(models.Test.id == new_test_id).first()
-    if not new_test:
-        raise HTTPException(status_code=500, detail="Generated test not found")
-    
-    return new_test
 
 def generate_questions_for_variation(test_id: int, new_test_id: int, db: Session):
-    original_test = db.query(models.Test).filter(models.Test.id == test_id).first()
+    original_test = repository.get_test_tree(db, test_id)
     if not original_test:
         return
     
-    test_data = {
-        "title": original_test.title,
-        "description": original_test.description,
-        "category": original_test.category,
-        "questions": [
-            {
-                "text": q.text,
-                "topic": q.topic,
-                "options": [
-                    {"text": o.text, "is_correct": o.is_correct}
-                    for o in q.options
-                ]
-            }
-            for q in original_test.questions
-        ]
-    }
+    test_data = repository.test_payload(original_test)
     
     new_test_data = generate_test_variation(test_data)
     
-    for q_data in new_test_data["questions"]:
-        question = models.Question(
-            text=q_data["text"],
-            topic=q_data["topic"],
-            test_id=new_test_id
-        )
-        db.add(question)
-        db.commit()
-        db.refresh(question)
-        
-        for o_data in q_data["options"]:
-            option = models.Option(
-                text=o_data["text"],
-                is_correct=o_data["is_correct"],
-                question_id=question.id
-            )
-            db.add(option)
-    
+    repository.append_questions(db, new_test_id, new_test_data["questions"])
     db.commit()
 
 if __name__ == "__main__":
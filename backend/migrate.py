@@ -0,0 +1,298 @@
+import sys
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, inspect, null, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.future import Engine as FutureEngine
+
+from database import engine
+import models
+import repository
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(255)),
+    Column("applied_at", DateTime),
+    mysql_charset="utf8mb4",
+)
+
+
+def _columns(connection: Connection, table: str) -> set:
+    return {c["name"] for c in inspect(connection).get_columns(table)}
+
+
+def _indexes(connection: Connection, table: str) -> set:
+    return {ix["name"] for ix in inspect(connection).get_indexes(table)}
+
+
+def _create_index(connection: Connection, index):
+    if index.name in _indexes(connection, index.table.name):
+        logger.debug("Index '%s' already exists", index.name)
+        return
+    index.create(bind=connection)
+    logger.info("Index '%s' created on '%s'", index.name, index.table.name)
+
+
+def m001_results_questions_snapshot(connection: Connection):
+    if "questions_snapshot" in _columns(connection, "results"):
+        logger.debug("Column 'questions_snapshot' already exists")
+        return
+    connection.execute(text("ALTER TABLE results ADD COLUMN questions_snapshot JSON NULL"))
+    logger.info("Column 'questions_snapshot' added to 'results'")
+
+
+def m002_results_snapshot_hash(connection: Connection):
+    models.QuestionSnapshot.__table__.create(bind=connection, checkfirst=True)
+    if "snapshot_hash" in _columns(connection, "results"):
+        logger.debug("Column 'snapshot_hash' already exists")
+        return
+    connection.execute(text("""
+        ALTER TABLE results
+        ADD COLUMN snapshot_hash VARCHAR(64) NULL,
+        ADD INDEX ix_results_snapshot_hash (snapshot_hash),
+        ADD CONSTRAINT fk_results_snapshot_hash_question_snapshots
+            FOREIGN KEY (snapshot_hash) REFERENCES question_snapshots (hash)
+    """))
+    logger.info("Column 'snapshot_hash' added to 'results'")
+
+
+def m003_backfill_snapshots(connection: Connection, batch_size: int = 500):
+    results = models.TestResult.__table__
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(results.c.id, results.c.questions_snapshot)
+            .where(results.c.id > last_id, results.c.questions_snapshot.isnot(None), results.c.snapshot_hash.is_(None))
+            .order_by(results.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for result_id, snapshot in rows:
+            digest = snapshots.store_snapshot(connection, snapshot)
+            connection.execute(
+                update(results)
+                .where(results.c.id == result_id)
+                .values(snapshot_hash=digest, questions_snapshot=null())
+            )
+        connection.commit()
+        last_id = rows[-1][0]
+        migrated += len(rows)
+        logger.info("перенесено %s снимков (последний ID %s)", migrated, last_id)
+    logger.info("Backfilled %s result snapshots", migrated)
+
+
+def m004_hot_query_indexes(connection: Connection):
+    for table in (models.Test.__table__, models.Question.__table__, models.Option.__table__, models.TestResult.__table__):
+        for index in table.indexes:
+            if len(index.columns) > 1:
+                _create_index(connection, index)
+
+
+def m005_tests_classify_requested_at(connection: Connection):
+    if "classify_requested_at" in _columns(connection, "tests"):
+        logger.debug("Column 'classify_requested_at' already exists")
+        return
+    connection.execute(text("""
+        ALTER TABLE tests
+        ADD COLUMN classify_requested_at DATETIME NULL,
+        ADD INDEX ix_tests_classify_requested_at (classify_requested_at)
+    """))
+    logger.info("Column 'classify_requested_at' added to 'tests'")
+
+
+def m006_tests_content_revision(connection: Connection, batch_size: int = 200):
+    columns = _columns(connection, "tests")
+    if "content_revision" not in columns:
+        connection.execute(text("""
+            ALTER TABLE tests
+            ADD COLUMN content_revision INT NOT NULL DEFAULT 0,
+            ADD COLUMN content_fingerprint VARCHAR(64) NULL,
+            ADD COLUMN classified_revision INT NULL
+        """))
+        connection.commit()
+        logger.info("Columns 'content_revision', 'content_fingerprint', 'classified_revision' added to 'tests'")
+    else:
+        logger.debug("Column 'content_revision' already exists")
+
+    tests = models.Test.__table__
+    questions = models.Question.__table__
+    options = models.Option.__table__
+    backfilled = 0
+    last_id = 0
+    while True:
+        test_ids = connection.execute(
+            select(tests.c.id).where(tests.c.id > last_id).order_by(tests.c.id).limit(batch_size)
+        ).scalars().all()
+        if not test_ids:
+            break
+        rows = connection.execute(
+            select(questions.c.test_id, questions.c.id, questions.c.text, options.c.text, options.c.is_correct)
+            .select_from(questions.outerjoin(options, options.c.question_id == questions.c.id))
+            .where(questions.c.test_id.in_(test_ids))
+            .order_by(questions.c.test_id, questions.c.id, options.c.id)
+        ).all()
+        trees = {}
+        for test_id, question_id, question_text, option_text, is_correct in rows:
+            question = trees.setdefault(test_id, {}).setdefault(question_id, {"text": question_text, "options": []})
+            if option_text is not None:
+                question["options"].append({"text": option_text, "is_correct": is_correct})
+        for test_id, tree in trees.items():
+            connection.execute(
+                update(tests)
+                .where(tests.c.id == test_id)
+                .values(content_revision=1, content_fingerprint=repository.extend_fingerprint(None, list(tree.values())))
+            )
+        connection.commit()
+        last_id = test_ids[-1]
+        backfilled += len(trees)
+    logger.info("Backfilled content fingerprints for %s tests", backfilled)
+
+
+def m007_tests_student_created_index(connection: Connection):
+    for index in models.Test.__table__.indexes:
+        if index.name == "ix_tests_student_created":
+            _create_index(connection, index)
+
+
+def m008_results_snapshot_ids(connection: Connection, batch_size: int = 500):
+    if "snapshot_ids" not in _columns(connection, "results"):
+        connection.execute(text("ALTER TABLE results ADD COLUMN snapshot_ids JSON NULL"))
+        connection.commit()
+        logger.info("Column 'snapshot_ids' added to 'results'")
+    else:
+        logger.debug("Column 'snapshot_ids' already exists")
+
+    results = models.TestResult.__table__
+    stored = models.QuestionSnapshot.__table__
+    rekeyed = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(results.c.id, stored.c.snapshot)
+            .select_from(results.join(stored, stored.c.hash == results.c.snapshot_hash))
+            .where(results.c.id > last_id, results.c.snapshot_ids.is_(None))
+            .order_by(results.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for result_id, snapshot in rows:
+            content, ids = snapshots.split_ids(snapshot or [])
+            connection.execute(
+                update(results)
+                .where(results.c.id == result_id)
+                .values(snapshot_hash=snapshots.store_snapshot(connection, content), snapshot_ids=ids)
+            )
+        connection.commit()
+        last_id = rows[-1][0]
+        rekeyed += len(rows)
+        logger.info("перенесено %s снимков без ID (последний ID %s)", rekeyed, last_id)
+
+    referenced = select(results.c.snapshot_hash).where(results.c.snapshot_hash.isnot(None))
+    unreferenced = connection.execute(select(stored.c.hash).where(stored.c.hash.notin_(referenced))).scalars().all()
+    pruned = 0
+    for start in range(0, len(unreferenced), batch_size):
+        batch = unreferenced[start:start + batch_size]
+        pruned += connection.execute(delete(stored).where(stored.c.hash.in_(batch), stored.c.hash.notin_(referenced))).rowcount
+        connection.commit()
+        snapshots.forget(batch)
+    logger.info("Re-keyed %s result snapshots by content, pruned %s unreferenced snapshots", rekeyed, pruned)
+
+
+def m009_drop_redundant_fk_indexes(connection: Connection):
+    # InnoDB gave each foreign key column its own index before the composite
+    # indexes existed. Those are left prefixes of the composites, so the
+    # planner could pick either; the composites now back the foreign keys.
+    for table in (models.Test.__table__, models.Question.__table__, models.Option.__table__, models.TestResult.__table__):
+        declared = {index.name for index in table.indexes}
+        prefixes = {index.columns.keys()[0] for index in table.indexes if len(index.columns) > 1}
+        for index in inspect(connection).get_indexes(table.name):
+            columns = index["column_names"]
+            if index["name"] in declared or len(columns) != 1 or columns[0] not in prefixes:
+                continue
+            connection.execute(text(f"DROP INDEX `{index['name']}` ON `{table.name}`"))
+            logger.info("Index '%s' dropped from '%s'", index["name"], table.name)
+
+
+def m010_variation_job_lease(connection: Connection):
+    columns = _columns(connection, "variation_jobs")
+    if "worker" in columns:
+        logger.debug("Column 'worker' already exists")
+        return
+    connection.execute(text("ALTER TABLE variation_jobs ADD COLUMN worker VARCHAR(100) NULL"))
+    connection.execute(text("ALTER TABLE variation_jobs ADD COLUMN heartbeat_at DATETIME NULL"))
+    logger.info("Columns 'worker', 'heartbeat_at' added to 'variation_jobs'")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "results_questions_snapshot", m001_results_questions_snapshot),
+    (2, "results_snapshot_hash", m002_results_snapshot_hash),
+    (3, "backfill_snapshots", m003_backfill_snapshots),
+    (4, "hot_query_indexes", m004_hot_query_indexes),
+    (5, "tests_classify_requested_at", m005_tests_classify_requested_at),
+    (6, "tests_content_revision", m006_tests_content_revision),
+    (7, "tests_student_created_index", m007_tests_student_created_index),
+    (8, "results_snapshot_ids", m008_results_snapshot_ids),
+    (9, "drop_redundant_fk_indexes", m009_drop_redundant_fk_indexes),
+    (10, "variation_job_lease", m010_variation_job_lease),
+]
+
+
+def applied_versions(connection: Connection) -> set:
+    schema_migrations.create(bind=connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars().all())
+
+
+def run_migrations(bind=engine) -> int:
+    if not isinstance(bind, FutureEngine):
+        raise TypeError("run_migrations needs an engine created with future=True")
+    applied = 0
+    with bind.connect() as connection:
+        done = applied_versions(connection)
+        connection.commit()
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("Applying migration %03d %s", version, name)
+            try:
+                migrate(connection)
+                connection.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            applied += 1
+    if applied:
+        logger.info("Applied %s migration(s)", applied)
+    return applied
+
+
+def status(bind=engine):
+    with bind.connect() as connection:
+        done = applied_versions(connection)
+        connection.commit()
+    for version, name, _ in MIGRATIONS:
+        print(f"{'✓' if version in done else ' '} {version:03d} {name}")
+
+
+if __name__ == "__main__":
+    from app_logging import setup_logging
+
+    setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        run_migrations()
+    elif command == "status":
+        status()
+    else:
+        print("Usage: python migrate.py [up|status]")
+        sys.exit(1)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Float, JSON, MetaData
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Text, DateTime, Float, JSON, MetaData, UniqueConstraint
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -25,7 +25,11 @@ class User(Base):
 
 class Test(Base):
     __tablename__ = "tests"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_tests_user_student_template", "user_id", "is_student_only", "template_id"),
+        Index("ix_tests_student_created", "is_student_only", "created_at"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255))
@@ -38,15 +42,23 @@ class Test(Base):
     template_id = Column(Integer, ForeignKey("tests.id"), nullable=True)
     category = Column(String(100), nullable=True)
     is_student_only = Column(Boolean, default=False)
+    classify_requested_at = Column(DateTime, nullable=True, index=True)
+    content_revision = Column(Integer, default=0, nullable=False)
+    content_fingerprint = Column(String(64), nullable=True)
+    classified_revision = Column(Integer, nullable=True)
     
     user = relationship("User", back_populates="tests")
-    questions = relationship("Question", back_populates="test", cascade="all, delete-orphan")
+    questions = relationship("Question", back_populates="test", cascade="all, delete-orphan", order_by="Question.id")
     results = relationship("TestResult", back_populates="test", cascade="all, delete-orphan")
+    question_stats = relationship("QuestionStat", back_populates="test", cascade="all, delete-orphan", order_by="QuestionStat.position")
     template = relationship("Test", remote_side=[id], backref=backref("variations", lazy="dynamic"), foreign_keys=[template_id])
 
 class Question(Base):
     __tablename__ = "questions"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_questions_test_id_id", "test_id", "id"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text)
@@ -54,11 +66,15 @@ class Question(Base):
     topic = Column(String(255), nullable=True)
     
     test = relationship("Test", back_populates="questions")
-    options = relationship("Option", back_populates="question", cascade="all, delete-orphan")
+    options = relationship("Option", back_populates="question", cascade="all, delete-orphan", order_by="Option.id")
+    bank_items = relationship("QuestionBankItem", back_populates="source_question", cascade="all, delete-orphan")
 
 class Option(Base):
     __tablename__ = "options"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_options_question_id_id", "question_id", "id"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text)
@@ -69,7 +85,10 @@ class Option(Base):
 
 class TestResult(Base):
     __tablename__ = "results"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_results_test_created_id", "test_id", "created_at", "id"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     test_id = Column(Integer, ForeignKey("tests.id"))
@@ -82,6 +101,69 @@ class TestResult(Base):
     total_time = Column(Integer, nullable=True)
     original_test_id = Column(Integer, nullable=True)
     questions_snapshot = Column(JSON, nullable=True)
+    snapshot_hash = Column(String(64), ForeignKey("question_snapshots.hash"), nullable=True, index=True)
+    snapshot_ids = Column(JSON, nullable=True)
     
     test = relationship("Test", back_populates="results")
 
+class QuestionBankItem(Base):
+    __tablename__ = "question_bank"
+    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_question_id = Column(Integer, ForeignKey("questions.id"), index=True)
+    text = Column(Text)
+    topic = Column(String(255), nullable=True)
+    options = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    source_question = relationship("Question", back_populates="bank_items")
+
+class QuestionSnapshot(Base):
+    __tablename__ = "question_snapshots"
+    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+
+    hash = Column(String(64), primary_key=True)
+    snapshot = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QuestionStat(Base):
+    __tablename__ = "question_stats"
+    __table_args__ = (
+        UniqueConstraint("test_id", "position", name="uq_question_stats_test_position"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
+    position = Column(Integer, nullable=False)
+    attempts = Column(Integer, default=0)
+    answered = Column(Integer, default=0)
+    correct = Column(Integer, default=0)
+    option_counts = Column(JSON)
+    time_histogram = Column(JSON)
+    time_count = Column(Integer, default=0)
+    time_total = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    test = relationship("Test", back_populates="question_stats")
+
+class VariationJob(Base):
+    __tablename__ = "variation_jobs"
+    __table_args__ = (
+        Index("ix_variation_jobs_status_id", "status", "id"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id", ondelete="CASCADE"), nullable=False)
+    new_test_id = Column(Integer, ForeignKey("tests.id", ondelete="SET NULL"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(String(20), default="queued")
+    total = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,249 @@
+import os
+import re
+import ast
+import random
+import logging
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_VARIANTS_ENABLED = os.getenv("NUMERIC_VARIANTS_ENABLED", "1") not in ("0", "false", "False")
+NUMERIC_VARIANT_ATTEMPTS = int(os.getenv("NUMERIC_VARIANT_ATTEMPTS", "50"))
+
+VARIANTS = metrics.Counter("numeric_variants_total", "Question variants by generation path.", ("result",))
+
+NUMBER = r"\d+(?:[.,]\d+)?"
+_EXPRESSION = re.compile(rf"[(\s]*-?{NUMBER}(?:\s*[-+*/×·:÷^]\s*[(\s]*-?{NUMBER}[)\s]*)+[)]*")
+_PERCENT = re.compile(rf"({NUMBER})\s*%\s*(?:від|вiд|от|of|числа)?\s*(?:числа\s*)?({NUMBER})", re.I)
+_NUMBER = re.compile(NUMBER)
+_OPERATORS = {"×": "*", "·": "*", "÷": "/", ":": "/", "^": "**"}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _to_fraction(text: str) -> Fraction:
+    return Fraction(text.replace(",", "."))
+
+
+def _evaluate(node) -> Fraction:
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return Fraction(str(node.value))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp):
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Div):
+            if right == 0:
+                raise _Unsupported("division by zero")
+            return left / right
+        if isinstance(node.op, ast.Pow) and right.denominator == 1 and 0 <= right <= 4:
+            return left ** int(right)
+    raise _Unsupported(ast.dump(node))
+
+
+def evaluate(expression: str) -> Fraction:
+    source = expression.replace(",", ".")
+    for symbol, operator in _OPERATORS.items():
+        source = source.replace(symbol, operator)
+    try:
+        return _evaluate(ast.parse(source.strip(), mode="eval"))
+    except SyntaxError:
+        raise _Unsupported(expression)
+
+
+def parse_answer(text: str) -> Optional[Tuple[Fraction, str]]:
+    value = text.strip().rstrip(".").replace(" ", "")
+    suffix = ""
+    if value.endswith("%"):
+        value, suffix = value[:-1], "%"
+    if re.fullmatch(r"-?\d+/\d+", value):
+        numerator, denominator = value.split("/")
+        if int(denominator) == 0:
+            return None
+        return Fraction(int(numerator), int(denominator)), "fraction" + suffix
+    if re.fullmatch(rf"-?{NUMBER}", value):
+        places = len(re.split(r"[.,]", value)[1]) if re.search(r"[.,]", value) else 0
+        separator = "," if "," in value else "."
+        return _to_fraction(value), f"decimal:{places}:{separator}{suffix}"
+    return None
+
+
+def format_answer(value: Fraction, style: str) -> Optional[str]:
+    suffix = "%" if style.endswith("%") else ""
+    style = style.rstrip("%")
+    if style == "fraction":
+        if value.denominator == 1:
+            return f"{value.numerator}{suffix}"
+        return f"{value.numerator}/{value.denominator}{suffix}"
+    _, places, separator = style.split(":")
+    places = int(places)
+    scaled = value * 10 ** places
+    if scaled.denominator != 1:
+        return None
+    if places == 0:
+        return f"{value.numerator}{suffix}"
+    text = f"{float(value):.{places}f}"
+    return text.replace(".", separator) + suffix
+
+
+def _minimal_format(value: Fraction, style: str, max_places: int = 3) -> Optional[str]:
+    suffix = "%" if style.endswith("%") else ""
+    separator = "," if style.rstrip("%").endswith(",") else "."
+    for places in range(max_places + 1):
+        text = format_answer(value, f"decimal:{places}:{separator}{suffix}")
+        if text is not None:
+            return text
+    return None
+
+
+def _shared_styles(styles: List[str], texts: List[str]) -> List[str]:
+    """Gives every option the notation the question is written in. A bare
+    integer option parses as "decimal:0:." and would otherwise print a new
+    non-integer value with "." next to "," siblings, or as a decimal among
+    fractions."""
+    separator = "," if any(re.search(r"\d,\d", t) for t in texts) else "."
+    fractions = any(s.rstrip("%") == "fraction" for s in styles)
+    shared = []
+    for style in styles:
+        suffix = "%" if style.endswith("%") else ""
+        base = style.rstrip("%")
+        if base == "fraction":
+            shared.append(style)
+        elif fractions and base.startswith("decimal:0:"):
+            shared.append("fraction" + suffix)
+        else:
+            shared.append(f"decimal:{base.split(':')[1]}:{separator}{suffix}")
+    return shared
+
+
+def _perturb(literal: str, rng) -> str:
+    separator = "," if "," in literal else "."
+    whole, _, decimals = literal.replace(",", ".").partition(".")
+    digits = len(whole)
+    low = 10 ** (digits - 1) if digits > 1 else min(2, int(whole) or 1)
+    new_whole = str(rng.randint(low, 10 ** digits - 1))
+    if decimals:
+        new_decimals = str(rng.randint(0, 10 ** len(decimals) - 1)).zfill(len(decimals))[:-1] + str(rng.randint(1, 9))
+        return new_whole + separator + new_decimals
+    return new_whole
+
+
+def _template(question: str, correct: Fraction) -> Optional[Tuple[int, int, str]]:
+    for match in _PERCENT.finditer(question):
+        if _to_fraction(match.group(1)) * _to_fraction(match.group(2)) / 100 == correct:
+            return match.start(), match.end(), "percent"
+    for match in _EXPRESSION.finditer(question):
+        try:
+            if evaluate(match.group(0)) == correct:
+                return match.start(), match.end(), "expression"
+        except (_Unsupported, ZeroDivisionError, ValueError):
+            continue
+    return None
+
+
+def _evaluate_template(text: str, kind: str) -> Fraction:
+    if kind == "percent":
+        match = _PERCENT.search(text)
+        return _to_fraction(match.group(1)) * _to_fraction(match.group(2)) / 100
+    return evaluate(text)
+
+
+def _rewrite(segment: str, rng) -> str:
+    parts = []
+    last = 0
+    for match in _NUMBER.finditer(segment):
+        parts.append(segment[last:match.start()])
+        exponent = segment[:match.start()].rstrip().endswith("^")
+        parts.append(match.group(0) if exponent else _perturb(match.group(0), rng))
+        last = match.end()
+    parts.append(segment[last:])
+    return "".join(parts)
+
+
+def _distractors(correct: Fraction, originals: List[Fraction], styles: List[str], rng) -> Optional[List[str]]:
+    original_correct = originals[0]
+    taken = {correct}
+    values = []
+    for wrong in originals[1:]:
+        candidate = correct + (wrong - original_correct)
+        step = 1
+        while candidate in taken or (candidate < 0 <= original_correct and wrong >= 0):
+            candidate = correct + rng.choice((-1, 1)) * step
+            step += 1
+            if step > 50:
+                return None
+        taken.add(candidate)
+        values.append(candidate)
+    formatted = [format_answer(v, style) or _minimal_format(v, style) for v, style in zip(values, styles[1:])]
+    return None if any(f is None for f in formatted) else formatted
+
+
+def make_variant(question_text: str, options: List[Dict[str, Any]], rng: Any = random) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """Returns a locally generated (text, options) variant, or None when the
+    question is not a numeric template and the LLM has to handle it."""
+    if not NUMERIC_VARIANTS_ENABLED:
+        return None
+    correct_options = [o for o in options if o.get("is_correct")]
+    if len(correct_options) != 1 or len(options) < 2:
+        VARIANTS.inc(result="fallback")
+        return None
+    parsed = [parse_answer(str(o.get("text", ""))) for o in options]
+    if any(p is None for p in parsed):
+        VARIANTS.inc(result="fallback")
+        return None
+    correct_index = options.index(correct_options[0])
+    correct_value, style = parsed[correct_index]
+    template = _template(question_text, correct_value)
+    if template is None:
+        VARIANTS.inc(result="fallback")
+        return None
+
+    start, end, kind = template
+    segment = question_text[start:end]
+    others = [p for i, p in enumerate(parsed) if i != correct_index]
+    originals = [correct_value] + [p[0] for p in others]
+    styles = _shared_styles([style] + [p[1] for p in others], [segment] + [str(o.get("text", "")) for o in options])
+    style = styles[0]
+    whole_numbers = correct_value.denominator == 1 and not re.search(r"\d[.,]\d", segment)
+    for _ in range(NUMERIC_VARIANT_ATTEMPTS):
+        new_segment = _rewrite(segment, rng)
+        if new_segment == segment:
+            continue
+        try:
+            value = _evaluate_template(new_segment, kind)
+        except (_Unsupported, ZeroDivisionError, ValueError):
+            continue
+        if whole_numbers and value.denominator != 1:
+            continue
+        if correct_value >= 0 > value:
+            continue
+        correct_text = format_answer(value, style) or _minimal_format(value, style)
+        wrong = _distractors(value, originals, styles, rng)
+        if correct_text is None or wrong is None:
+            continue
+        new_options = [{"text": text, "is_correct": False} for text in wrong]
+        new_options.insert(rng.randrange(len(new_options) + 1), {"text": correct_text, "is_correct": True})
+        VARIANTS.inc(result="local")
+        return question_text[:start] + new_segment + question_text[end:], new_options
+
+    VARIANTS.inc(result="fallback")
+    logger.debug("No numeric variant found for %r", question_text[:60])
+    return None
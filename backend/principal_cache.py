@@ -0,0 +1,116 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+import models
+
+load_dotenv()
+
+PRINCIPAL_CACHE_ENABLED = os.getenv("PRINCIPAL_CACHE_ENABLED", "1") not in ("0", "false", "False")
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+USER_FIELDS = ("id", "username")
+
+
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0}
+
+    def generation(self, subject: str) -> int:
+        with self._lock:
+            return self._generations.get(subject, 0)
+
+    def get(self, subject: str) -> Optional[models.User]:
+        with self._lock:
+            item = self._items.get(subject)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, values = item
+            if expires_at < time.time():
+                del self._items[subject]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._items.move_to_end(subject)
+            self._stats["hits"] += 1
+        return models.User(**values)
+
+    def set(self, subject: str, user: models.User, token_expires_at: Optional[float], generation: int):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        values = {field: getattr(user, field) for field in USER_FIELDS}
+        with self._lock:
+            if self._generations.get(subject, 0) != generation:
+                return
+            self._items[subject] = (expires_at, values)
+            self._items.move_to_end(subject)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            self._items.pop(subject, None)
+            self._generations[subject] = self._generations.get(subject, 0) + 1
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._generations.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._items)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "enabled": PRINCIPAL_CACHE_ENABLED,
+            "entries": entries,
+            "hit_rate": (stats["hits"] / lookups) if lookups else 0.0,
+            **stats,
+        }
+
+
+_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+def lookup(subject: str) -> Optional[models.User]:
+    if not PRINCIPAL_CACHE_ENABLED:
+        return None
+    return _cache.get(subject)
+
+
+def generation(subject: str) -> int:
+    return _cache.generation(subject)
+
+
+def remember(subject: str, user: models.User, token_expires_at: Optional[float], generation: int):
+    if PRINCIPAL_CACHE_ENABLED:
+        _cache.set(subject, user, token_expires_at, generation)
+
+
+def invalidate(subject: str):
+    """Drop a cached principal; call on user deletion or password change."""
+    _cache.invalidate(subject)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
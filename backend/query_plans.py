@@ -0,0 +1,54 @@
+import sys
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import mysql
+
+from database import engine
+import models
+import repository
+
+HOT_QUERIES: List[Tuple[str, str, object]] = [
+    (
+        "tests list",
+        "ix_tests_user_student_template",
+        select(models.Test).where(
+            models.Test.user_id == 1,
+            models.Test.is_student_only == False,
+            models.Test.template_id == None,
+        ),
+    ),
+    ("test questions", "ix_questions_test_id_id", repository.questions_tree_stmt(1)),
+    (
+        "question options",
+        "ix_options_question_id_id",
+        select(models.Option).where(models.Option.question_id.in_([1, 2, 3])).order_by(models.Option.id),
+    ),
+    ("results page", "ix_results_test_created_id", repository.results_page_stmt(1, None, 200)),
+]
+
+
+def explain(connection, stmt) -> List[Dict[str, object]]:
+    sql = str(stmt.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+    return [dict(row._mapping) for row in connection.execute(text(f"EXPLAIN {sql}"))]
+
+
+def plan_keys(connection) -> Dict[str, List[object]]:
+    return {name: [row.get("key") for row in explain(connection, stmt)] for name, _, stmt in HOT_QUERIES}
+
+
+def check(bind=engine) -> bool:
+    ok = True
+    with bind.connect() as connection:
+        keys = plan_keys(connection)
+    for name, index, _ in HOT_QUERIES:
+        if index in keys[name]:
+            print(f"✓ {name}: {index}")
+        else:
+            ok = False
+            print(f"✗ {name}: expected {index}, got {keys[name]}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
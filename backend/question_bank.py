@@ -0,0 +1,338 @@
+import os
+import asyncio
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+from database import SessionLocal
+import models
+import repository
+from ai import generate_similar_question, generate_test_variation, identify_math_topic, stream_similar_question, variant_header
+from fanout import fan_out
+import llm_scheduler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BANK_LOW_WATER = int(os.getenv("QUESTION_BANK_LOW_WATER", "5"))
+BANK_TARGET = int(os.getenv("QUESTION_BANK_TARGET", "15"))
+BANK_REFILL_BATCH = int(os.getenv("QUESTION_BANK_REFILL_BATCH", "5"))
+BANK_SCAN_INTERVAL = int(os.getenv("QUESTION_BANK_SCAN_INTERVAL", "300"))
+BANK_ACTIVE_DAYS = int(os.getenv("QUESTION_BANK_ACTIVE_DAYS", "14"))
+BANK_FAILURE_BACKOFF = int(os.getenv("QUESTION_BANK_FAILURE_BACKOFF", "600"))
+BANK_FAILURE_BACKOFF_MAX = int(os.getenv("QUESTION_BANK_FAILURE_BACKOFF_MAX", "86400"))
+
+
+def pool_sizes(db, question_ids: Sequence[int]) -> Dict[int, int]:
+    if not question_ids:
+        return {}
+    rows = (
+        db.query(models.QuestionBankItem.source_question_id, func.count(models.QuestionBankItem.id))
+        .filter(models.QuestionBankItem.source_question_id.in_(list(question_ids)))
+        .group_by(models.QuestionBankItem.source_question_id)
+        .all()
+    )
+    sizes = {qid: 0 for qid in question_ids}
+    sizes.update({qid: count for qid, count in rows})
+    return sizes
+
+
+def take_questions(db, question_ids: Sequence[int]) -> List[Optional[Dict[str, Any]]]:
+    if not question_ids:
+        return []
+    # One locked row per source question. SKIP LOCKED moves a concurrent draw
+    # on to the next free row of the same pool instead of coming back empty.
+    items = []
+    for qid in dict.fromkeys(question_ids):
+        item = (
+            db.query(models.QuestionBankItem)
+            .filter(models.QuestionBankItem.source_question_id == qid)
+            .order_by(models.QuestionBankItem.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if item is not None:
+            items.append(item)
+    by_source = {item.source_question_id: item for item in items}
+    drawn = []
+    for qid in question_ids:
+        item = by_source.get(qid)
+        if item is None:
+            drawn.append(None)
+            continue
+        drawn.append({
+            "text": item.text,
+            "topic": item.topic,
+            "options": [{"text": o.get("text", ""), "is_correct": bool(o.get("is_correct"))} for o in (item.options or [])],
+        })
+    if items:
+        db.query(models.QuestionBankItem).filter(
+            models.QuestionBankItem.id.in_([item.id for item in items])
+        ).delete(synchronize_session=False)
+    db.commit()
+    return drawn
+
+
+def return_questions(items: Sequence[Tuple[int, Dict[str, Any]]]) -> int:
+    """Puts (source question id, item) pairs drawn by take_questions back
+    into the bank, for a variant that was never saved."""
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.QuestionBankItem(source_question_id=qid, text=item["text"], topic=item.get("topic"), options=item["options"])
+            for qid, item in items
+        ])
+        db.commit()
+        return len(items)
+    except Exception as e:
+        db.rollback()
+        logger.error("Error returning %s items to the question bank: %s", len(items), e)
+        return 0
+    finally:
+        db.close()
+
+
+def assemble_variant(db, test, test_data: Dict[str, Any]) -> Dict[str, Any]:
+    questions = test_data.get("questions", [])
+    drawn = take_questions(db, [q.id for q in test.questions])
+    missing = [i for i, item in enumerate(drawn) if item is None]
+    if missing:
+        logger.info("question bank empty for %s/%s questions of test %s, generating live", len(missing), len(drawn), test.id)
+        live = generate_test_variation({**test_data, "questions": [questions[i] for i in missing]})
+        for i, q in zip(missing, live["questions"]):
+            drawn[i] = q
+    request_refill(test.id)
+    new_test = variant_header(test_data)
+    new_test["questions"] = drawn
+    return new_test
+
+
+async def stream_variant(test_data: Dict[str, Any], drawn: List[Optional[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming counterpart of assemble_variant. Bank questions are emitted
+    right away; missing ones are generated concurrently and their partial
+    question/option events are forwarded as the completions arrive. Fills
+    in `drawn` in place."""
+    questions = test_data.get("questions", [])
+    for i, item in enumerate(drawn):
+        if item is not None:
+            yield {"type": "question", "index": i, **item}
+    missing = [i for i, item in enumerate(drawn) if item is None]
+    if not missing:
+        return
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def _generate(i: int):
+        q = questions[i]
+        topic = q.get("topic") or identify_math_topic(q.get("text", ""))
+        try:
+            async for event in stream_similar_question(q.get("text", ""), topic, q.get("options", [])):
+                if event["type"] == "done":
+                    drawn[i] = {"text": event["text"], "topic": topic, "options": event["options"]}
+                else:
+                    await events.put({**event, "type": f"partial_{event['type']}", "index": i})
+        finally:
+            if drawn[i] is None:
+                drawn[i] = {"text": q.get("text", ""), "topic": topic, "options": q.get("options", [])}
+            await events.put({"type": "question", "index": i, **drawn[i]})
+
+    tasks = [asyncio.create_task(_generate(i)) for i in missing]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await events.get()
+            if event["type"] == "question":
+                remaining -= 1
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _generate_item(source: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    text, options = generate_similar_question(source["text"], source["topic"], source["options"])
+    if not options or text == source["text"]:
+        return None
+    return {"text": text, "topic": source["topic"], "options": options}
+
+
+class RefillBackoff:
+    """Source questions whose last refill produced nothing usable. The model
+    keeps echoing some questions back, so their pools never reach the low
+    water mark; each failed round doubles the wait before the next one."""
+
+    def __init__(self, base: int = BANK_FAILURE_BACKOFF, cap: int = BANK_FAILURE_BACKOFF_MAX):
+        self.base = base
+        self.cap = cap
+        self._failures: Dict[int, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def ready(self, question_id: int) -> bool:
+        with self._lock:
+            entry = self._failures.get(question_id)
+        return entry is None or entry[1] <= time.monotonic()
+
+    def record(self, question_id: int, added: int):
+        with self._lock:
+            if added:
+                self._failures.pop(question_id, None)
+                return
+            failures = self._failures.get(question_id, (0, 0.0))[0] + 1
+            delay = min(self.cap, self.base * 2 ** (failures - 1))
+            self._failures[question_id] = (failures, time.monotonic() + delay)
+
+    def failures(self, question_id: int) -> int:
+        with self._lock:
+            return self._failures.get(question_id, (0, 0.0))[0]
+
+
+_backoff = RefillBackoff()
+
+
+def refill_test(test_id: int, low_water: int = BANK_LOW_WATER, target: int = BANK_TARGET) -> int:
+    db = SessionLocal()
+    try:
+        questions = repository.get_questions_tree(db, test_id)
+        sizes = pool_sizes(db, [q.id for q in questions])
+        jobs = []
+        for q in questions:
+            if sizes.get(q.id, 0) >= low_water or not _backoff.ready(q.id):
+                continue
+            source = {
+                "question_id": q.id,
+                "text": q.text,
+                "topic": q.topic or identify_math_topic(q.text),
+                "options": [{"text": o.text, "is_correct": o.is_correct} for o in q.options],
+            }
+            jobs.extend([source] * min(BANK_REFILL_BATCH, target - sizes.get(q.id, 0)))
+        if not jobs:
+            return 0
+
+        results = fan_out(_generate_item, jobs, label=f"bank-refill-{test_id}")
+        added = 0
+        per_question = {source["question_id"]: 0 for source in jobs}
+        for source, result in zip(jobs, results):
+            if not result.ok or not result.value:
+                continue
+            per_question[source["question_id"]] += 1
+            db.add(models.QuestionBankItem(
+                source_question_id=source["question_id"],
+                text=result.value["text"],
+                topic=result.value["topic"],
+                options=result.value["options"],
+            ))
+            added += 1
+        db.commit()
+        for question_id, count in per_question.items():
+            _backoff.record(question_id, count)
+        logger.info("question bank refill for test %s: added %s items", test_id, added)
+        return added
+    except Exception as e:
+        db.rollback()
+        logger.error("Error refilling question bank for test %s: %s", test_id, e)
+        return 0
+    finally:
+        db.close()
+
+
+def _tests_below_low_water(low_water: int = BANK_LOW_WATER, active_days: int = BANK_ACTIVE_DAYS) -> List[int]:
+    """Templates students drew a variant from in the last `active_days`, with
+    at least one question whose pool is under the low water mark. Questions
+    with no bank rows at all (fully drawn pools) count as empty. Drafts and
+    the copies variation jobs make are never drawn from, so they are left to
+    the refill a draw requests."""
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(days=active_days)
+        active = (
+            db.query(models.Test.template_id)
+            .filter(models.Test.is_student_only == True, models.Test.created_at >= since, models.Test.template_id.isnot(None))
+            .distinct()
+            .subquery()
+        )
+        counts = (
+            db.query(models.QuestionBankItem.source_question_id, func.count(models.QuestionBankItem.id).label("n"))
+            .group_by(models.QuestionBankItem.source_question_id)
+            .subquery()
+        )
+        rows = (
+            db.query(models.Question.test_id, models.Question.id)
+            .join(active, active.c.template_id == models.Question.test_id)
+            .outerjoin(counts, counts.c.source_question_id == models.Question.id)
+            .filter(func.coalesce(counts.c.n, 0) < low_water)
+            .all()
+        )
+        return list(dict.fromkeys(test_id for test_id, question_id in rows if _backoff.ready(question_id)))
+    finally:
+        db.close()
+
+
+class RefillWorker:
+    def __init__(self, scan_interval: int = BANK_SCAN_INTERVAL):
+        self.scan_interval = scan_interval
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self, test_id: int):
+        with self._lock:
+            if test_id in self._pending:
+                return
+            self._pending.add(test_id)
+        self._queue.put(test_id)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="question-bank-refill", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                test_id = self._queue.get(timeout=self.scan_interval)
+            except queue.Empty:
+                try:
+                    for tid in _tests_below_low_water():
+                        self.request(tid)
+                except Exception as e:
+                    logger.error("Error scanning question bank: %s", e)
+                continue
+            if test_id is None:
+                continue
+            with self._lock:
+                self._pending.discard(test_id)
+            with llm_scheduler.priority(llm_scheduler.BACKGROUND):
+                refill_test(test_id)
+
+
+_worker = RefillWorker()
+
+
+def request_refill(test_id: int):
+    _worker.request(test_id)
+
+
+def start_worker():
+    _worker.start()
+
+
+def stop_worker():
+    _worker.stop()
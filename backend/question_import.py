@@ -0,0 +1,197 @@
+import os
+import csv
+import json
+import time
+import codecs
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+import metrics
+import models
+import repository
+import schemas
+from ai import identify_math_topic
+import classification
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMPORT_MAX_QUESTIONS = int(os.getenv("IMPORT_MAX_QUESTIONS", "1000"))
+IMPORT_MAX_ERRORS = 50
+
+IMPORTED = metrics.Counter("question_import_questions_total", "Questions inserted by batch imports.", ("format",))
+IMPORT_SECONDS = metrics.Histogram("question_import_duration_seconds", "Batch question import time by phase.", ("format", "phase"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_TYPES = ("text/csv", "application/csv")
+
+
+class InvalidImport(Exception):
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+def detect_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in NDJSON_TYPES:
+        return "ndjson"
+    if media_type in CSV_TYPES:
+        return "csv"
+    return "json"
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, List[str]]]:
+    # A quoted field may contain newlines, so physical lines are joined until
+    # the quotes balance before the record goes to the csv module.
+    record, start, number = "", 0, 0
+    async for line in lines:
+        number += 1
+        if not record:
+            start = number
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        if record.strip():
+            yield start, next(csv.reader([record]))
+        record = ""
+    if record.strip():
+        yield start, next(csv.reader([record]))
+
+
+def csv_item(header: List[str], row: List[str]) -> Dict[str, Any]:
+    """Maps a CSV row onto the import schema. Columns are text, an optional
+    topic, any number of option columns (option_a, option_1, ...) and correct,
+    holding the letter or 1-based number of the right option."""
+    fields = {name: value.strip() for name, value in zip(header, row)}
+    option_texts = [fields[name] for name in header if name.startswith("option") and fields.get(name)]
+    correct = fields.get("correct", "").lower()
+    if correct.isdigit():
+        correct_index = int(correct) - 1
+    elif len(correct) == 1 and correct.isalpha():
+        correct_index = ord(correct) - 97
+    else:
+        correct_index = -1
+    return {
+        "text": fields.get("text", ""),
+        "topic": fields.get("topic") or None,
+        "options": [{"text": text, "is_correct": i == correct_index} for i, text in enumerate(option_texts)],
+    }
+
+
+async def _iter_items(fmt: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    if fmt == "json":
+        body = b"".join([chunk async for chunk in chunks])
+        try:
+            data = json.loads(body or b"[]")
+        except ValueError as e:
+            raise InvalidImport([{"line": None, "error": f"Invalid JSON: {e}"}])
+        if isinstance(data, dict):
+            data = data.get("questions", [])
+        if not isinstance(data, list):
+            raise InvalidImport([{"line": None, "error": "Expected a list of questions"}])
+        for index, item in enumerate(data, start=1):
+            yield index, item
+    elif fmt == "ndjson":
+        number = 0
+        async for line in _iter_lines(chunks):
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+    else:
+        header = None
+        async for number, row in _iter_csv_records(_iter_lines(chunks)):
+            if header is None:
+                header = [name.strip().lower() for name in row]
+                continue
+            yield number, csv_item(header, row)
+
+
+def _validate(item: Any) -> schemas.QuestionImport:
+    if isinstance(item, Exception):
+        raise ValueError(f"Invalid JSON: {item}")
+    question = schemas.QuestionImport.parse_obj(item)
+    if not question.text.strip():
+        raise ValueError("Question text is empty")
+    if not question.options:
+        raise ValueError("Question has no options")
+    if not any(o.is_correct for o in question.options):
+        raise ValueError("Question has no correct option")
+    return question
+
+
+async def read_questions(content_type: Optional[str], chunks: AsyncIterator[bytes]) -> List[schemas.QuestionImport]:
+    fmt = detect_format(content_type)
+    started = time.perf_counter()
+    questions: List[schemas.QuestionImport] = []
+    errors: List[Dict[str, Any]] = []
+    async for line, item in _iter_items(fmt, chunks):
+        if len(questions) + len(errors) >= IMPORT_MAX_QUESTIONS:
+            raise InvalidImport([{"line": line, "error": f"Too many questions, the limit is {IMPORT_MAX_QUESTIONS}"}])
+        try:
+            questions.append(_validate(item))
+        except (ValidationError, ValueError, TypeError) as e:
+            errors.append({"line": line, "error": str(e)})
+            if len(errors) >= IMPORT_MAX_ERRORS:
+                break
+    if errors:
+        raise InvalidImport(errors)
+    IMPORT_SECONDS.observe(time.perf_counter() - started, format=fmt, phase="parse")
+    return questions
+
+
+def detect_topics(test: models.Test, questions: List[schemas.QuestionImport]) -> List[Optional[str]]:
+    topics = []
+    for question in questions:
+        topic = question.topic
+        if topic is None and (test.category == "Математика" or (not test.category and "математик" in question.text.lower())):
+            topic = identify_math_topic(question.text)
+        topics.append(topic)
+    return topics
+
+
+def import_questions(db, test_id: int, questions: List[schemas.QuestionImport], fmt: str = "json") -> List[int]:
+    """Inserts the whole batch in one transaction and leaves a single deferred
+    classification of the test for the background classifier. The test is
+    loaded here rather than passed in, so the caller need not hold a session
+    open while the upload is read."""
+    started = time.perf_counter()
+    test = db.get(models.Test, test_id)
+    if test is None:
+        raise ValueError(f"Test {test_id} not found")
+    rows = [
+        {"text": q.text, "topic": topic, "options": [o.dict() for o in q.options]}
+        for q, topic in zip(questions, detect_topics(test, questions))
+    ]
+    try:
+        question_ids = repository.append_questions(db, test.id, rows)
+        classification.mark_dirty(test)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    IMPORT_SECONDS.observe(time.perf_counter() - started, format=fmt, phase="insert")
+    IMPORTED.inc(len(question_ids), format=fmt)
+    logger.info("questions imported", extra={"test_id": test.id, "count": len(question_ids), "format": fmt})
+    return question_ids
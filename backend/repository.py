@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer, selectinload
+
+import models
+
+
+def _question_tree():
+    return selectinload(models.Question.options)
+
+
+def _test_tree():
+    return selectinload(models.Test.questions).selectinload(models.Question.options)
+
+
+def test_tree_stmt(test_id: int):
+    return select(models.Test).where(models.Test.id == test_id).options(_test_tree())
+
+
+def questions_tree_stmt(test_id: int):
+    return (
+        select(models.Question)
+        .where(models.Question.test_id == test_id)
+        .options(_question_tree())
+        .order_by(models.Question.id)
+    )
+
+
+def get_test_tree(db: Session, test_id: int) -> Optional[models.Test]:
+    return db.execute(test_tree_stmt(test_id)).scalars().first()
+
+
+def get_questions_tree(db: Session, test_id: int) -> List[models.Question]:
+    return db.execute(questions_tree_stmt(test_id)).scalars().all()
+
+
+async def get_test_tree_async(db: AsyncSession, test_id: int) -> Optional[models.Test]:
+    result = await db.execute(test_tree_stmt(test_id))
+    return result.scalars().first()
+
+
+async def get_questions_tree_async(db: AsyncSession, test_id: int) -> List[models.Question]:
+    result = await db.execute(questions_tree_stmt(test_id))
+    return result.scalars().all()
+
+
+def test_payload(test: models.Test, questions: Optional[List[models.Question]] = None) -> Dict[str, Any]:
+    return {
+        "title": test.title,
+        "description": test.description,
+        "category": test.category,
+        "questions": [
+            {
+                "text": q.text,
+                "topic": q.topic,
+                "options": [
+                    {"text": o.text, "is_correct": o.is_correct}
+                    for o in q.options
+                ]
+            }
+            for q in (test.questions if questions is None else questions)
+        ]
+    }
+
+
+def questions_snapshot(questions: List[models.Question]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": q.id,
+            "text": q.text,
+            "topic": q.topic,
+            "options": [{"id": o.id, "text": o.text, "is_correct": o.is_correct} for o in q.options]
+        }
+        for q in questions
+    ]
+
+
+def question_digest(question: Dict[str, Any]) -> str:
+    raw = json.dumps({
+        "text": question.get("text", ""),
+        "options": [[o.get("text", ""), bool(o.get("is_correct", False))] for o in question.get("options", [])],
+    }, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def extend_fingerprint(fingerprint: Optional[str], questions: List[Dict[str, Any]]) -> Optional[str]:
+    # Questions are append-only, so the fingerprint is a hash chain over them in
+    # insertion order and adding a question never needs the rest of the tree.
+    for question in questions:
+        fingerprint = hashlib.sha256(f"{fingerprint or ''}:{question_digest(question)}".encode("ascii")).hexdigest()
+    return fingerprint
+
+
+def bump_revision(db: Session, test_id: int, questions: List[Dict[str, Any]]) -> int:
+    revision, fingerprint = db.execute(
+        select(models.Test.content_revision, models.Test.content_fingerprint)
+        .where(models.Test.id == test_id)
+        .with_for_update()
+    ).one()
+    revision = (revision or 0) + 1
+    db.execute(
+        update(models.Test)
+        .where(models.Test.id == test_id)
+        .values(content_revision=revision, content_fingerprint=extend_fingerprint(fingerprint, questions))
+    )
+    return revision
+
+
+def append_questions(db: Session, test_id: int, questions: List[Dict[str, Any]]) -> List[int]:
+    if not questions:
+        return []
+    # Lock the test row before reading max(id). Otherwise a concurrent append
+    # to the same test lands in the id > last_id range and gets our options.
+    db.execute(select(models.Test.id).where(models.Test.id == test_id).with_for_update())
+    last_id = db.execute(
+        select(func.max(models.Question.id)).where(models.Question.test_id == test_id)
+    ).scalar() or 0
+    db.execute(insert(models.Question.__table__).values([
+        {"text": q.get("text", ""), "topic": q.get("topic"), "test_id": test_id}
+        for q in questions
+    ]))
+    question_ids = db.execute(
+        select(models.Question.id)
+        .where(models.Question.test_id == test_id, models.Question.id > last_id)
+        .order_by(models.Question.id)
+    ).scalars().all()
+    option_rows = [
+        {"text": o.get("text", ""), "is_correct": o.get("is_correct", False), "question_id": question_id}
+        for question_id, q in zip(question_ids, questions)
+        for o in q.get("options", [])
+    ]
+    if option_rows:
+        db.execute(insert(models.Option.__table__).values(option_rows))
+    bump_revision(db, test_id, questions)
+    return list(question_ids)
+
+
+def save_test_tree(db: Session, test_fields: Dict[str, Any], questions: List[Dict[str, Any]]) -> models.Test:
+    try:
+        new_test = models.Test(**test_fields)
+        db.add(new_test)
+        db.flush()
+        append_questions(db, new_test.id, questions)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return get_test_tree(db, new_test.id)
+
+
+def encode_cursor(created_at: datetime, result_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, result_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    created_at, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    return (datetime.fromisoformat(created_at) if created_at else None), int(result_id)
+
+
+def results_page_stmt(test_id: int, after: Optional[Tuple[Optional[datetime], int]], limit: int, with_answers: bool = True, with_times: bool = True):
+    stmt = select(models.TestResult).where(models.TestResult.test_id == test_id)
+    if after is not None:
+        created_at, result_id = after
+        if created_at is None:
+            stmt = stmt.where(or_(models.TestResult.created_at.isnot(None), models.TestResult.id > result_id))
+        else:
+            stmt = stmt.where(or_(
+                models.TestResult.created_at > created_at,
+                and_(models.TestResult.created_at == created_at, models.TestResult.id > result_id),
+            ))
+    if not with_answers:
+        stmt = stmt.options(defer(models.TestResult.answers), defer(models.TestResult.questions_snapshot), defer(models.TestResult.snapshot_ids))
+    if not with_times:
+        stmt = stmt.options(defer(models.TestResult.question_times))
+    return stmt.order_by(models.TestResult.created_at, models.TestResult.id).limit(limit)
+
+
+async def get_results_page_async(db: AsyncSession, test_id: int, after: Optional[Tuple[Optional[datetime], int]], limit: int, with_answers: bool = True, with_times: bool = True) -> List[models.TestResult]:
+    result = await db.execute(results_page_stmt(test_id, after, limit, with_answers, with_times))
+    return result.scalars().all()
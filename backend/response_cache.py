@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+import metrics
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+
+REQUESTS = metrics.Counter("response_cache_requests_total", "Cached endpoint responses by outcome.", ("cache", "result"))
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    revision: Optional[int] = None
+
+
+def tests_key(user_id: int) -> str:
+    return f"tests:{user_id}"
+
+
+def test_key(test_id: int) -> str:
+    return f"test:{test_id}"
+
+
+def serialize(payload: Any) -> bytes:
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_entry(body: bytes, revision: Optional[int] = None) -> CachedResponse:
+    return CachedResponse(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', revision)
+
+
+class ResponseCache:
+    """Pre-serialized JSON bodies with their ETags. Entries for a test carry
+    the content revision they were built from and miss once it moves on."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def get(self, key: str, revision: Optional[int] = None) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry.revision != revision:
+                self._stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def set(self, key: str, entry: CachedResponse, generation: int):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._generations.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._items)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "entries": entries,
+            "hit_rate": (stats["hits"] / lookups) if lookups else 0.0,
+            **stats,
+        }
+
+
+_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+
+def lookup(key: str, revision: Optional[int] = None) -> Optional[CachedResponse]:
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return _cache.get(key, revision)
+
+
+def generation(key: str) -> int:
+    return _cache.generation(key)
+
+
+def remember(key: str, payload: Any, generation: int, revision: Optional[int] = None) -> CachedResponse:
+    entry = make_entry(serialize(payload), revision)
+    if RESPONSE_CACHE_ENABLED:
+        _cache.set(key, entry, generation)
+    return entry
+
+
+def invalidate_tests(user_id: Optional[int] = None, test_id: Optional[int] = None):
+    """Call after the commit that changed a test, so a concurrent miss cannot
+    re-cache the old rows under the new generation."""
+    if user_id is not None:
+        _cache.invalidate(tests_key(user_id))
+    if test_id is not None:
+        _cache.invalidate(test_key(test_id))
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+def respond(request: Request, entry: CachedResponse, cache: str, hit: bool) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if _matches(request.headers.get("if-none-match"), entry.etag):
+        REQUESTS.inc(cache=cache, result="not_modified")
+        return Response(status_code=304, headers=headers)
+    REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
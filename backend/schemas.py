@@ -20,6 +20,7 @@ class UserResponse(UserBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class OptionBase(BaseModel):
     text: str
@@ -34,6 +35,7 @@ class Option(OptionBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class QuestionBase(BaseModel):
     text: str
@@ -43,6 +45,13 @@ class QuestionCreate(QuestionBase):
     test_id: int
     options: List[OptionCreate]
 
+class QuestionImport(QuestionBase):
+    options: List[OptionCreate]
+
+class QuestionImportResult(BaseModel):
+    imported: int
+    question_ids: List[int]
+
 class Question(QuestionBase):
     id: int
     test_id: int
@@ -50,6 +59,7 @@ class Question(QuestionBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 # Test schemas
 class TestBase(BaseModel):
@@ -67,15 +77,19 @@ class Test(TestBase):
     id: int
     user_id: int
     created_at: datetime
+    content_revision: Optional[int] = None
+    content_fingerprint: Optional[str] = None
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class TestWithQuestions(Test):
     questions: List[Question]
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class TestResultBase(BaseModel):
     test_id: int
@@ -97,6 +111,7 @@ class TestResult(TestResultBase):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class QuestionWithStudentAnswer(Question):
     student_answer: Optional[Any] = None
@@ -108,4 +123,56 @@ class TestResultWithQuestions(TestResult):
 
     class Config:
         orm_mode = True
+        from_attributes = True
 
+class TestResultProjection(BaseModel):
+    """Any subset of TestResultWithQuestions, for ?fields= requests; dump it
+    with include= so unselected fields stay out of the row."""
+    id: Optional[int] = None
+    test_id: Optional[int] = None
+    original_test_id: Optional[int] = None
+    test_title: Optional[str] = None
+    user_name: Optional[str] = None
+    score: Optional[int] = None
+    max_score: Optional[int] = None
+    created_at: Optional[datetime] = None
+    total_time: Optional[int] = None
+    question_times: Optional[Dict[str, int]] = None
+    questions_with_answers: Optional[List[Dict[str, Any]]] = None
+
+class QuestionTiming(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+
+class QuestionStatistics(BaseModel):
+    position: int
+    text: Optional[str] = None
+    attempts: int
+    answered: int
+    correct: int
+    correct_rate: Optional[float] = None
+    option_distribution: List[int]
+    time: QuestionTiming
+
+class TestStatistics(BaseModel):
+    test_id: int
+    submissions: int
+    questions: List[QuestionStatistics]
+
+class VariationJob(BaseModel):
+    id: int
+    test_id: int
+    new_test_id: Optional[int] = None
+    status: str
+    total: int
+    completed: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    test: Optional[Test] = None
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+
+load_dotenv()
+
+SNAPSHOT_KNOWN_SIZE = int(os.getenv("SNAPSHOT_KNOWN_SIZE", "4096"))
+
+# Position -> ids for one result: [[question_id, [option_id, ...]], ...]
+SnapshotIds = List[List[Any]]
+
+
+def canonical_json(snapshot: List[Dict[str, Any]]) -> str:
+    return json.dumps(snapshot, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def snapshot_hash(snapshot: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(canonical_json(snapshot).encode("utf-8")).hexdigest()
+
+
+def split_ids(snapshot: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], SnapshotIds]:
+    """Separates row ids from content. Every student submits a freshly saved
+    variant, so only the id-free content repeats across submissions; the ids
+    stay on the result row."""
+    content = []
+    ids = []
+    for q in snapshot:
+        options = q.get("options", [])
+        content.append({
+            "text": q.get("text"),
+            "topic": q.get("topic"),
+            "options": [{"text": o.get("text"), "is_correct": o.get("is_correct")} for o in options],
+        })
+        ids.append([q.get("id"), [o.get("id") for o in options]])
+    return content, ids
+
+
+def attach_ids(snapshot: Optional[List[Dict[str, Any]]], ids: Optional[SnapshotIds]) -> Optional[List[Dict[str, Any]]]:
+    # Snapshots stored before ids were split out carry them inline.
+    if not snapshot or not ids:
+        return snapshot
+    resolved = []
+    for q, (question_id, option_ids) in zip(snapshot, ids):
+        options = [{"id": option_id, **o} for o, option_id in zip(q.get("options", []), option_ids)]
+        resolved.append({"id": question_id, **q, "options": options})
+    return resolved
+
+
+class _KnownHashes:
+    """Digests already committed to question_snapshots, so repeat submissions
+    of the same content skip the INSERT. The only thing that deletes rows
+    there is migration m008's prune, which evicts what it deletes via
+    forget(). That reaches this process only: after running the migration
+    from the command line against a live database, restart the app."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, digest: str) -> bool:
+        with self._lock:
+            if digest not in self._items:
+                return False
+            self._items.move_to_end(digest)
+            return True
+
+    def discard(self, digest: str):
+        with self._lock:
+            self._items.pop(digest, None)
+
+    def add(self, digest: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[digest] = None
+            self._items.move_to_end(digest)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+_known = _KnownHashes(SNAPSHOT_KNOWN_SIZE)
+
+
+def _insert_stmt(digest: str, snapshot: List[Dict[str, Any]]):
+    return (
+        insert(models.QuestionSnapshot.__table__)
+        .prefix_with("IGNORE", dialect="mysql")
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .values(hash=digest, snapshot=snapshot, created_at=datetime.utcnow())
+    )
+
+
+def store_snapshot(db: Session, snapshot: List[Dict[str, Any]]) -> str:
+    digest = snapshot_hash(snapshot)
+    db.execute(_insert_stmt(digest, snapshot))
+    return digest
+
+
+async def store_snapshot_async(db: AsyncSession, snapshot: List[Dict[str, Any]]) -> str:
+    digest = snapshot_hash(snapshot)
+    if digest not in _known:
+        await db.execute(_insert_stmt(digest, snapshot))
+    return digest
+
+
+def mark_stored(digest: str):
+    """Call once the transaction that stored the snapshot has committed."""
+    _known.add(digest)
+
+
+def forget(digests: Iterable[str]):
+    """Call for snapshot rows that were deleted."""
+    for digest in digests:
+        _known.discard(digest)
+
+
+async def load_snapshots_async(db: AsyncSession, hashes: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+    hashes = list({h for h in hashes if h})
+    if not hashes:
+        return {}
+    result = await db.execute(
+        select(models.QuestionSnapshot.hash, models.QuestionSnapshot.snapshot)
+        .where(models.QuestionSnapshot.hash.in_(hashes))
+    )
+    return {digest: snapshot for digest, snapshot in result.all()}
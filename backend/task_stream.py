@@ -0,0 +1,82 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+_QUESTION = re.compile(r"^\s*ПИТАННЯ:\s*(.*)$", re.I)
+_OPTION = re.compile(r"^[ \t]*([a-dA-D])\)\s*(.+)$")
+_CORRECT = re.compile(r"ПРАВИЛЬНА:\s*([a-dA-D])", re.I)
+
+
+class TaskStreamParser:
+    """Parses the ПИТАННЯ / a)-d) / ПРАВИЛЬНА task format from completion
+    chunks, emitting each block as soon as its line is complete."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._question_lines: Optional[List[str]] = None
+        self.question: Optional[str] = None
+        self.options: List[Dict[str, Any]] = []
+        self.correct: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        events: List[Dict[str, Any]] = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            events.extend(self._line(line))
+        return events
+
+    def close(self) -> List[Dict[str, Any]]:
+        events: List[Dict[str, Any]] = []
+        if self._buffer:
+            events.extend(self._line(self._buffer))
+            self._buffer = ""
+        events.extend(self._finish_question())
+        return events
+
+    def _finish_question(self) -> List[Dict[str, Any]]:
+        if self._question_lines is None or self.question is not None:
+            return []
+        text = "\n".join(self._question_lines).strip()
+        self._question_lines = None
+        if not text:
+            return []
+        self.question = text
+        return [{"type": "question", "text": text}]
+
+    def _line(self, line: str) -> List[Dict[str, Any]]:
+        events: List[Dict[str, Any]] = []
+        if self.question is None and self._question_lines is None:
+            match = _QUESTION.match(line)
+            if match:
+                self._question_lines = [match.group(1)] if match.group(1).strip() else []
+                return events
+        option = _OPTION.match(line)
+        if self._question_lines is not None:
+            if option or (not line.strip() and self._question_lines):
+                events.extend(self._finish_question())
+            elif option is None:
+                self._question_lines.append(line)
+                return events
+        if option:
+            index = len(self.options)
+            self.options.append({"text": option.group(2).strip(), "is_correct": False})
+            events.append({"type": "option", "index": index, "text": self.options[index]["text"]})
+        correct = _CORRECT.search(line)
+        if correct and self.correct is None:
+            self.correct = ord(correct.group(1).lower()) - 97
+            events.append({"type": "correct", "index": self.correct})
+        return events
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        if not self.question or not self.options:
+            return None
+        options = [dict(o, is_correct=(i == self.correct)) for i, o in enumerate(self.options)]
+        return {"question": self.question, "options": options}
+
+
+def parse(chunks: Iterable[str]) -> Optional[Dict[str, Any]]:
+    parser = TaskStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.result()
@@ -0,0 +1,104 @@
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_HOST", "127.0.0.1")
+os.environ.setdefault("DB_NAME", "test")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import classification
+import database
+import main
+import metrics
+import models
+import principal_cache
+import question_bank
+import response_cache
+import snapshots
+import variant_gc
+import variation_jobs
+
+SESSION_MODULES = (database, main, classification, question_bank, variant_gc, variation_jobs)
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    """Points every module at a throwaway SQLite file, shared by the sync
+    engine and an aiosqlite engine so both session kinds see the same rows."""
+    path = tmp_path / "app.sqlite3"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, future=True)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    metrics.instrument_engine(engine, "sync")
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+    models.Base.metadata.create_all(engine)
+
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_session_local = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    for module in SESSION_MODULES:
+        if hasattr(module, "SessionLocal"):
+            monkeypatch.setattr(module, "SessionLocal", session_local)
+        if hasattr(module, "AsyncSessionLocal"):
+            monkeypatch.setattr(module, "AsyncSessionLocal", async_session_local)
+    monkeypatch.setattr(snapshots, "_known", snapshots._KnownHashes(snapshots.SNAPSHOT_KNOWN_SIZE))
+    response_cache.clear()
+    principal_cache.clear()
+    yield SimpleNamespace(engine=engine, SessionLocal=session_local, AsyncSessionLocal=async_session_local)
+    engine.dispose()
+
+
+@pytest.fixture
+def user(sessions):
+    db = sessions.SessionLocal()
+    try:
+        user = models.User(username="teacher", hashed_password="-")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {"Authorization": f"Bearer {main.create_access_token({'sub': user.username})}"}
+
+
+def seed_test(sessions, user_id, questions, **fields) -> int:
+    """questions: list of (text, [(option text, is_correct), ...])."""
+    db = sessions.SessionLocal()
+    try:
+        test = models.Test(title=fields.pop("title", "Тест"), user_id=user_id, **fields)
+        db.add(test)
+        db.flush()
+        for text, options in questions:
+            question = models.Question(text=text, test_id=test.id)
+            db.add(question)
+            db.flush()
+            db.add_all([models.Option(text=o, is_correct=c, question_id=question.id) for o, c in options])
+        db.commit()
+        return test.id
+    finally:
+        db.close()
+
+
+def api_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+
+def run(coro):
+    return asyncio.run(coro)
@@ -0,0 +1,49 @@
+import analytics
+import models
+import repository
+from conftest import run, seed_test
+
+QUESTIONS = [
+    ("2 + 2 = ?", [("3", False), ("4", True)]),
+    ("3 * 3 = ?", [("6", False), ("9", True)]),
+]
+TIMES = [{0: 1.6, 1: 2.7}, {0: 0.9, 1: 12.5}, {0: 3.99}]
+
+
+def stats(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        rows = db.query(models.QuestionStat).filter(models.QuestionStat.test_id == test_id).order_by(models.QuestionStat.position)
+        return [(s.attempts, s.time_count, s.time_total, s.time_histogram) for s in rows]
+    finally:
+        db.close()
+
+
+def test_recompute_matches_incremental_time_totals(sessions, user):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    db = sessions.SessionLocal()
+    try:
+        questions = repository.questions_snapshot(repository.get_questions_tree(db, test_id))
+    finally:
+        db.close()
+
+    async def submit():
+        for i, times in enumerate(TIMES):
+            question_times = {str(questions[j]["id"]): seconds for j, seconds in times.items()}
+            answers = {str(q["id"]): {"selected_index": 1, "is_correct": True} for q in questions}
+            async with sessions.AsyncSessionLocal() as db:
+                db.add(models.TestResult(test_id=test_id, user_name=f"student {i}", score=2, max_score=2,
+                                         answers=answers, question_times=question_times, questions_snapshot=questions))
+                await analytics.apply_result_async(db, test_id, questions, answers, question_times)
+                await db.commit()
+
+    run(submit())
+    incremental = stats(sessions, test_id)
+    assert [row[2] for row in incremental] == [1 + 0 + 3, 2 + 12]
+
+    db = sessions.SessionLocal()
+    try:
+        analytics.recompute_test(db, test_id)
+    finally:
+        db.close()
+    assert stats(sessions, test_id) == incremental
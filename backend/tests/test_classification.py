@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import classification
+import models
+from conftest import api_client, run, seed_test
+
+QUESTIONS = [("2 + 2 = ?", [("3", False), ("4", True)])]
+
+
+def load_test(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        test = db.get(models.Test, test_id)
+        db.expunge(test)
+        return test
+    finally:
+        db.close()
+
+
+def test_student_load_leaves_classification_to_the_worker(sessions, user, monkeypatch):
+    calls = []
+    monkeypatch.setattr(classification, "classify_test_category", lambda data: calls.append(data) or "Математика")
+    test_id = seed_test(sessions, user.id, QUESTIONS, content_revision=2, classified_revision=1)
+
+    async def load():
+        async with api_client() as client:
+            return await client.get(f"/tests/{test_id}")
+
+    assert run(load()).status_code == 200
+    assert calls == []
+    assert load_test(sessions, test_id).classified_revision == 1
+
+
+def test_classify_holds_no_connection_during_the_llm_call(sessions, user, monkeypatch):
+    checked_out = []
+
+    @event.listens_for(sessions.engine, "checkout")
+    def checkout(*args):
+        checked_out.append(1)
+
+    @event.listens_for(sessions.engine, "checkin")
+    def checkin(*args):
+        checked_out.pop()
+
+    during_call = []
+    monkeypatch.setattr(classification, "classify_test_category", lambda data: during_call.append(len(checked_out)) or "Алгебра")
+    test_id = seed_test(sessions, user.id, QUESTIONS, content_revision=2, classify_requested_at=datetime.utcnow())
+
+    assert classification.classify_test(test_id) == "Алгебра"
+    assert during_call == [0]
+    test = load_test(sessions, test_id)
+    assert (test.category, test.classified_revision, test.classify_requested_at) == ("Алгебра", 2, None)
+
+
+def test_failed_classification_stays_dirty_and_backs_off(sessions, user, monkeypatch):
+    monkeypatch.setattr(classification, "classify_test_category", lambda data: None)
+    requested_at = datetime.utcnow() - timedelta(minutes=5)
+    test_id = seed_test(sessions, user.id, QUESTIONS, content_revision=2, classified_revision=1, classify_requested_at=requested_at)
+
+    assert classification.classify_test(test_id) is None
+    test = load_test(sessions, test_id)
+    assert test.classified_revision == 1
+    assert test.classify_requested_at > datetime.utcnow()
+    assert test_id not in classification.due_tests()
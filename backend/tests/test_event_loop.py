@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+import ai
+import llm_providers
+from conftest import api_client, run, seed_test
+
+SLOW_LLM = 0.5
+
+QUESTIONS = [
+    ("Хто написав «Кобзар»?", [("Шевченко", True), ("Франко", False), ("Леся Українка", False)]),
+    ("Столиця Франції?", [("Париж", True), ("Ліон", False), ("Марсель", False)]),
+]
+
+
+def test_slow_llm_call_does_not_block_other_requests(sessions, user, auth_headers, monkeypatch):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    monkeypatch.setattr(ai, "_provider", llm_providers.SyntheticProvider(latency=f"fixed:{SLOW_LLM}", seed="1"))
+
+    async def scenario():
+        async with api_client() as client:
+            started = time.perf_counter()
+            variant = asyncio.create_task(client.get(f"/tests/{test_id}"))
+            await asyncio.sleep(0.1)
+            listed = await asyncio.gather(*[client.get("/tests", headers=auth_headers) for _ in range(10)])
+            listed_at = time.perf_counter() - started
+            variant_pending = not variant.done()
+            response = await variant
+            return response, time.perf_counter() - started, listed, listed_at, variant_pending
+
+    response, variant_elapsed, listed, listed_at, variant_pending = run(scenario())
+
+    assert response.status_code == 200
+    assert len(response.json()["questions"]) == len(QUESTIONS)
+    assert variant_elapsed >= SLOW_LLM
+    assert all(r.status_code == 200 for r in listed)
+    assert [t["id"] for t in listed[0].json()] == [test_id]
+    assert variant_pending, "the variant finished before the concurrent requests, nothing was measured"
+    assert listed_at < SLOW_LLM
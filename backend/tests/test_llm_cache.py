@@ -0,0 +1,56 @@
+import time
+import asyncio
+
+import llm_cache
+from conftest import run
+
+MESSAGES = [{"role": "user", "content": "Визнач тему: 2 + 2"}]
+
+
+class SlowDisk:
+    def __init__(self, value):
+        self.value = value
+        self.stored = []
+
+    def get(self, key):
+        time.sleep(0.3)
+        return self.value, time.time() + 60
+
+    def set(self, key, value, expires_at):
+        time.sleep(0.3)
+        self.stored.append(value)
+
+
+def test_disk_tier_stays_off_the_event_loop(monkeypatch):
+    disk = SlowDisk("Арифметика")
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_memory", llm_cache.MemoryCache(16))
+    monkeypatch.setattr(llm_cache, "_disk", disk)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+
+        async def miss():
+            return "Алгебра"
+
+        hit = await llm_cache.cached_call_async("topic", "m", MESSAGES, 0.1, miss)
+        monkeypatch.setattr(disk, "value", None)
+        monkeypatch.setattr(disk, "get", lambda key: time.sleep(0.3))
+        other = [{"role": "user", "content": "Визнач тему: 3 * 3"}]
+        stored = await llm_cache.cached_call_async("topic", "m", other, 0.1, miss)
+        task.cancel()
+        return hit, stored, ticks
+
+    hit, stored, ticks = run(scenario())
+    assert (hit, stored) == ("Арифметика", "Алгебра")
+    assert disk.stored == ["Алгебра"]
+    # Three 0.3 s SQLite calls; a blocked loop would tick only a few times.
+    assert ticks > 40
@@ -0,0 +1,38 @@
+import ai
+import llm_providers
+
+ITEMS = [
+    {
+        "text": text,
+        "topic": None,
+        "options_for_prompt": "a) (a-b)(a+b)\nb) (a-b)^2",
+        "correct_text": "(a-b)(a+b)",
+        "options": [{"text": "(a-b)(a+b)", "is_correct": True}, {"text": "(a-b)^2", "is_correct": False}],
+    }
+    for text in ("Розкладіть на множники a^2 - b^2", "Розкладіть на множники a^2 - b^2", "Спростіть вираз (a+b)^2 - 2ab")
+]
+
+
+def generate(monkeypatch, provider):
+    # A fresh process: nothing asked yet, same prompt seed as the recording.
+    monkeypatch.setattr(ai, "_prompt_nonces", ai._PromptNonces("0"))
+    monkeypatch.setattr(ai, "_provider", provider)
+    return [ai.generate_variation_item(item) for item in ITEMS]
+
+
+def test_recorded_variations_replay(tmp_path, monkeypatch):
+    synthetic = llm_providers.SyntheticProvider(latency="fixed:0", seed="1")
+    recorded = generate(monkeypatch, llm_providers.RecordingProvider(synthetic, directory=str(tmp_path), model=ai.ZAI_MODEL))
+    replay = llm_providers.ReplayProvider(directory=str(tmp_path), model=ai.ZAI_MODEL)
+    replayed = generate(monkeypatch, replay)
+
+    assert all(parsed for _, parsed in recorded)
+    assert replayed == recorded
+    assert all(replay._positions.values())
+
+
+def test_unseeded_nonces_keep_no_state():
+    nonces = ai._PromptNonces(None)
+    for i in range(100):
+        nonces.next(f"Питання {i}")
+    assert nonces._asked == {}
@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import create_engine
+
+import main
+import migrate
+from conftest import run
+
+
+def test_migrations_apply_once(sessions):
+    assert migrate.run_migrations(bind=sessions.engine) == len(migrate.MIGRATIONS)
+    assert migrate.run_migrations(bind=sessions.engine) == 0
+
+
+def test_legacy_engine_is_rejected():
+    with pytest.raises(TypeError):
+        migrate.run_migrations(bind=create_engine("sqlite://"))
+
+
+def test_failed_migration_stops_startup(monkeypatch):
+    def broken():
+        raise RuntimeError("migration 006 failed")
+
+    async def start():
+        async with main.lifespan(main.app):
+            pass
+
+    monkeypatch.setattr(main, "init_db", broken)
+    with pytest.raises(RuntimeError, match="migration 006 failed"):
+        run(start())
@@ -0,0 +1,32 @@
+import random
+import re
+
+import numeric_variants
+
+DECIMAL_POINT = re.compile(r"\d\.\d")
+
+
+def variants(question, options, n=500):
+    rng = random.Random(7)
+    produced = [numeric_variants.make_variant(question, [{"text": t, "is_correct": c} for t, c in options], rng) for _ in range(n)]
+    assert all(produced)
+    return produced
+
+
+def test_integer_answer_follows_decimal_comma():
+    produced = variants("Обчисліть 0,5 * 4", [("2", True), ("2,5", False), ("1,5", False), ("3", False)])
+    for text, options in produced:
+        correct = next(o for o in options if o["is_correct"])
+        assert numeric_variants.parse_answer(correct["text"])[0] == numeric_variants.evaluate(text.split(" ", 1)[1])
+        assert not any(DECIMAL_POINT.search(o["text"]) for o in options), options
+
+
+def test_fraction_question_keeps_fraction_options():
+    produced = variants("1/2 + 1/3", [("5/6", True), ("2/5", False), ("1", False), ("1/6", False)])
+    for _, options in produced:
+        assert not any(re.search(r"[.,]", o["text"]) for o in options), options
+
+
+def test_decimal_point_question_is_unchanged():
+    for _, options in variants("Обчисліть 1.5 + 2", [("3.5", True), ("4", False), ("3", False)], n=100):
+        assert not any("," in o["text"] for o in options), options
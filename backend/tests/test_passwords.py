@@ -0,0 +1,14 @@
+import passwords
+from conftest import run
+
+
+def test_pool_workers_are_not_forked():
+    pool = passwords.PasswordPool(workers=1, queue_limit=4)
+    hashed = passwords.hash_password("secret", 4)
+    try:
+        pool.start()
+        assert pool._get_executor()._mp_context.get_start_method() in ("forkserver", "spawn")
+        assert run(pool.run(passwords.check_password, "secret", hashed))
+        assert not run(pool.run(passwords.check_password, "wrong", hashed))
+    finally:
+        pool.shutdown()
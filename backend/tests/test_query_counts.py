@@ -0,0 +1,108 @@
+import json
+
+import metrics
+import models
+import repository
+import snapshots
+from conftest import api_client, run, seed_test
+
+RESULTS_ROUTE = "/test-results/test/{test_id}"
+
+
+def make_questions(count: int):
+    return [
+        (f"Питання {i}", [(f"Варіант {i}.{j}", j == 0) for j in range(4)])
+        for i in range(count)
+    ]
+
+
+def walk(questions):
+    return sum(len(o.text) for q in questions for o in q.options)
+
+
+def test_tree_loaders_use_constant_queries(sessions, user):
+    small = seed_test(sessions, user.id, make_questions(2))
+    large = seed_test(sessions, user.id, make_questions(25))
+    counts = {}
+    for test_id in (small, large):
+        db = sessions.SessionLocal()
+        try:
+            with metrics.count_sql() as tree:
+                walk(repository.get_test_tree(db, test_id).questions)
+            db.expunge_all()
+            with metrics.count_sql() as questions:
+                walk(repository.get_questions_tree(db, test_id))
+        finally:
+            db.close()
+        counts[test_id] = (tree[0], questions[0])
+
+    assert counts[small] == counts[large] == (3, 2)
+
+
+def add_results(sessions, test_id: int, count: int, with_snapshot: bool):
+    db = sessions.SessionLocal()
+    try:
+        digest = None
+        if with_snapshot:
+            snapshot = repository.questions_snapshot(repository.get_questions_tree(db, test_id))
+            digest = snapshots.snapshot_hash(snapshot)
+            if db.get(models.QuestionSnapshot, digest) is None:
+                db.add(models.QuestionSnapshot(hash=digest, snapshot=snapshot))
+        db.add_all([
+            models.TestResult(test_id=test_id, user_name=f"student {i}", score=1, max_score=3,
+                              answers={}, question_times={}, snapshot_hash=digest)
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def results_statements(test_id: int, headers) -> int:
+    async def fetch():
+        async with api_client() as client:
+            return await client.get(f"/test-results/test/{test_id}", headers=headers)
+
+    before = metrics.HTTP_SQL_QUERIES.totals(method="GET", route=RESULTS_ROUTE)
+    response = run(fetch())
+    after = metrics.HTTP_SQL_QUERIES.totals(method="GET", route=RESULTS_ROUTE)
+    assert response.status_code == 200
+    assert after[0] == before[0] + 1
+    return int(after[1] - before[1]), response.json()
+
+
+def test_results_endpoint_queries_do_not_grow_with_results(sessions, user, auth_headers):
+    test_id = seed_test(sessions, user.id, make_questions(3))
+    add_results(sessions, test_id, 2, with_snapshot=True)
+    add_results(sessions, test_id, 1, with_snapshot=False)
+    results_statements(test_id, auth_headers)  # warm the principal cache
+    few, payload = results_statements(test_id, auth_headers)
+    assert len(payload) == 3
+    assert all(len(r["questions_with_answers"]) == 3 for r in payload)
+
+    add_results(sessions, test_id, 40, with_snapshot=True)
+    add_results(sessions, test_id, 20, with_snapshot=False)
+    many, payload = results_statements(test_id, auth_headers)
+    assert len(payload) == 63
+    # test, results page, shared snapshots, fallback questions + options
+    assert many == few == 5
+
+
+def test_results_projection_is_validated_and_trimmed(sessions, user, auth_headers):
+    test_id = seed_test(sessions, user.id, make_questions(2))
+    add_results(sessions, test_id, 2, with_snapshot=False)
+
+    async def fetch(path):
+        async with api_client() as client:
+            return await client.get(path, headers=auth_headers)
+
+    response = run(fetch(f"/test-results/test/{test_id}?fields=score,created_at,test_title"))
+    assert response.status_code == 200
+    rows = response.json()
+    assert [set(r) for r in rows] == [{"score", "created_at", "test_title"}] * 2
+    assert all(isinstance(r["created_at"], str) and r["test_title"] for r in rows)
+
+    response = run(fetch(f"/test-results/test/{test_id}?fields=user_name&format=ndjson"))
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert [set(r) for r in lines] == [{"user_name"}] * 2
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import models
+import question_bank
+from conftest import seed_test
+
+QUESTIONS = [("2 + 2 = ?", [("3", False), ("4", True)])]
+
+
+def question_id(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        return db.query(models.Question.id).filter(models.Question.test_id == test_id).scalar()
+    finally:
+        db.close()
+
+
+def add_bank(sessions, qid, count):
+    db = sessions.SessionLocal()
+    try:
+        db.add_all([
+            models.QuestionBankItem(source_question_id=qid, text=f"bank {i}", topic="Арифметика", options=[{"text": "1", "is_correct": True}])
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_scan_only_queues_templates_students_draw_from(sessions, user, monkeypatch):
+    monkeypatch.setattr(question_bank, "_backoff", question_bank.RefillBackoff())
+    drawn = seed_test(sessions, user.id, QUESTIONS)
+    seed_test(sessions, user.id, QUESTIONS, is_student_only=True, template_id=drawn)
+    stale = seed_test(sessions, user.id, QUESTIONS)
+    seed_test(sessions, user.id, QUESTIONS, is_student_only=True, template_id=stale, created_at=datetime.utcnow() - timedelta(days=60))
+    seed_test(sessions, user.id, QUESTIONS)
+    seed_test(sessions, user.id, QUESTIONS, template_id=drawn)
+
+    assert question_bank._tests_below_low_water() == [drawn]
+    add_bank(sessions, question_id(sessions, drawn), question_bank.BANK_LOW_WATER)
+    assert question_bank._tests_below_low_water() == []
+
+
+def test_failed_refills_back_off(sessions, user, monkeypatch):
+    backoff = question_bank.RefillBackoff(base=600)
+    calls = []
+    monkeypatch.setattr(question_bank, "_backoff", backoff)
+    monkeypatch.setattr(question_bank, "_generate_item", lambda source: calls.append(source) and None)
+    template_id = seed_test(sessions, user.id, QUESTIONS)
+    seed_test(sessions, user.id, QUESTIONS, is_student_only=True, template_id=template_id)
+
+    assert question_bank.refill_test(template_id) == 0
+    assert backoff.failures(question_id(sessions, template_id)) == 1
+    assert len(calls) == question_bank.BANK_REFILL_BATCH
+    assert question_bank.refill_test(template_id) == 0
+    assert len(calls) == question_bank.BANK_REFILL_BATCH
+    assert question_bank._tests_below_low_water() == []
+
+
+def test_take_questions_draws_one_row_per_source(sessions, user):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    qid = question_id(sessions, test_id)
+    add_bank(sessions, qid, 2)
+    db = sessions.SessionLocal()
+    try:
+        first = question_bank.take_questions(db, [qid])
+        second = question_bank.take_questions(db, [qid])
+        third = question_bank.take_questions(db, [qid])
+    finally:
+        db.close()
+    assert [first[0]["text"], second[0]["text"], third] == ["bank 0", "bank 1", [None]]
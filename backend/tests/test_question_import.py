@@ -0,0 +1,65 @@
+import json
+
+import models
+from conftest import api_client, run, seed_test
+
+ROUTE = "/tests/{test_id}/questions/import"
+
+QUESTIONS = [
+    {"text": "Знайдіть площадь квадрата зі стороною 3", "options": [{"text": "9", "is_correct": True}, {"text": "6", "is_correct": False}]},
+    {"text": "Скільки буде 2 + 2?", "topic": "Арифметика", "options": [{"text": "4", "is_correct": True}]},
+]
+
+
+def post_import(test_id, headers, body):
+    async def send():
+        async with api_client() as client:
+            return await client.post(
+                ROUTE.format(test_id=test_id), content=body,
+                headers={**headers, "content-type": "application/x-ndjson"},
+            )
+    return run(send())
+
+
+def ndjson(questions):
+    return "".join(json.dumps(q, ensure_ascii=False) + "\n" for q in questions).encode("utf-8")
+
+
+def test_import_inserts_batch_and_detects_topics(sessions, user, auth_headers):
+    test_id = seed_test(sessions, user.id, [], category="Математика")
+
+    response = post_import(test_id, auth_headers, ndjson(QUESTIONS))
+    assert response.status_code == 200
+    assert response.json()["imported"] == 2
+
+    db = sessions.SessionLocal()
+    try:
+        rows = db.query(models.Question).filter(models.Question.test_id == test_id).order_by(models.Question.id).all()
+        assert [q.topic for q in rows] == ["Геометрия", "Арифметика"]
+        assert [len(q.options) for q in rows] == [2, 1]
+        assert db.get(models.Test, test_id).classify_requested_at is not None
+    finally:
+        db.close()
+
+
+def test_import_refetches_test_after_upload(sessions, user, auth_headers):
+    test_id = seed_test(sessions, user.id, [])
+
+    async def body():
+        # The ownership check has run by now; the test goes away mid-upload.
+        db = sessions.SessionLocal()
+        try:
+            db.delete(db.get(models.Test, test_id))
+            db.commit()
+        finally:
+            db.close()
+        yield ndjson(QUESTIONS)
+
+    async def send():
+        async with api_client() as client:
+            return await client.post(
+                ROUTE.format(test_id=test_id), content=body(),
+                headers={**auth_headers, "content-type": "application/x-ndjson"},
+            )
+
+    assert run(send()).status_code == 404
@@ -0,0 +1,113 @@
+import migrate
+import models
+import repository
+import snapshots
+from conftest import api_client, run, seed_test
+
+QUESTIONS = [
+    ("2 + 2 = ?", [("3", False), ("4", True), ("5", False)]),
+    ("3 * 3 = ?", [("6", False), ("9", True)]),
+]
+
+
+def variant_tree(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        return repository.questions_snapshot(repository.get_questions_tree(db, test_id))
+    finally:
+        db.close()
+
+
+def count(sessions, model) -> int:
+    db = sessions.SessionLocal()
+    try:
+        return db.query(model).count()
+    finally:
+        db.close()
+
+
+def submit(client, variant_id, tree, name, picks):
+    answers = {
+        str(q["id"]): {"option_id": q["options"][pick]["id"], "selected_index": pick, "is_correct": q["options"][pick]["is_correct"]}
+        for q, pick in zip(tree, picks)
+    }
+    return client.post("/test-results", json={
+        "test_id": variant_id, "user_name": name, "score": 0, "max_score": len(tree), "answers": answers,
+    })
+
+
+def get_results(client, test_id, headers):
+    return client.get(f"/test-results/test/{test_id}", headers=headers)
+
+
+def test_identical_variants_share_one_snapshot(sessions, user, auth_headers):
+    template_id = seed_test(sessions, user.id, QUESTIONS)
+    variants = [seed_test(sessions, user.id, QUESTIONS, is_student_only=True, template_id=template_id) for _ in range(3)]
+    trees = {variant_id: variant_tree(sessions, variant_id) for variant_id in variants}
+
+    async def scenario():
+        async with api_client() as client:
+            for i, variant_id in enumerate(variants):
+                response = await submit(client, variant_id, trees[variant_id], f"student {i}", [1, i % 2])
+                assert response.status_code == 200
+            return await get_results(client, template_id, auth_headers)
+
+    response = run(scenario())
+    assert count(sessions, models.QuestionSnapshot) == 1
+    payload = sorted(response.json(), key=lambda r: r["user_name"])
+    for i, (result, variant_id) in enumerate(zip(payload, variants)):
+        tree = trees[variant_id]
+        resolved = result["questions_with_answers"]
+        assert [q["id"] for q in resolved] == [q["id"] for q in tree]
+        assert [[o["id"] for o in q["options"]] for q in resolved] == [[o["id"] for o in q["options"]] for q in tree]
+        second = resolved[1]
+        assert second["student_answer"]["option_id"] == second["options"][i % 2]["id"]
+
+
+def test_migration_rekeys_snapshots_with_inline_ids(sessions, user, auth_headers):
+    template_id = seed_test(sessions, user.id, QUESTIONS)
+    variants = [seed_test(sessions, user.id, QUESTIONS, is_student_only=True, template_id=template_id) for _ in range(2)]
+    db = sessions.SessionLocal()
+    try:
+        for i, variant_id in enumerate(variants):
+            legacy = variant_tree(sessions, variant_id)
+            digest = snapshots.snapshot_hash(legacy)
+            db.add(models.QuestionSnapshot(hash=digest, snapshot=legacy))
+            db.add(models.TestResult(test_id=template_id, user_name=f"student {i}", score=0, max_score=2, answers={}, snapshot_hash=digest))
+        db.commit()
+    finally:
+        db.close()
+    assert count(sessions, models.QuestionSnapshot) == 2
+
+    with sessions.engine.connect() as connection:
+        migrate.m008_results_snapshot_ids(connection)
+
+    assert count(sessions, models.QuestionSnapshot) == 1
+
+    async def scenario():
+        async with api_client() as client:
+            return await get_results(client, template_id, auth_headers)
+
+    payload = sorted(run(scenario()).json(), key=lambda r: r["user_name"])
+    for result, variant_id in zip(payload, variants):
+        expected = variant_tree(sessions, variant_id)
+        assert [q["id"] for q in result["questions_with_answers"]] == [q["id"] for q in expected]
+        assert result["questions_with_answers"][0]["options"] == expected[0]["options"]
+
+
+def test_pruned_snapshots_are_forgotten(sessions, user):
+    template_id = seed_test(sessions, user.id, QUESTIONS)
+    content, _ = snapshots.split_ids(variant_tree(sessions, template_id))
+    db = sessions.SessionLocal()
+    try:
+        digest = snapshots.store_snapshot(db, content)
+        db.commit()
+    finally:
+        db.close()
+    snapshots.mark_stored(digest)
+
+    with sessions.engine.connect() as connection:
+        migrate.m008_results_snapshot_ids(connection)
+
+    assert count(sessions, models.QuestionSnapshot) == 0
+    assert digest not in snapshots._known
@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+import ai
+import llm_cache
+import llm_providers
+import main
+import models
+import zai_http
+from conftest import run, seed_test
+
+QUESTIONS = [
+    ("2 + 2 = ?", [("3", False), ("4", True)]),
+    ("3 * 3 = ?", [("6", False), ("9", True)]),
+]
+
+
+def bank(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        question_ids = [q.id for q in db.query(models.Question).filter(models.Question.test_id == test_id)]
+        db.add_all([
+            models.QuestionBankItem(source_question_id=qid, text=f"bank {qid}", topic="Арифметика",
+                                    options=[{"text": "1", "is_correct": True}, {"text": "2", "is_correct": False}])
+            for qid in question_ids
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def counts(sessions):
+    db = sessions.SessionLocal()
+    try:
+        return db.query(models.QuestionBankItem).count(), db.query(models.Test).filter(models.Test.is_student_only == True).count()
+    finally:
+        db.close()
+
+
+def draw(sessions, test_id):
+    db = sessions.SessionLocal()
+    try:
+        return main._draw_variant(test_id, db)
+    finally:
+        db.close()
+
+
+def test_abandoned_stream_returns_bank_items(sessions, user):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    bank(sessions, test_id)
+
+    async def abandon():
+        stream = main._stream_variant(main._VariantDraw(test_id, *draw(sessions, test_id)))
+        await stream.__anext__()
+        assert counts(sessions) == (0, 0)
+        await stream.aclose()
+
+    run(abandon())
+    assert counts(sessions) == (2, 0)
+
+
+def test_finished_stream_keeps_bank_items_in_the_variant(sessions, user):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    bank(sessions, test_id)
+
+    async def consume():
+        return [event async for event in main._stream_variant(main._VariantDraw(test_id, *draw(sessions, test_id)))]
+
+    events = run(consume())
+    assert events[-1].startswith("event: done")
+    assert counts(sessions) == (0, 1)
+
+
+def test_unstarted_stream_returns_bank_items(sessions, user):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    bank(sessions, test_id)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # The client is gone before the headers go out, so the body generator
+        # never runs.
+        await asyncio.sleep(5)
+
+    async def disconnect():
+        db = sessions.SessionLocal()
+        try:
+            response = await main.stream_test_variant(test_id, db)
+        finally:
+            db.close()
+        assert counts(sessions) == (0, 0)
+        await response({"type": "http", "method": "GET", "path": "/"}, receive, send)
+
+    run(disconnect())
+    assert counts(sessions) == (2, 0)
+
+
+def test_save_failing_after_disconnect_returns_bank_items(sessions, user, monkeypatch):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    bank(sessions, test_id)
+
+    def failing_finish(*args):
+        time.sleep(0.2)
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(main, "_finish_variant", failing_finish)
+
+    async def disconnect_mid_save():
+        draw_state = main._VariantDraw(test_id, *draw(sessions, test_id))
+
+        async def consume():
+            async for _ in main._stream_variant(draw_state):
+                pass
+
+        task = asyncio.create_task(consume())
+        while draw_state.saving is None:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await draw_state.release()
+
+    run(disconnect_mid_save())
+    assert counts(sessions) == (2, 0)
+
+
+def test_broken_stream_is_not_recorded_or_cached(tmp_path, monkeypatch):
+    async def stream_chat(payload, api_key):
+        yield {"choices": [{"delta": {"content": "ПИТАННЯ: 2 + "}}]}
+        raise ConnectionError("connection reset")
+
+    stored = []
+    monkeypatch.setattr(ai, "ZAI_API_KEY", "key")
+    monkeypatch.setattr(zai_http, "stream_chat", stream_chat)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_memory", llm_cache.MemoryCache(16))
+    monkeypatch.setattr(llm_cache, "_disk", llm_cache.DiskCache(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(llm_cache._disk, "set", lambda key, value, expires_at: stored.append(value))
+    real = llm_providers.ZaiProvider(None, None, ai._zai_http_stream_async)
+    monkeypatch.setattr(ai, "_provider", llm_providers.RecordingProvider(real, directory=str(tmp_path), model=ai.ZAI_MODEL))
+
+    async def consume():
+        messages = [{"role": "user", "content": "2 + 2"}]
+        return [chunk async for chunk in ai._zai_request_stream(messages, temperature=0.1, call_type="topic")]
+
+    with pytest.raises(ConnectionError):
+        run(consume())
+    assert stored == []
+    assert len(llm_cache._memory) == 0
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".jsonl")] == []
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import models
+import variation_jobs
+from conftest import seed_test
+
+QUESTIONS = [(f"Питання {i}", [("1", True), ("2", False)]) for i in range(4)]
+
+
+class Killed(BaseException):
+    pass
+
+
+def fake_generate(item):
+    return "Тема", {"question": f"Варіант: {item['text']}", "options": [{"text": "1", "is_correct": True}]}
+
+
+def create_job(sessions, user, **fields):
+    test_id = seed_test(sessions, user.id, QUESTIONS)
+    db = sessions.SessionLocal()
+    try:
+        job = models.VariationJob(test_id=fields.pop("test_id", test_id), user_id=user.id, status="queued", **fields)
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def load_job(sessions, job_id):
+    db = sessions.SessionLocal()
+    try:
+        job = db.get(models.VariationJob, job_id)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+def new_questions(sessions, job_id):
+    db = sessions.SessionLocal()
+    try:
+        job = db.get(models.VariationJob, job_id)
+        return [q.text for q in db.query(models.Question).filter(models.Question.test_id == job.new_test_id).order_by(models.Question.id)]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    published = []
+    monkeypatch.setattr(variation_jobs, "generate_variation_item", fake_generate)
+    monkeypatch.setattr(variation_jobs, "publish", lambda job_id, event: published.append(event))
+    return published
+
+
+def test_killed_job_resumes_once_its_lease_expires(sessions, user, events, monkeypatch):
+    job_id = create_job(sessions, user)
+    renew = variation_jobs._renew
+    calls = []
+
+    def dying_renew(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise Killed()
+        return renew(*args, **kwargs)
+
+    monkeypatch.setattr(variation_jobs, "_renew", dying_renew)
+    with pytest.raises(Killed):
+        variation_jobs.run_job(job_id, width=1, worker="a")
+    monkeypatch.setattr(variation_jobs, "_renew", renew)
+
+    job = load_job(sessions, job_id)
+    assert (job.status, job.worker, job.completed) == ("running", "a", 2)
+    assert [e["completed"] for e in events if e["type"] == "progress"] == [1, 2]
+
+    # Another process resuming while "a" still holds a fresh lease runs nothing.
+    variation_jobs.run_job(job_id, width=1, worker="b")
+    assert len(new_questions(sessions, job_id)) == 2
+
+    db = sessions.SessionLocal()
+    try:
+        db.get(models.VariationJob, job_id).heartbeat_at = datetime.utcnow() - timedelta(seconds=variation_jobs.VARIATION_JOB_LEASE + 1)
+        db.commit()
+    finally:
+        db.close()
+    variation_jobs.run_job(job_id, width=1, worker="b")
+
+    job = load_job(sessions, job_id)
+    assert (job.status, job.worker, job.completed, job.total) == ("done", "b", 4, 4)
+    assert new_questions(sessions, job_id) == [f"Варіант: Питання {i}" for i in range(4)]
+    assert [e["completed"] for e in events if e["type"] == "progress"] == [1, 2, 3, 4]
+    assert events[-1]["type"] == "done"
+
+
+def test_finished_job_is_not_run_again(sessions, user, events):
+    job_id = create_job(sessions, user)
+    variation_jobs.run_job(job_id, width=2, worker="a")
+    variation_jobs.run_job(job_id, width=2, worker="b")
+    assert load_job(sessions, job_id).worker == "a"
+    assert len(new_questions(sessions, job_id)) == 4
+
+
+def test_job_for_a_missing_test_fails(sessions, user, events):
+    job_id = create_job(sessions, user, test_id=10 ** 6)
+    variation_jobs.run_job(job_id, worker="a")
+    job = load_job(sessions, job_id)
+    assert job.status == "failed"
+    assert "not found" in job.error
+    assert events[-1]["type"] == "failed"
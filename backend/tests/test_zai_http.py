@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+import zai_http
+from benchmarks.zai_http_bench import PAYLOAD, StubServer
+from conftest import run
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    with StubServer() as server:
+        monkeypatch.setattr(zai_http, "ZAI_API_URL", server.url)
+        yield server
+
+
+def test_pooled_client_reuses_connections(stub):
+    async def scenario():
+        await zai_http.start()
+        try:
+            for _ in range(20):
+                data = await zai_http.post_chat(PAYLOAD, "stub-key")
+                assert data["choices"][0]["message"]["content"]
+            # Sync callers on worker threads go through the same client.
+            await asyncio.to_thread(zai_http.post_chat_sync, PAYLOAD, "stub-key")
+        finally:
+            await zai_http.stop()
+
+    run(scenario())
+    assert stub.connections == 1
+
+
+def test_calls_without_started_client_open_a_connection_each(stub):
+    for _ in range(3):
+        zai_http.post_chat_sync(PAYLOAD, "stub-key")
+    assert stub.connections == 3
@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+
+from database import SessionLocal
+import metrics
+import models
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VARIANT_GC_ENABLED = os.getenv("VARIANT_GC_ENABLED", "1") not in ("0", "false", "False")
+VARIANT_GC_TTL = int(os.getenv("VARIANT_GC_TTL", str(24 * 3600)))
+VARIANT_GC_BATCH = int(os.getenv("VARIANT_GC_BATCH", "200"))
+VARIANT_GC_MAX_BATCHES = int(os.getenv("VARIANT_GC_MAX_BATCHES", "50"))
+VARIANT_GC_INTERVAL = int(os.getenv("VARIANT_GC_INTERVAL", "600"))
+
+RECLAIMED = metrics.Counter("variant_gc_reclaimed_rows_total", "Rows deleted by the student variant collector.", ("table",))
+BATCH_SECONDS = metrics.Histogram("variant_gc_batch_duration_seconds", "Time spent deleting one batch of expired variants.")
+
+TABLES = ("tests", "questions", "options", "question_bank")
+
+
+def collect_batch(db, cutoff: datetime, batch_size: int = VARIANT_GC_BATCH) -> Dict[str, int]:
+    """Deletes up to batch_size expired, unsubmitted student variants and
+    their trees in one transaction. Children go first because the foreign
+    keys only cascade at the ORM level."""
+    tests = models.Test.__table__
+    questions = models.Question.__table__
+    options = models.Option.__table__
+    bank = models.QuestionBankItem.__table__
+    results = models.TestResult.__table__
+
+    # Submitting a variant deletes it, so anything left past the TTL was
+    # abandoned; the results check only guards rows saved by older code.
+    submitted = select(results.c.id).where(results.c.test_id == tests.c.id).exists()
+    test_ids = db.execute(
+        select(tests.c.id)
+        .where(tests.c.is_student_only == True, tests.c.created_at < cutoff, ~submitted)
+        .order_by(tests.c.created_at)
+        .limit(batch_size)
+    ).scalars().all()
+    if not test_ids:
+        return {}
+    question_ids = db.execute(select(questions.c.id).where(questions.c.test_id.in_(test_ids))).scalars().all()
+
+    reclaimed = {}
+    if question_ids:
+        reclaimed["options"] = db.execute(delete(options).where(options.c.question_id.in_(question_ids))).rowcount
+        reclaimed["question_bank"] = db.execute(delete(bank).where(bank.c.source_question_id.in_(question_ids))).rowcount
+        reclaimed["questions"] = db.execute(delete(questions).where(questions.c.id.in_(question_ids))).rowcount
+    reclaimed["tests"] = db.execute(
+        delete(tests).where(tests.c.id.in_(test_ids), tests.c.is_student_only == True)
+    ).rowcount
+    db.commit()
+    return reclaimed
+
+
+def collect(ttl: int = VARIANT_GC_TTL, batch_size: int = VARIANT_GC_BATCH, max_batches: int = VARIANT_GC_MAX_BATCHES) -> Dict[str, int]:
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    totals = {table: 0 for table in TABLES}
+    db = SessionLocal()
+    try:
+        for _ in range(max_batches):
+            started = time.perf_counter()
+            reclaimed = collect_batch(db, cutoff, batch_size)
+            BATCH_SECONDS.observe(time.perf_counter() - started)
+            if not reclaimed:
+                break
+            for table, count in reclaimed.items():
+                totals[table] += count
+                RECLAIMED.inc(count, table=table)
+            if reclaimed.get("tests", 0) < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if totals["tests"]:
+        logger.info("expired student variants collected", extra=totals)
+    return totals
+
+
+class VariantCollector:
+    def __init__(self, interval: int = VARIANT_GC_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="variant-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                collect()
+            except Exception as e:
+                logger.error("Error collecting expired student variants: %s", e)
+
+
+_collector = VariantCollector()
+
+
+def start_collector():
+    if VARIANT_GC_ENABLED:
+        _collector.start()
+
+
+def stop_collector():
+    _collector.stop()
+
+
+if __name__ == "__main__":
+    from app_logging import setup_logging
+
+    setup_logging()
+    print(collect())
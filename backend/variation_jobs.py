@@ -0,0 +1,295 @@
+import os
+import queue
+import asyncio
+import logging
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, SessionLocal
+import models
+import repository
+from ai import generate_variation_item, variation_item
+from fanout import FANOUT_WIDTH, fan_out
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VARIATION_JOB_WORKERS = int(os.getenv("VARIATION_JOB_WORKERS", "2"))
+VARIATION_JOB_LEASE = int(os.getenv("VARIATION_JOB_LEASE", "600"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+FINISHED = ("done", "failed")
+
+_subscribers: Dict[int, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+_subscribers_lock = threading.Lock()
+
+
+def publish(job_id: int, event: Dict[str, Any]):
+    with _subscribers_lock:
+        targets = list(_subscribers.get(job_id, []))
+    for loop, events in targets:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+
+def _subscribe(job_id: int) -> asyncio.Queue:
+    events: asyncio.Queue = asyncio.Queue()
+    with _subscribers_lock:
+        _subscribers.setdefault(job_id, []).append((asyncio.get_running_loop(), events))
+    return events
+
+
+def _unsubscribe(job_id: int, events: asyncio.Queue):
+    with _subscribers_lock:
+        remaining = [s for s in _subscribers.get(job_id, []) if s[1] is not events]
+        if remaining:
+            _subscribers[job_id] = remaining
+        else:
+            _subscribers.pop(job_id, None)
+
+
+def question_event(position: int, question_id: Optional[int], question: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "question",
+        "position": position,
+        "id": question_id,
+        "text": question.get("text"),
+        "topic": question.get("topic"),
+        "options": [{"text": o.get("text"), "is_correct": o.get("is_correct")} for o in question.get("options", [])],
+    }
+
+
+def progress_event(job: models.VariationJob) -> Dict[str, Any]:
+    return {
+        "type": job.status if job.status in FINISHED else "progress",
+        "job_id": job.id,
+        "new_test_id": job.new_test_id,
+        "completed": job.completed or 0,
+        "total": job.total or 0,
+        "error": job.error,
+    }
+
+
+def claim_job(db, job_id: int, worker: str = WORKER_ID, lease: int = VARIATION_JOB_LEASE) -> bool:
+    """Takes a queued job, or a running one whose worker stopped heartbeating
+    `lease` seconds ago. The UPDATE is the claim, so when several processes
+    resume the same jobs after a restart or deploy only one runs each."""
+    now = datetime.utcnow()
+    VariationJob = models.VariationJob
+    claimed = db.execute(
+        update(VariationJob)
+        .where(
+            VariationJob.id == job_id,
+            or_(
+                VariationJob.status == "queued",
+                and_(
+                    VariationJob.status == "running",
+                    or_(VariationJob.heartbeat_at.is_(None), VariationJob.heartbeat_at < now - timedelta(seconds=lease)),
+                ),
+            ),
+        )
+        .values(status="running", worker=worker, heartbeat_at=now)
+    ).rowcount
+    db.commit()
+    return bool(claimed)
+
+
+def _renew(db, job_id: int, worker: str = WORKER_ID, **values) -> bool:
+    # Every progress write doubles as the heartbeat and checks the job is
+    # still ours; a worker that lost its lease must not append any more.
+    values["heartbeat_at"] = datetime.utcnow()
+    return bool(db.execute(
+        update(models.VariationJob)
+        .where(models.VariationJob.id == job_id, models.VariationJob.worker == worker, models.VariationJob.status == "running")
+        .values(**values)
+    ).rowcount)
+
+
+def _start_job(db, job: models.VariationJob, source: models.Test):
+    if job.new_test_id is None:
+        new_test = models.Test(
+            title=f"{source.title} (Варіація)",
+            description=source.description,
+            user_id=job.user_id or source.user_id,
+            category=source.category,
+            is_template=False,
+            template_id=source.id,
+        )
+        db.add(new_test)
+        db.flush()
+        job.new_test_id = new_test.id
+        job.total = len(source.questions)
+        job.completed = 0
+    db.commit()
+
+
+def run_job(job_id: int, width: Optional[int] = None, worker: str = WORKER_ID):
+    db = SessionLocal()
+    try:
+        if not claim_job(db, job_id, worker):
+            logger.info("Variation job %s is finished or held by another worker", job_id)
+            return
+        job = db.get(models.VariationJob, job_id)
+        source = repository.get_test_tree(db, job.test_id)
+        if source is None:
+            raise ValueError(f"Test {job.test_id} not found")
+        _start_job(db, job, source)
+
+        items = [variation_item(q) for q in source.questions]
+        position = db.execute(
+            select(func.count(models.Question.id)).where(models.Question.test_id == job.new_test_id)
+        ).scalar() or 0
+        width = width or FANOUT_WIDTH
+        for start in range(job.completed or 0, len(items), width):
+            results = fan_out(generate_variation_item, items[start:start + width], width=width, label=f"variation-job-{job_id}")
+            for offset, result in enumerate(results):
+                question = None
+                if result.ok and result.value[1]:
+                    topic_text, parsed = result.value
+                    question = {"text": parsed["question"], "topic": topic_text, "options": parsed["options"]}
+                    question_ids = repository.append_questions(db, job.new_test_id, [question])
+                elif not result.ok:
+                    logger.warning("Failed to generate variation for question #%s of job %s: %s", start + offset + 1, job_id, result.error)
+                if not _renew(db, job_id, worker, completed=start + offset + 1):
+                    db.rollback()
+                    logger.warning("Variation job %s was taken over by another worker", job_id)
+                    return
+                db.commit()
+                if question is not None:
+                    publish(job_id, question_event(position, question_ids[0] if question_ids else None, question))
+                    position += 1
+                publish(job_id, progress_event(job))
+
+        if not _renew(db, job_id, worker, status="done"):
+            db.rollback()
+            logger.warning("Variation job %s was taken over by another worker", job_id)
+            return
+        db.commit()
+        logger.info("Variation job %s finished", job_id, extra={"test_id": job.new_test_id})
+        publish(job_id, progress_event(job))
+    except Exception as e:
+        db.rollback()
+        logger.exception("Variation job %s failed: %s", job_id, e)
+        if _renew(db, job_id, worker, status="failed", error=str(e)[:1000]):
+            db.commit()
+            job = db.get(models.VariationJob, job_id)
+            publish(job_id, progress_event(job))
+    finally:
+        db.close()
+
+
+async def create_job(db: AsyncSession, test: models.Test, user_id: int) -> models.VariationJob:
+    test.is_template = True
+    job = models.VariationJob(test_id=test.id, user_id=user_id, status="queued")
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    _pool.submit(job.id)
+    return job
+
+
+async def job_payload(db: AsyncSession, job: models.VariationJob) -> Dict[str, Any]:
+    payload = {c.name: getattr(job, c.name) for c in models.VariationJob.__table__.columns}
+    payload["test"] = await db.get(models.Test, job.new_test_id) if job.status == "done" and job.new_test_id else None
+    return payload
+
+
+async def stream_events(job_id: int) -> AsyncIterator[Dict[str, Any]]:
+    events = _subscribe(job_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(models.VariationJob, job_id)
+            if job is None:
+                return
+            sent = 0
+            if job.new_test_id is not None:
+                for question in await repository.get_questions_tree_async(db, job.new_test_id):
+                    yield question_event(sent, question.id, {
+                        "text": question.text,
+                        "topic": question.topic,
+                        "options": [{"text": o.text, "is_correct": o.is_correct} for o in question.options],
+                    })
+                    sent += 1
+            yield progress_event(job)
+            if job.status in FINISHED:
+                return
+        while True:
+            event = await events.get()
+            if event["type"] == "question":
+                if event["position"] < sent:
+                    continue
+                sent = event["position"] + 1
+            yield event
+            if event["type"] in FINISHED:
+                return
+    finally:
+        _unsubscribe(job_id, events)
+
+
+class JobWorkerPool:
+    def __init__(self, workers: int = VARIATION_JOB_WORKERS):
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, job_id: int):
+        self._queue.put(job_id)
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"variation-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            run_job(job_id)
+
+
+_pool = JobWorkerPool()
+
+
+def resume_pending() -> int:
+    db = SessionLocal()
+    try:
+        job_ids = db.execute(
+            select(models.VariationJob.id)
+            .where(models.VariationJob.status.in_(("queued", "running")))
+            .order_by(models.VariationJob.id)
+        ).scalars().all()
+    finally:
+        db.close()
+    for job_id in job_ids:
+        _pool.submit(job_id)
+    if job_ids:
+        logger.info("Resuming %s variation jobs", len(job_ids))
+    return len(job_ids)
+
+
+def start_workers():
+    _pool.start()
+    try:
+        resume_pending()
+    except Exception as e:
+        logger.error("Error resuming variation jobs: %s", e)
+
+
+def stop_workers():
+    _pool.stop()
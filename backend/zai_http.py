@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ZAI_API_URL = os.getenv("ZAI_API_URL", "https://api.z.ai/api/paas/v4/chat/completions")
+ZAI_HTTP2 = os.getenv("ZAI_HTTP2", "1") not in ("0", "false", "False")
+ZAI_HTTP_MAX_CONNECTIONS = int(os.getenv("ZAI_HTTP_MAX_CONNECTIONS", "20"))
+ZAI_HTTP_MAX_KEEPALIVE = int(os.getenv("ZAI_HTTP_MAX_KEEPALIVE", "10"))
+ZAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("ZAI_HTTP_KEEPALIVE_EXPIRY", "30"))
+ZAI_HTTP_CONNECT_TIMEOUT = float(os.getenv("ZAI_HTTP_CONNECT_TIMEOUT", "5"))
+ZAI_HTTP_READ_TIMEOUT = float(os.getenv("ZAI_HTTP_READ_TIMEOUT", "60"))
+ZAI_HTTP_POOL_TIMEOUT = float(os.getenv("ZAI_HTTP_POOL_TIMEOUT", "10"))
+
+_client: Optional[httpx.AsyncClient] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=ZAI_HTTP2,
+        limits=httpx.Limits(
+            max_connections=ZAI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=ZAI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=ZAI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=ZAI_HTTP_CONNECT_TIMEOUT,
+            read=ZAI_HTTP_READ_TIMEOUT,
+            write=ZAI_HTTP_CONNECT_TIMEOUT,
+            pool=ZAI_HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def start():
+    global _client, _loop
+    if _client is None:
+        _client = _build_client()
+        _loop = asyncio.get_running_loop()
+
+
+async def stop():
+    global _client, _loop
+    client = _client
+    _client = None
+    _loop = None
+    if client is not None:
+        await client.aclose()
+
+
+def _owned_client() -> Optional[httpx.AsyncClient]:
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return _client if running is _loop else None
+
+
+async def post_chat(payload: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    client = _owned_client()
+    if client is None:
+        async with _build_client() as oneshot:
+            r = await oneshot.post(ZAI_API_URL, json=payload, headers=headers)
+            r.raise_for_status()
+            return r.json()
+    r = await client.post(ZAI_API_URL, json=payload, headers=headers)
+    r.raise_for_status()
+    return r.json()
+
+
+async def _stream_lines(client: httpx.AsyncClient, payload: Dict[str, Any], headers: Dict[str, str]) -> AsyncIterator[Dict[str, Any]]:
+    async with client.stream("POST", ZAI_API_URL, json=payload, headers=headers) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            if data:
+                yield json.loads(data)
+
+
+async def stream_chat(payload: Dict[str, Any], api_key: str) -> AsyncIterator[Dict[str, Any]]:
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    payload = {**payload, "stream": True}
+    client = _owned_client()
+    if client is None:
+        async with _build_client() as oneshot:
+            async for event in _stream_lines(oneshot, payload, headers):
+                yield event
+        return
+    async for event in _stream_lines(client, payload, headers):
+        yield event
+
+
+def post_chat_sync(payload: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    loop = _loop
+    if _client is not None and loop is not None and loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("post_chat_sync called on the event loop thread; await post_chat instead")
+        return asyncio.run_coroutine_threadsafe(post_chat(payload, api_key), loop).result()
+    return asyncio.run(post_chat(payload, api_key))
@@ -10,13 +10,19 @@ export const API_ENDPOINTS = {
 
   TESTS: "/tests",
   GET_TEST: (id: number) => `/tests/${id}`,
+  TEST_DEFINITION: (id: number) => `/tests/${id}/definition`,
+  STREAM_VARIANT: (id: number) => `/tests/${id}/variant/stream`,
   CREATE_TEST: "/tests",
   UPDATE_TEST: (id: number) => `/tests/${id}`,
   DELETE_TEST: (id: number) => `/tests/${id}`,
+  PUBLISH_TEST: (id: number) => `/tests/${id}/publish`,
   GENERATE_VARIATION: (id: number) => `/tests/${id}/generate-variation`,
+  VARIATION_JOB: (id: number) => `/variation-jobs/${id}`,
+  VARIATION_JOB_EVENTS: (id: number) => `/variation-jobs/${id}/events`,
 
   QUESTIONS: "/questions",
   CREATE_QUESTION: "/questions",
+  IMPORT_QUESTIONS: (testId: number) => `/tests/${testId}/questions/import`,
   UPDATE_QUESTION: (id: number) => `/questions/${id}`,
   DELETE_QUESTION: (id: number) => `/questions/${id}`,
 
@@ -4,7 +4,7 @@ import { motion } from "framer-motion"
 import { useNavigate, useSearchParams } from "react-router-dom"
 import { useAuth } from "../context/AuthContext"
 import { useEffect, useState } from "react"
-import { createTest, getTest, createQuestion } from "../utils/api"
+import { createTest, getTestDefinition, createQuestion } from "../utils/api"
 
 interface QuestionForm {
   text: string
@@ -37,7 +37,7 @@ const CreateTest = () => {
     if (editId) {
       setIsEditing(true)
       const fetchTest = async () => {
-        const testData = await getTest(Number.parseInt(editId))
+        const testData = await getTestDefinition(Number.parseInt(editId))
         if (testData) {
           setTitle(testData.title)
           setDescription(testData.description || "")
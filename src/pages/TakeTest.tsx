@@ -3,8 +3,8 @@
 import { motion } from "framer-motion"
 import { useState, useEffect } from "react"
 import { useParams, useNavigate, useSearchParams } from "react-router-dom"
-import { getTest, submitTestResult, deleteTest } from "../utils/api"
-import type { Question, TestWithQuestions } from "../types/index"
+import { getTest, streamTestVariant, submitTestResult, deleteTest } from "../utils/api"
+import type { Question, TestWithQuestions, VariantQuestion } from "../types/index"
 import AIBadge from "../components/AIBadge"
 
 const TakeTest = () => {
@@ -19,6 +19,7 @@ const TakeTest = () => {
   const [originalTestId, setOriginalTestId] = useState<number | null>(null)
   const [test, setTest] = useState<TestWithQuestions | null>(null)
   const [loading, setLoading] = useState(false)
+  const [draftQuestions, setDraftQuestions] = useState<Record<number, VariantQuestion>>({})
   const [error, setError] = useState<string | null>(null)
   const [currentQuestion, setCurrentQuestion] = useState(0)
   const [selectedAnswers, setSelectedAnswers] = useState<number[]>([])
@@ -65,12 +66,16 @@ const TakeTest = () => {
 
     setLoading(true)
     setError(null)
+    setDraftQuestions({})
 
     try {
       const origId = Number.parseInt(testCode)
       setOriginalTestId(origId)
-      
-      const testData = await getTest(origId, true)
+
+      const streamed = await streamTestVariant(origId, (question) => {
+        setDraftQuestions((prev) => ({ ...prev, [question.index]: question }))
+      })
+      const testData = streamed ?? (await getTest(origId, true))
 
       if (testData) {
         console.log("Загруженные данные теста:", {
@@ -244,13 +249,24 @@ const TakeTest = () => {
   }
 
   if (loading) {
+    const drafts = Object.values(draftQuestions).sort((a, b) => a.index - b.index)
     return (
-      <div className="flex items-center justify-center min-h-[60vh]">
+      <div className="flex flex-col items-center justify-center min-h-[60vh] gap-4">
         <motion.div
           className="w-12 h-12 border-4 border-blue-500 border-t-transparent rounded-full"
           animate={{ rotate: 360 }}
           transition={{ duration: 1, repeat: Number.POSITIVE_INFINITY, ease: "linear" }}
         />
+        {drafts.length > 0 && (
+          <div className="max-w-md w-full space-y-2">
+            <p className="text-sm text-gray-400 text-center">Підготовлено питань: {drafts.length}</p>
+            {drafts.map((draft) => (
+              <p key={draft.index} className="text-sm text-gray-300 truncate">
+                {draft.index + 1}. {draft.text}
+              </p>
+            ))}
+          </div>
+        )}
       </div>
     )
   }
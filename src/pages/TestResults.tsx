@@ -3,7 +3,7 @@
 import { motion } from "framer-motion"
 import { useEffect, useState } from "react"
 import { useParams, useNavigate } from "react-router-dom"
-import { getTestResults, getTest } from "../utils/api"
+import { getTestResults, getTestDefinition } from "../utils/api"
 import type { TestResultWithQuestions, TestWithQuestions } from "../types/index"
 
 const TestResults = () => {
@@ -39,7 +39,7 @@ const TestResults = () => {
         let resultsData = null
         
         try {
-          testData = await getTest(Number(testId))
+          testData = await getTestDefinition(Number(testId))
         } catch (testError) {
           console.error('Error fetching test data:', testError)
           setError("Ошибка при загрузке данных теста")
@@ -14,6 +14,26 @@ export interface Test {
   template_id?: number
 }
 
+export interface VariationJob {
+  id: number
+  test_id: number
+  new_test_id?: number
+  status: "queued" | "running" | "done" | "failed"
+  total: number
+  completed: number
+  error?: string
+  created_at: string
+  updated_at?: string
+  test?: Test
+}
+
+export interface VariantQuestion {
+  index: number
+  text: string
+  topic?: string
+  options: { text: string; is_correct: boolean }[]
+}
+
 export interface TestWithQuestions extends Test {
   questions: Question[]
 }
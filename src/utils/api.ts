@@ -1,4 +1,4 @@
-import type { Test, TestWithQuestions, TestResultWithQuestions, TestResult, TestResultCreate } from "../types/index"
+import type { Test, TestWithQuestions, TestResultWithQuestions, TestResult, TestResultCreate, VariationJob, VariantQuestion } from "../types/index"
 import { API_CONFIG, API_ENDPOINTS } from "../config/api"
 
 const API_URL = API_CONFIG.API_URL
@@ -11,8 +11,8 @@ export const fetchWithAuth = async (endpoint: string, options: RequestInit = {})
   const token = getToken()
 
   const headers: Record<string, string> = {
-    ...options.headers as Record<string, string>,
     "Content-Type": "application/json",
+    ...options.headers as Record<string, string>,
   }
 
   if (token) {
@@ -111,13 +111,53 @@ export const getTest = async (testId: number, generateNew = false): Promise<Test
   }
 }
 
-export const generateTestVariation = async (testId: number): Promise<Test | null> => {
+const VARIATION_POLL_INTERVAL = 1000
+
+export const getVariationJob = async (jobId: number): Promise<VariationJob | null> => {
+  try {
+    const response = await fetchWithAuth(API_ENDPOINTS.VARIATION_JOB(jobId))
+    if (response.ok) {
+      return await response.json()
+    }
+    return null
+  } catch (error) {
+    console.error("Error", error)
+    return null
+  }
+}
+
+export const getTestDefinition = async (testId: number): Promise<TestWithQuestions | null> => {
+  try {
+    const response = await fetchWithAuth(API_ENDPOINTS.TEST_DEFINITION(testId))
+    if (response.ok) {
+      return await response.json()
+    }
+    return null
+  } catch (error) {
+    console.error("Error", error)
+    return null
+  }
+}
+
+export const generateTestVariation = async (
+  testId: number,
+  onProgress?: (job: VariationJob) => void,
+): Promise<Test | null> => {
   try {
     const response = await fetchWithAuth(API_ENDPOINTS.GENERATE_VARIATION(testId), {
       method: "POST",
     })
-    if (response.ok) {
-      return await response.json()
+    if (!response.ok) {
+      return null
+    }
+    let job: VariationJob | null = await response.json()
+    while (job && job.status !== "done" && job.status !== "failed") {
+      onProgress?.(job)
+      await new Promise((resolve) => setTimeout(resolve, VARIATION_POLL_INTERVAL))
+      job = await getVariationJob(job.id)
+    }
+    if (job?.status === "done") {
+      return job.test ?? null
     }
     return null
   } catch (error) {
@@ -126,6 +166,41 @@ export const generateTestVariation = async (testId: number): Promise<Test | null
   }
 }
 
+export const streamTestVariant = (
+  testId: number,
+  onQuestion: (question: VariantQuestion) => void,
+): Promise<TestWithQuestions | null> => {
+  return new Promise((resolve) => {
+    const source = new EventSource(`${API_URL}${API_ENDPOINTS.STREAM_VARIANT(testId)}`)
+    const drafts: Record<number, VariantQuestion> = {}
+
+    source.addEventListener("partial_question", (event) => {
+      const data = JSON.parse((event as MessageEvent).data)
+      drafts[data.index] = { index: data.index, text: data.text, options: [] }
+      onQuestion(drafts[data.index])
+    })
+    source.addEventListener("partial_option", (event) => {
+      const data = JSON.parse((event as MessageEvent).data)
+      const draft = drafts[data.index]
+      if (draft) {
+        draft.options = [...draft.options, { text: data.text, is_correct: false }]
+        onQuestion({ ...draft })
+      }
+    })
+    source.addEventListener("question", (event) => {
+      onQuestion(JSON.parse((event as MessageEvent).data))
+    })
+    source.addEventListener("done", (event) => {
+      source.close()
+      resolve(JSON.parse((event as MessageEvent).data))
+    })
+    source.onerror = () => {
+      source.close()
+      resolve(null)
+    }
+  })
+}
+
 export const submitTestResult = async (resultData: TestResultCreate): Promise<TestResult | null> => {
   try {
     const response = await fetchWithAuth(API_ENDPOINTS.CREATE_RESULT, {
@@ -188,3 +263,36 @@ export const deleteTest = async (testId: number): Promise<boolean> => {
   }
 }
 
+export const importQuestions = async (testId: number, file: File): Promise<{ imported: number; question_ids: number[] } | null> => {
+  const contentType = file.name.endsWith(".csv") ? "text/csv" : file.name.endsWith(".ndjson") || file.name.endsWith(".jsonl") ? "application/x-ndjson" : "application/json"
+  try {
+    const response = await fetchWithAuth(API_ENDPOINTS.IMPORT_QUESTIONS(testId), {
+      method: "POST",
+      headers: { "Content-Type": contentType },
+      body: file,
+    })
+    if (response.ok) {
+      return await response.json()
+    }
+    return null
+  } catch (error) {
+    console.error("Error", error)
+    return null
+  }
+}
+
+export const publishTest = async (testId: number): Promise<Test | null> => {
+  try {
+    const response = await fetchWithAuth(API_ENDPOINTS.PUBLISH_TEST(testId), {
+      method: "POST",
+    })
+    if (response.ok) {
+      return await response.json()
+    }
+    return null
+  } catch (error) {
+    console.error("Error", error)
+    return null
+  }
+}
+